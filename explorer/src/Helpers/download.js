@@ -1,3 +1,5 @@
+import { COMMANDS, sendRpcRequest } from "./rpc";
+
 export const downloadString = (filename, string) => {
     const element = document.createElement("a");
     const file = new Blob([string], { type: 'text/plain' });
@@ -6,3 +8,16 @@ export const downloadString = (filename, string) => {
     document.body.appendChild(element);
     element.click();
 }
+
+// blocks reference proofs by digest, the proof itself is fetched only when downloaded
+export const downloadProof = (tx) => {
+    const filename = `proof-${tx.id.slice(0, 12)}.json`;
+
+    if (tx.proof !== "") {
+        downloadString(filename, tx.proof);
+        return Promise.resolve();
+    }
+
+    return sendRpcRequest(COMMANDS.GET_PROOFS, [[tx.proof_digest]])
+        .then((response) => downloadString(filename, response.proofs[0]));
+}
@@ -5,6 +5,7 @@ export const RPC_PORT = 9545;
 export const COMMANDS = {
     GET_LATEST_BLOCK_ID: 'GET_LATEST_BLOCK_ID',
     GET_BLOCK: 'GET_BLOCK',
+    GET_PROOFS: 'GET_PROOFS',
     GET_PENDING_COIN_TXS: 'GET_PENDING_COIN_TXS',
     GET_PENDING_PROOF_TXS: 'GET_PENDING_PROOF_TXS',
     GET_CIRCUITS: 'GET_CIRCUITS',
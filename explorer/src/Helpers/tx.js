@@ -0,0 +1,2 @@
+// single output transactions are encoded without the list of outputs
+export const getOutputs = (tx) => tx.outputs ?? [{ address_to: tx.address_to, amount: tx.amount }];
@@ -5,6 +5,7 @@ import Hash from "../Components/Hash";
 import { COMMANDS, sendRpcRequest } from "../Helpers/rpc";
 import { AlertVariant, Bullseye, Button, ButtonVariant, Label, Spinner, Split, SplitItem, Switch, Title, Tooltip } from "@patternfly/react-core";
 import ErrorState from "../Components/ErrorState";
+import { getOutputs } from "../Helpers/tx";
 import CreateCoinTxModal from "../Modals/CreateCoinTxModal";
 import { AccountContext } from "../App";
 
@@ -140,10 +141,14 @@ const CoinTransactionsTab = ({ addAlert }) => {
                                             <Hash>{tx.address_from}</Hash>
                                         </Td>
                                         <Td dataLabel="Address to">
-                                            <Hash>{tx.address_to}</Hash>
+                                            {getOutputs(tx).map((output, index) => (
+                                                <Hash key={index}>{output.address_to}</Hash>
+                                            ))}
                                         </Td>
                                         <Td dataLabel="Amount">
-                                            {tx.amount}
+                                            {getOutputs(tx).map((output, index) => (
+                                                <div key={index}>{output.amount}</div>
+                                            ))}
                                         </Td>
                                         <Td dataLabel="Status">
                                             {
@@ -6,7 +6,8 @@ import { formatTimestamp } from "../Helpers/date";
 import { COMMANDS, sendRpcRequest } from "../Helpers/rpc";
 import { AlertVariant, Bullseye, Button, Label, Spinner, Split, SplitItem, Tab, TabTitleText, Tabs, Title } from "@patternfly/react-core";
 import ErrorState from "../Components/ErrorState";
-import { downloadString } from "../Helpers/download";
+import { getOutputs } from "../Helpers/tx";
+import { downloadProof } from "../Helpers/download";
 
 const ConfirmedBlocksTab = ({ addAlert }) => {
     const [isLoading, setLoading] = useState(true);
@@ -163,10 +164,14 @@ const ConfirmedBlocksTab = ({ addAlert }) => {
                                                                                 <Hash>{tx.address_from}</Hash>
                                                                             </Td>
                                                                             <Td dataLabel="Address to">
-                                                                                <Hash>{tx.address_to}</Hash>
+                                                                                {getOutputs(tx).map((output, index) => (
+                                                                                    <Hash key={index}>{output.address_to}</Hash>
+                                                                                ))}
                                                                             </Td>
                                                                             <Td dataLabel="Amount">
-                                                                                {tx.amount}
+                                                                                {getOutputs(tx).map((output, index) => (
+                                                                                    <div key={index}>{output.amount}</div>
+                                                                                ))}
                                                                             </Td>
                                                                         </Tr>
                                                                     ))}
@@ -217,7 +222,7 @@ const ConfirmedBlocksTab = ({ addAlert }) => {
                                                                                     variant="link"
                                                                                     style={{ padding: 0, width: "fit-content" }}
                                                                                     icon={<DownloadIcon />}
-                                                                                    onClick={() => downloadString(`proof-${tx.id.slice(0, 12)}.json`, tx.proof)}
+                                                                                    onClick={() => downloadProof(tx).catch(() => addAlert(AlertVariant.danger, "Failed to fetch the proof"))}
                                                                                 >
                                                                                     Download
                                                                                 </Button>
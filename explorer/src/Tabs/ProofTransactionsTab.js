@@ -5,7 +5,7 @@ import Hash from "../Components/Hash";
 import { COMMANDS, sendRpcRequest } from "../Helpers/rpc";
 import { AlertVariant, Bullseye, Button, ButtonVariant, Label, Spinner, Split, SplitItem, Switch, Title } from "@patternfly/react-core";
 import ErrorState from "../Components/ErrorState";
-import { downloadString } from "../Helpers/download";
+import { downloadProof } from "../Helpers/download";
 
 const ProofTransactionsTab = ({ addAlert }) => {
     const [arePendingTxsLoading, setPendingTxsLoading] = useState(true);
@@ -140,7 +140,7 @@ const ProofTransactionsTab = ({ addAlert }) => {
                                                             variant="link"
                                                             style={{ padding: 0, width: "fit-content" }}
                                                             icon={<DownloadIcon />}
-                                                            onClick={() => downloadString(`proof-${tx.id.slice(0, 12)}.json`, tx.proof)}
+                                                            onClick={() => downloadProof(tx).catch(() => addAlert(AlertVariant.danger, "Failed to fetch the proof"))}
                                                         >
                                                             Download
                                                         </Button>
@@ -0,0 +1,165 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import os
+import json
+import threading
+
+from encodeable import Encodeable
+import util
+
+ADDRESS_BOOK_MAX_SIZE = 1000    # entries with the lowest score are dropped above this size
+ADDRESS_BOOK_DEFAULT_RTT = 200  # ms, assumed for addresses which were not measured yet
+ADDRESS_BOOK_SAVE_INTERVAL = 30 # s, how often a changed address book is persisted
+
+class AddressBook(Encodeable):
+    """
+    Every peer address known to the node along with its contact history. When a file path is
+    provided, the address book can be persisted so the node knows good peers right after restart.
+    """
+    __entries: dict             # 'ip:port' -> { 'last_seen', 'successes', 'failures', 'rtt' }
+    __filepath: str
+    __changed: bool             # whether there are changes which were not saved yet
+    __lock: threading.Lock
+
+    def __init__(self, filepath : str = None):
+        self.__entries = {}
+        self.__filepath = filepath
+        self.__changed = False
+        self.__lock = threading.Lock()
+
+    def load(self) -> None:
+        if self.__filepath is None or not os.path.exists(self.__filepath):
+            return
+
+        try:
+            with open(self.__filepath, 'r') as file:
+                self.decode(json.load(file))
+
+            util.vprint(f"Address book: Loaded {len(self.__entries)} addresses from '{self.__filepath}'")
+        except Exception as e:
+            util.wprint(f"Address book: Failed to load '{self.__filepath}', starting with an empty one -", e)
+
+    def save(self) -> None:
+        if self.__filepath is None:
+            return
+
+        try:
+            temp_filepath = self.__filepath + ".tmp"
+
+            # cleared before encoding, so changes made while saving are saved next time
+            self.__changed = False
+
+            with open(temp_filepath, 'w') as file:
+                json.dump(self.encode(), file, indent=2)
+
+            os.replace(temp_filepath, self.__filepath)
+
+            util.vprint(f"Address book: Saved {len(self.__entries)} addresses to '{self.__filepath}'")
+        except Exception as e:
+            self.__changed = True
+            util.wprint(f"Address book: Failed to save '{self.__filepath}' -", e)
+
+    def save_if_changed(self) -> None:
+        if self.__changed:
+            self.save()
+
+    def is_changed(self) -> bool:
+        return self.__changed
+
+    def add(self, peer_str : str) -> None:
+        with self.__lock:
+            if peer_str in self.__entries:
+                return
+
+            self.__entries[peer_str] = { 'last_seen': 0, 'successes': 0, 'failures': 0, 'rtt': None }
+            self.__changed = True
+
+            if len(self.__entries) > ADDRESS_BOOK_MAX_SIZE:
+                worst = min(self.__entries, key=self.__score)
+                del self.__entries[worst]
+
+    def discard(self, peer_str : str) -> None:
+        with self.__lock:
+            if self.__entries.pop(peer_str, None) is not None:
+                self.__changed = True
+
+    def record_success(self, peer_str : str, rtt : float) -> None:
+        with self.__lock:
+            entry = self.__entries.get(peer_str)
+
+            if entry is None:
+                return
+
+            entry['successes'] += 1
+            entry['last_seen'] = util.get_current_time()
+            entry['rtt'] = rtt if entry['rtt'] is None else 0.8 * entry['rtt'] + 0.2 * rtt
+            self.__changed = True
+
+    def record_failure(self, peer_str : str) -> None:
+        with self.__lock:
+            entry = self.__entries.get(peer_str)
+
+            if entry is not None:
+                entry['failures'] += 1
+                self.__changed = True
+
+    def record_seen(self, peer_str : str) -> None:
+        with self.__lock:
+            entry = self.__entries.get(peer_str)
+
+            if entry is not None:
+                entry['last_seen'] = util.get_current_time()
+                self.__changed = True
+
+    def get_entry(self, peer_str : str) -> dict:
+        return self.__entries.get(peer_str)
+
+    def get_addresses(self) -> list[str]:
+        with self.__lock:
+            return list(self.__entries.keys())
+
+    def get_best(self, count : int = None, exclude : set = set()) -> list[str]:
+        """ Return up to count addresses ordered by success rate, latency and recency """
+        with self.__lock:
+            candidates = [peer_str for peer_str in self.__entries if peer_str not in exclude]
+            candidates.sort(key=lambda peer_str: (self.__score(peer_str), self.__entries[peer_str]['last_seen']), reverse=True)
+
+        return candidates if count is None else candidates[:count]
+
+    def __score(self, peer_str : str) -> float:
+        entry = self.__entries[peer_str]
+        attempts = entry['successes'] + entry['failures']
+
+        # unknown addresses are ranked between good and bad ones
+        success_rate = entry['successes'] / attempts if attempts > 0 else 0.5
+        rtt = entry['rtt'] if entry['rtt'] is not None else ADDRESS_BOOK_DEFAULT_RTT
+
+        return success_rate * 100 / (100 + rtt)
+
+    def __contains__(self, peer_str : str) -> bool:
+        return peer_str in self.__entries
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def encode(self) -> dict:
+        with self.__lock:
+            return { peer_str: dict(entry) for peer_str, entry in self.__entries.items() }
+
+    def decode(self, obj : dict) -> None:
+        entries = {}
+
+        for peer_str, entry in obj.items():
+            entries[peer_str] = {
+                'last_seen': int(entry.get('last_seen', 0)),
+                'successes': int(entry.get('successes', 0)),
+                'failures': int(entry.get('failures', 0)),
+                'rtt': entry.get('rtt')
+            }
+
+        with self.__lock:
+            self.__entries = entries
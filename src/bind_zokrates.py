@@ -4,33 +4,208 @@
 # Samuel Olekšák
 # ####################################################################################################
 
-import subprocess
 import re
 import os
 import json
+import shutil
+import tempfile
+import threading
+import itertools
 
+from subprocess_runner import run_process
 import util
 
 ZOKRATES_EXPECTED_VERSION = "0.8.8"
 CIRCUIT_PATH = os.path.join(os.path.dirname(__file__), "circuit/")
+TMPFS_PATH = "/dev/shm"
+CIRCUIT_MANIFEST = "manifest.json" # sidecar file with circuit metadata inside each circuit folder
+ZOKRATES_COMMAND_TIMEOUT = 60       # seconds, for version checks, inspection and verification
+ZOKRATES_PROVING_TIMEOUT = 600      # seconds, for computing a witness and for generating a proof
+
+FIELD_MODULUS = 21888242871839275222246405745257275088548364400416034343698204186575808495617 # scalar field of bn128
+
+# limits of every proving run, can be changed by the 'zokrates_proving_timeout' and 'zokrates_memory_limit' configuration
+process_limits = { 'proving_timeout': ZOKRATES_PROVING_TIMEOUT, 'memory_limit': None }
+
+def get_scratch_root() -> str:
+    """ Prefer memory backed tmpfs for intermediate files, fall back to the system temp folder """
+    if os.path.isdir(TMPFS_PATH) and os.access(TMPFS_PATH, os.W_OK):
+        return TMPFS_PATH
+
+    return None
+
+# path of .zok file -> ((size, mtime), hash) so that rescans do not rehash unchanged circuits
+source_hash_cache : dict[str, tuple] = {}
+
+def get_source_stat(zokrates_filepath : str) -> dict:
+    stat = os.stat(zokrates_filepath)
+
+    return { 'file': os.path.basename(zokrates_filepath), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns }
+
+def read_manifest(circuit_folder : str) -> dict:
+    try:
+        with open(os.path.join(circuit_folder, CIRCUIT_MANIFEST), 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def flatten_abi_type(abi_type : dict) -> list[str]:
+    """ Return primitive types of all values an ABI input takes as arguments, or None for unsupported types """
+    if abi_type['type'] in ['field', 'bool', 'u8', 'u16', 'u32', 'u64']:
+        return [abi_type['type']]
+
+    components = abi_type.get('components')
+
+    if abi_type['type'] == 'array' and components is not None:
+        element_types = flatten_abi_type(components)
+        return element_types * components['size'] if element_types is not None else None
+
+    if abi_type['type'] == 'struct' and components is not None:
+        member_types = [flatten_abi_type(member) for member in components['members']]
+        return sum(member_types, []) if None not in member_types else None
+
+    return None
+
+def validate_parameters(inputs : list[dict], parameters : str) -> None:
+    """
+    Check proof request parameters against the inputs of a circuit ABI before any proving work is done.
+    The last input is the block metadata, which is not part of the parameters. Raises ValueError.
+    Parameters of circuits with unsupported input types are not checked.
+    """
+    if type(parameters) != str:
+        raise ValueError("Parameters must be a string")
+
+    types = [flatten_abi_type(i) for i in inputs[:-1]]
+
+    if None in types:
+        return
+
+    types = sum(types, [])
+    values = parameters.split(" ") if parameters != "" else []
+
+    if len(values) != len(types):
+        raise ValueError(f"Expected {len(types)} parameter(s), got {len(values)}")
+
+    for index, (value, value_type) in enumerate(zip(values, types)):
+        if not value.isdigit():
+            raise ValueError(f"Parameter {index} must be a non-negative decimal integer")
+
+        if value_type == 'field':
+            upper_bound = FIELD_MODULUS
+        elif value_type == 'bool':
+            upper_bound = 2
+        else:
+            upper_bound = 2 ** int(value_type[1:])
+
+        if int(value) >= upper_bound:
+            raise ValueError(f"Parameter {index} is out of range of type {value_type}")
+
+class ProvingBatch:
+    """
+    Setup shared by the parameter sets of a batch proof request: the circuit files are resolved and
+    checked once, and every witness and proof of the batch is written into one scratch folder.
+    """
+    __circuit_folder: str
+    __circuit_filepath: str
+    __abi_filepath: str
+    __proving_key_filepath: str
+    __work_folder: str
+    __counter: itertools.count  # unique file names of the witnesses in the scratch folder
+
+    def __init__(self, circuit_folder : str):
+        self.__circuit_folder = circuit_folder
+        self.__circuit_filepath = os.path.abspath(os.path.join(circuit_folder, "out"))
+        self.__abi_filepath = os.path.abspath(os.path.join(circuit_folder, "abi.json"))
+        self.__proving_key_filepath = os.path.abspath(os.path.join(circuit_folder, "proving.key"))
+
+        for filepath in [self.__circuit_filepath, self.__abi_filepath, self.__proving_key_filepath]:
+            if not os.path.isfile(filepath):
+                raise Exception(f"Circuit {circuit_folder} is missing {os.path.basename(filepath)}")
+
+        self.__work_folder = tempfile.mkdtemp(prefix="zokrates-prove-", dir=get_scratch_root())
+        self.__counter = itertools.count()
+
+    def get_circuit_folder(self) -> str:
+        return self.__circuit_folder
+
+    def get_circuit_filepath(self) -> str:
+        return self.__circuit_filepath
+
+    def get_abi_filepath(self) -> str:
+        return self.__abi_filepath
+
+    def get_proving_key_filepath(self) -> str:
+        return self.__proving_key_filepath
+
+    def get_work_folder(self) -> str:
+        return self.__work_folder
+
+    def get_next_name(self) -> str:
+        return f"witness_{next(self.__counter)}"
+
+    def close(self) -> None:
+        shutil.rmtree(self.__work_folder, ignore_errors=True)
+
+class Witness:
+    """ Witness of a circuit computed into the scratch folder of its batch, deleted once the proof is generated """
+    __batch: ProvingBatch
+    __name: str
+    __owns_batch: bool      # a single proof has a batch of its own, which is closed with the witness
+
+    def __init__(self, batch : ProvingBatch, owns_batch : bool):
+        self.__batch = batch
+        self.__name = batch.get_next_name()
+        self.__owns_batch = owns_batch
+
+    def get_batch(self) -> ProvingBatch:
+        return self.__batch
+
+    def get_circuit_folder(self) -> str:
+        return self.__batch.get_circuit_folder()
+
+    def get_work_folder(self) -> str:
+        return self.__batch.get_work_folder()
+
+    def get_witness_filepath(self) -> str:
+        return os.path.join(self.__batch.get_work_folder(), self.__name)
+
+    def get_circom_witness_filepath(self) -> str:
+        return os.path.join(self.__batch.get_work_folder(), f"{self.__name}.wtns")
+
+    def get_proof_filepath(self) -> str:
+        return os.path.join(self.__batch.get_work_folder(), f"{self.__name}_proof.json")
+
+    def discard(self) -> None:
+        if self.__owns_batch:
+            self.__batch.close()
+            return
+
+        for filepath in [self.get_witness_filepath(), self.get_circom_witness_filepath(), self.get_proof_filepath()]:
+            try:
+                os.remove(filepath)
+            except FileNotFoundError:
+                pass
 
 class Zokrates:
     @staticmethod
-    def prepare_circuits() -> dict:
-        util.vprint("Circuits: Detecting circuits...")
+    def prepare_circuits(log : bool = True) -> dict:
+        if log: util.vprint("Circuits: Detecting circuits...")
 
         result = {}
 
         for directory in os.listdir(CIRCUIT_PATH):
             subfolder = os.path.join(CIRCUIT_PATH, directory)
 
+            if not os.path.isdir(subfolder):
+                continue
+
             zokrates_files = util.find_files_with_extension(subfolder, ".zok")
 
             if len(zokrates_files) == 0:
-                util.wprint(f"Circuits: Expected to find a single Zokrates (.zok) file in subfolder {directory}, but found zero, ignoring directory")
+                if log: util.wprint(f"Circuits: Expected to find a single Zokrates (.zok) file in subfolder {directory}, but found zero, ignoring directory")
                 continue
             elif len(zokrates_files) > 1:
-                util.wprint(f"Circuits: Expected to find a single Zokrates (.zok) file in subfolder {directory}, but found multiple, ignoring directory")
+                if log: util.wprint(f"Circuits: Expected to find a single Zokrates (.zok) file in subfolder {directory}, but found multiple, ignoring directory")
                 continue
 
             zokrates_filepath = os.path.join(subfolder, zokrates_files[0])
@@ -45,27 +220,98 @@ class Zokrates:
                 assert os.path.exists(verification_key_filepath), "verification key"
                 assert os.path.exists(abi_filepath), "ABI"
             except AssertionError as e:
-                util.wprint(f"Circuits: Expected to find {e} file in subfolder {directory}, ignoring directory")
+                if log: util.wprint(f"Circuits: Expected to find {e} file in subfolder {directory}, ignoring directory")
+                continue
 
-            file_hash : str = util.get_file_hash(zokrates_filepath)
+            file_hash : str = Zokrates.get_source_hash(zokrates_filepath)
 
-            util.vprint(f"Circuits: Registered circuit from '{subfolder}' under hash '{file_hash}'")
+            if log: util.vprint(f"Circuits: Registered circuit from '{subfolder}' under hash '{file_hash}'")
 
             result[file_hash] = subfolder
 
         return result
 
     @staticmethod
-    def check_version() -> None:
+    def get_source_hash(zokrates_filepath : str) -> str:
+        """
+        Return SHA256 hash of a .zok file. The file is only rehashed when its size or modification
+        time differs from the in-memory cache or from the circuit manifest of a previous run.
+        """
+        source = get_source_stat(zokrates_filepath)
+        key = (source['size'], source['mtime_ns'])
+
+        cached = source_hash_cache.get(zokrates_filepath)
+
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        manifest = read_manifest(os.path.dirname(zokrates_filepath))
+
+        if manifest is not None and manifest.get('source') == source and 'circuit_hash' in manifest:
+            file_hash = manifest['circuit_hash']
+        else:
+            file_hash = util.get_file_hash(zokrates_filepath)
+
+        source_hash_cache[zokrates_filepath] = (key, file_hash)
+
+        return file_hash
+
+    @staticmethod
+    def get_circuit_metadata(circuit_folder : str, circuit_hash : str, get_constraint_count = None) -> dict:
+        """
+        Return constraint count, ABI summary and key hashes of a circuit. They are computed once and
+        stored in a sidecar manifest, which is reused while it belongs to the same circuit hash.
+        The constraint count comes from get_constraint_count of the prover backend, 'zokrates inspect' by default.
+        """
+        metadata = read_manifest(circuit_folder)
+
+        if metadata is not None and metadata.get('circuit_hash') == circuit_hash and metadata.get('constraint_count') is not None:
+            return metadata
+
+        with open(os.path.join(circuit_folder, "abi.json"), 'r') as file:
+            abi = json.load(file)
+
         try:
-            process = subprocess.Popen(['zokrates', '--version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            constraint_count = (get_constraint_count or Zokrates.get_constraint_count)(circuit_folder)
+        except Exception as e:
+            util.wprint(f"Circuits: Failed to determine constraint count of circuit '{circuit_hash}' -", e)
+            constraint_count = None
+
+        zokrates_files = util.find_files_with_extension(circuit_folder, ".zok")
+
+        metadata = {
+            'circuit_hash': circuit_hash,
+            'source': get_source_stat(os.path.join(circuit_folder, zokrates_files[0])) if len(zokrates_files) == 1 else None,
+            'constraint_count': constraint_count,
+            'inputs': [{ 'name': i['name'], 'type': i['type'], 'public': i.get('public', False), **({ 'components': i['components'] } if 'components' in i else {}) } for i in abi['inputs']],
+            'output': abi.get('output'),
+            'proving_key_hash': util.get_file_hash(os.path.join(circuit_folder, "proving.key")),
+            'verification_key_hash': util.get_file_hash(os.path.join(circuit_folder, "verification.key"))
+        }
+
+        # written even without constraint count (e.g. Zokrates missing) to keep the source hash, the count is retried next time
+        try:
+            with open(os.path.join(circuit_folder, CIRCUIT_MANIFEST), 'w') as file:
+                json.dump(metadata, file, indent=2)
+        except OSError as e:
+            util.wprint(f"Circuits: Failed to write manifest for circuit '{circuit_hash}' -", e)
+
+        return metadata
 
-            return_code = process.wait()
-            stdout, stderr = process.communicate()
+    @staticmethod
+    def set_limits(proving_timeout : float = None, memory_limit : int = None) -> None:
+        """ Set proving timeout in seconds and memory limit of ZoKrates in bytes """
+        process_limits['proving_timeout'] = proving_timeout if proving_timeout is not None else ZOKRATES_PROVING_TIMEOUT
+        process_limits['memory_limit'] = memory_limit
 
-            if return_code == 0:
+    @staticmethod
+    def check_version() -> None:
+        try:
+            process_result = run_process(['zokrates', '--version'], timeout=ZOKRATES_COMMAND_TIMEOUT)
+
+            if process_result.is_success():
                 pattern = r'\d+\.\d+\.\d+'
-                result = re.findall(pattern, stdout.decode())[0]
+                result = re.findall(pattern, process_result.get_stdout().decode())[0]
 
                 major, minor, patch = [int(n) for n in result.split('.')]
                 exp_major, exp_minor, exp_patch = [int(n) for n in ZOKRATES_EXPECTED_VERSION.split('.')]
@@ -85,13 +331,10 @@ class Zokrates:
         """
         circuit_filepath = os.path.join(circuit_folder, "out")
 
-        process = subprocess.Popen(['zokrates', 'inspect', '-i', circuit_filepath], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-        return_code = process.wait()
-        stdout, stderr = process.communicate()
+        result = run_process(['zokrates', 'inspect', '-i', circuit_filepath], timeout=ZOKRATES_COMMAND_TIMEOUT)
 
-        if return_code == 0:
-            match = re.search(r'constraint_count:\s*(\d+)', stdout.decode())
+        if result.is_success():
+            match = re.search(r'constraint_count:\s*(\d+)', result.get_stdout().decode())
             constraint_count = int(match.group(1))
 
             return constraint_count
@@ -99,66 +342,79 @@ class Zokrates:
             raise Exception("Failed to extract constraint count from", circuit_folder)
 
     @staticmethod
-    def verify_proof(block_metadata : str, circuit_folder : str, proof : str, parameters : str) -> bool:
-        #   1. Write proof to a temp file
-        temp_file = os.path.join(circuit_folder, 'temp')
-
+    def verify_proof(block_metadata : str, circuit_folder : str, proof : str, parameters : str, cancel_event : threading.Event = None) -> bool:
         proof_json = json.loads(proof)
 
         # check the block metadata integrity
         assert int(proof_json['inputs'][-2], 0) == int(block_metadata)
 
-        with open(temp_file, 'w') as file:
-            file.write(proof)
+        # every verification gets its own scratch folder, so concurrent jobs on one circuit do not collide
+        with tempfile.TemporaryDirectory(prefix="zokrates-verify-", dir=get_scratch_root()) as work_folder:
+            #   1. Write proof to a temp file
+            temp_file = os.path.join(work_folder, 'proof.json')
 
-        #   2. Verify proof
-        process = subprocess.Popen(['zokrates', 'verify', '-j', temp_file, '-v', os.path.join(circuit_folder, 'verification.key')], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            with open(temp_file, 'w') as file:
+                file.write(proof)
 
-        return_code = process.wait()
-        stdout, stderr = process.communicate()
+            #   2. Verify proof
+            result = run_process(['zokrates', 'verify', '-j', temp_file, '-v', os.path.join(circuit_folder, 'verification.key')], cwd=work_folder, timeout=ZOKRATES_COMMAND_TIMEOUT, cancel_event=cancel_event)
 
-        #   3. Delete temp proof file
-        if os.path.exists(temp_file):
-            os.remove(temp_file)
+        if result.is_timed_out() or result.is_cancelled():
+            raise Exception(f"Verification of a proof for circuit {circuit_folder} {'timed out' if result.is_timed_out() else 'was cancelled'}")
 
-        #   4. Return result
-        return return_code == 0
+        #   3. Return result, the temp folder is deleted even if verification raised
+        return result.get_return_code() == 0
 
     @staticmethod
-    def generate_proof(block_metadata : str, circuit_folder : str, parameters : str) -> str:
-        circuit_filepath = os.path.join(circuit_folder, "out")
-        abi_filepath = os.path.join(circuit_folder, "abi.json")
-        proving_key_filepath = os.path.join(circuit_folder, "proving.key")
-        witness_filepath = os.path.join(circuit_folder, "witness")
-        circom_witness_filepath = os.path.join(circuit_folder, "out.wtns")
-        proof_filepath = os.path.join(circuit_folder, "proof.json")
-
-        process = subprocess.Popen(['zokrates', 'compute-witness', '-i', circuit_filepath, '-s', abi_filepath, '-o', witness_filepath, '--circom-witness', circom_witness_filepath, '-a', *parameters.split(" "), block_metadata], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    def generate_proof(block_metadata : str, circuit_folder : str, parameters : str, cancel_event : threading.Event = None) -> str:
+        """
+        Compute witness and generate proof, raises an Exception if either step fails, runs longer than
+        the proving timeout or is cancelled through cancel_event
+        """
+        witness = Zokrates.compute_witness(block_metadata, circuit_folder, parameters, cancel_event)
 
-        return_code = process.wait()
+        return Zokrates.prove_witness(witness, cancel_event)
 
-        if return_code != 0:
-            raise Exception(f"Failed to compute witness for circuit {circuit_folder}")
+    @staticmethod
+    def compute_witness(block_metadata : str, circuit_folder : str, parameters : str, cancel_event : threading.Event = None, batch : ProvingBatch = None) -> Witness:
+        """
+        Compute witness of a parameter set, into the scratch folder of the batch if it is a part of one.
+        ZoKrates computes a single witness per process, so a batch still runs one process per parameter set.
+        """
+        # every proof without a batch gets its own scratch folder, so concurrent jobs on one circuit do not collide
+        witness = Witness(batch, False) if batch is not None else Witness(ProvingBatch(circuit_folder), True)
+        batch = witness.get_batch()
 
-        process = subprocess.Popen(['zokrates', 'generate-proof', '-i', circuit_filepath, '-p', proving_key_filepath, '-w', witness_filepath, '-j', proof_filepath], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            result = run_process(['zokrates', 'compute-witness', '-i', batch.get_circuit_filepath(), '-s', batch.get_abi_filepath(), '-o', witness.get_witness_filepath(), '--circom-witness', witness.get_circom_witness_filepath(), '-a', *parameters.split(" "), block_metadata], cwd=batch.get_work_folder(), timeout=process_limits['proving_timeout'], memory_limit=process_limits['memory_limit'], cancel_event=cancel_event)
 
-        return_code = process.wait()
+            if not result.is_success():
+                raise Exception(f"Failed to compute witness for circuit {circuit_folder} - {result}")
+        except:
+            witness.discard()
+            raise
 
-        if return_code != 0:
-            raise Exception(f"Failed to generate proof for circuit {circuit_folder}")
+        util.vprint(f"Proving: Witness for circuit {os.path.basename(os.path.normpath(circuit_folder))} computed in {result.get_duration():.0f} ms")
 
-        proof = None
+        return witness
 
-        with open(proof_filepath, "r") as proof_file:
-            proof = proof_file.read()
+    @staticmethod
+    def prepare_batch(circuit_folder : str) -> ProvingBatch:
+        """ Setup shared by the parameter sets of a batch, to be closed once all of them are proven or discarded """
+        return ProvingBatch(circuit_folder)
 
-        if os.path.exists(witness_filepath):
-            os.remove(witness_filepath)
+    @staticmethod
+    def prove_witness(witness : Witness, cancel_event : threading.Event = None) -> str:
+        """ Generate proof from a computed witness, the witness is discarded afterwards """
+        batch = witness.get_batch()
 
-        if os.path.exists(circom_witness_filepath):
-            os.remove(circom_witness_filepath)
+        try:
+            result = run_process(['zokrates', 'generate-proof', '-i', batch.get_circuit_filepath(), '-p', batch.get_proving_key_filepath(), '-w', witness.get_witness_filepath(), '-j', witness.get_proof_filepath()], cwd=batch.get_work_folder(), timeout=process_limits['proving_timeout'], memory_limit=process_limits['memory_limit'], cancel_event=cancel_event)
 
-        if os.path.exists(proof_filepath):
-            os.remove(proof_filepath)
+            if not result.is_success():
+                raise Exception(f"Failed to generate proof for circuit {witness.get_circuit_folder()} - {result}")
 
-        return proof
+            with open(witness.get_proof_filepath(), "r") as proof_file:
+                return proof_file.read()
+        finally:
+            witness.discard()
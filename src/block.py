@@ -19,10 +19,10 @@ class Block(Encodeable):
         self.__header = header
         self.__body = body
 
-    def encode(self):
+    def encode(self, include_proofs : bool = True):
         return {
             'header': self.__header.encode(),
-            'body': self.__body.encode()
+            'body': self.__body.encode(include_proofs)
         }
 
     def decode(self, obj):
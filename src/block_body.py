@@ -43,10 +43,11 @@ class BlockBody(Encodeable):
     def hash_state_tree(self):
         return self.__state_tree.get_hash()
 
-    def encode(self):
+    def encode(self, include_proofs : bool = True):
+        """ Without proofs, proof transactions only reference their proofs by digest """
         return {
             'coin_txs': [tx.encode() for tx in self.__coin_txs],
-            'proof_txs': [tx.encode() for tx in self.__proof_txs],
+            'proof_txs': [tx.encode(include_proofs) for tx in self.__proof_txs],
             'state_tree': self.__state_tree.encode()
         }
 
@@ -0,0 +1,66 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import threading
+from collections import OrderedDict
+
+from block import Block
+from wire_codec import PreEncoded
+
+BLOCK_CACHE_SIZE = 256  # encoded blocks kept in memory
+
+class EncodedBlockCache:
+    """
+    Bounded LRU cache of encodings of accepted blocks. Blocks never change once they are in the chain, so
+    a block served repeatedly, e.g. to syncing peers or to the explorer, is encoded and serialized once.
+    Entries are keyed by block hash, so a different block with the same id is never served from the cache.
+    """
+    __entries: OrderedDict      # (block hash, include proofs) -> PreEncoded
+    __max_size: int
+    __hits: int
+    __misses: int
+    __lock: threading.Lock
+
+    def __init__(self, max_size : int = BLOCK_CACHE_SIZE):
+        self.__entries = OrderedDict()
+        self.__max_size = max_size
+        self.__hits = 0
+        self.__misses = 0
+        self.__lock = threading.Lock()
+
+    def get(self, block : Block, include_proofs : bool = True) -> PreEncoded:
+        """ Encoding of the block, its serialized forms are cached along on first use """
+        key = (block.get_current_block_hash(), include_proofs)
+
+        with self.__lock:
+            if key in self.__entries:
+                self.__hits += 1
+                self.__entries.move_to_end(key)
+
+                return self.__entries[key]
+
+            self.__misses += 1
+
+        # encoded outside of the lock, a block requested concurrently is at worst encoded twice
+        encoded_block = PreEncoded(block.encode(include_proofs))
+
+        with self.__lock:
+            self.__entries[key] = encoded_block
+            self.__entries.move_to_end(key)
+
+            while len(self.__entries) > self.__max_size:
+                self.__entries.popitem(last=False)
+
+        return encoded_block
+
+    def get_hits(self) -> int:
+        return self.__hits
+
+    def get_misses(self) -> int:
+        return self.__misses
+
+    def __len__(self) -> int:
+        return len(self.__entries)
@@ -119,3 +119,12 @@ class BlockHeader(Encodeable):
 
     def get_miner(self):
         return self.__miner
+
+    def get_coin_txs_hash(self):
+        return self.__coin_txs_hash
+
+    def get_proof_txs_hash(self):
+        return self.__proof_txs_hash
+
+    def get_state_root_hash(self):
+        return self.__state_root_hash
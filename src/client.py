@@ -5,11 +5,14 @@
 # ####################################################################################################
 
 import socket
+import atexit
+import signal
 import threading
 import getopt
 import sys
 import ecdsa
 import json
+import base64
 import traceback
 import time
 import os
@@ -21,15 +24,22 @@ from prompt_toolkit.history import InMemoryHistory
 import util
 import network
 import rpc_interface
+import wire_codec
 from block import Block
+from compact_block import CompactBlock
+from address_book import ADDRESS_BOOK_SAVE_INTERVAL
 from block_body import BlockBody
 from block_header import BlockHeader
 from coin_tx import CoinTransaction
-from proof_tx import ProofTransaction
+from proof_tx import ProofTransaction, BATCH_SEPARATOR
+from proof_store import get_proof_digest, PROOF_REQUEST_SIZE
 from bind_zokrates import Zokrates
-from peer import Peer
+from proving import ProvingExecutor, schedule_proofs, get_worker_count
+from remote_proving import ProverCoordinator, ProverWorker, RemoteBackend
+import groth16
+import prover_backend
 
-USAGE = 'Usage: python client.py [-k|--key <private key file>] [-v|--verbose] [-h|--help] [-p|--port <port number>] [-c|--command <command>] [-f|--config <config file>] [-n|--no-color] [-r|--rpc <port number>]'
+USAGE = 'Usage: python client.py [-k|--key <private key file>] [-v|--verbose] [-h|--help] [-p|--port <port number>] [-c|--command <command>] [-f|--config <config file>] [-n|--no-color] [-r|--rpc <port number>] [-w|--worker <coordinator address>]'
 USAGE_ARGUMENTS = """
     -k, --key <private key file>   Authenticate using an existing private key file
     -v, --verbose                  Show more detailed log messages
@@ -39,10 +49,12 @@ USAGE_ARGUMENTS = """
     -f, --config <config file>     Provide a non-default configuration file
     -n, --no-color                 Don't print colored text into the terminal
     -r, --rpc <port number>        Start RPC server
+    -w, --worker <ip:port>         Run as a prover worker of the coordinator at <ip:port> instead of a node
 """
 
 server_running = True
 private_key = None
+proving_executor = None
 
 def start_blockchain_sync():
     util.vprint("Synchronization: Looking for peers")
@@ -51,27 +63,32 @@ def start_blockchain_sync():
 
     util.vprint("Synchronization: Searching for the longest chain")
 
-    for peer in network.peers:
+    for peer in network.get_available_peers():
         network.send_message(peer.to_tuple(), util.Command.GET_LATEST_BLOCK_ID)
 
     time.sleep(0.3)
 
-    best_peer = None
-    best_peer_latest_block_id = 0
+    # prefer the longest chain, among equally long chains prefer the best scoring peer
+    candidates = [peer for peer in network.get_peers_by_score() if peer.get_latest_block_id() > network.blockchain[-1].get_id()]
+    candidates.sort(key=lambda peer: peer.get_latest_block_id(), reverse=True)
 
-    for peer in network.peers:
-        if peer.get_latest_block_id() > network.blockchain[-1].get_id():
-            best_peer = peer
-            best_peer_latest_block_id = peer.get_latest_block_id()
-
-    if best_peer is None:
+    if len(candidates) == 0:
         util.vprint("Synchronization: Did not find a fresher peer")
     else:
-        util.vprint(f"Synchronization: Determined freshest peer: {best_peer.to_string()}")
+        best_peer_latest_block_id = candidates[0].get_latest_block_id()
+
+        util.vprint(f"Synchronization: Determined freshest peer: {candidates[0].to_string()}")
         util.vprint("Synchronization: Downloading blocks")
 
         for block_id in range(network.blockchain[-1].get_id() + 1, best_peer_latest_block_id + 1):
-            network.send_message(best_peer.to_tuple(), util.Command.GET_BLOCK, { 'block_id': block_id })
+            # fall back to the next best peer which has the block if the preferred one stopped responding
+            block_peers = [peer for peer in candidates if peer.is_available() and peer.get_latest_block_id() >= block_id]
+
+            if len(block_peers) == 0:
+                util.vprint(f"Synchronization: No available peer has block {block_id}")
+                break
+
+            network.send_message(block_peers[0].to_tuple(), util.Command.GET_BLOCK, { 'block_id': block_id })
             time.sleep(0.2)
 
 def start_pending_tx_sync():
@@ -79,10 +96,39 @@ def start_pending_tx_sync():
 
     time.sleep(0.3)
 
-    for peer in network.peers:
+    for peer in network.get_available_peers():
         network.send_message(peer.to_tuple(), util.Command.GET_PENDING_COIN_TXS)
         network.send_message(peer.to_tuple(), util.Command.GET_PENDING_PROOF_TXS)
 
+def start_circuit_rescan():
+    interval = network.config.get('circuit_rescan_interval', network.CIRCUIT_RESCAN_INTERVAL)
+
+    while server_running and interval > 0:
+        time.sleep(interval)
+
+        try:
+            network.rescan_circuits()
+        except Exception as e:
+            util.vprint("Circuits: Failed to rescan circuits -", e)
+
+def start_proof_request_retries():
+    """ Ask other peers for proofs of received blocks whose sender did not send them in time """
+    while server_running:
+        time.sleep(network.PROOF_REQUEST_TIMEOUT / 1000 / 2)
+
+        try:
+            network.retry_proof_requests()
+        except Exception as e:
+            util.vprint("Synchronization: Failed to retry proof requests -", e)
+
+def start_address_book_saving():
+    """ Persist the address book while running, so peers learned in the session survive a crash """
+    interval = network.config.get('address_book_save_interval', ADDRESS_BOOK_SAVE_INTERVAL)
+
+    while server_running and interval > 0:
+        time.sleep(interval)
+        network.address_book.save_if_changed()
+
 def verify_block(new_block : Block) -> bool:
     previous_block = network.blockchain[-1]
 
@@ -136,16 +182,16 @@ def verify_block(new_block : Block) -> bool:
 
         st.apply_proof_tx(tx, network.config['proof_tx_fee'], miner_address)
 
-        circuit_folder = network.circuits[tx.get_circuit_hash().hex()]
-        if not tx.validate(metadata_integrity, circuit_folder):
-            util.vprint(f"Failed to verify a proof")
-            return False
-
     # compare state trees and block hashes
     if st.get_hash().hex() != new_block.get_state_tree().get_hash().hex():
         util.vprint(f"Invalid state tree hash")
         return False
 
+    # verify all proofs concurrently once the cheap checks have passed
+    if not proving_executor.verify_all(new_block.get_body().get_proof_txs(), metadata_integrity, network.circuits):
+        util.vprint(f"Failed to verify a proof")
+        return False
+
     util.vprint(f"Received block is OK")
 
     # Remove newly confirmed transactions from the pending pool
@@ -158,6 +204,88 @@ def verify_block(new_block : Block) -> bool:
 
     return True
 
+def accept_compact_block(compact_block : CompactBlock, sender_address : tuple) -> None:
+    if compact_block.get_id() != network.blockchain[-1].get_id() + 1:
+        util.vprint(f"Received out of order compact block with id {compact_block.get_id()}")
+        return
+
+    try:
+        new_block = compact_block.to_block(network.blockchain[-1].get_state_tree(), network.config['coin_tx_fee'], network.config['proof_tx_fee'])
+    except ValueError as e:
+        # e.g. short id collision in the mempool, fall back to downloading the full block
+        util.vprint(f"Failed to reconstruct compact block ({e}), requesting full block")
+        network.send_message(sender_address, util.Command.GET_BLOCK, { 'block_id': compact_block.get_id() })
+        return
+
+    receive_block(new_block, sender_address, True)
+
+def receive_block(new_block : Block, sender_address : tuple, relay : bool) -> None:
+    """
+    Verify and append a received block once all of its proofs are available, missing proofs are
+    requested from the sender. Blocks are accepted in order, so a block waits for earlier blocks.
+    """
+    missing_digests = network.proof_store.attach_proofs(new_block.get_body().get_proof_txs())
+
+    with network.blocks_awaiting_proofs_lock:
+        earlier_block_awaited = any(awaited_block.get_block().get_id() < new_block.get_id() for awaited_block in network.blocks_awaiting_proofs.values())
+        awaited = len(missing_digests) > 0 or earlier_block_awaited
+        kept = awaited and network.add_block_awaiting_proofs(new_block, sender_address, relay)
+
+    if not awaited:
+        accept_block(new_block, sender_address, relay)
+        return
+
+    if not kept:
+        util.vprint(f"Block {new_block.get_id()} is not awaited, it is too far above the chain tip or too many blocks are awaited")
+        return
+
+    if len(missing_digests) > 0:
+        util.vprint(f"Block {new_block.get_id()} is missing {len(missing_digests)} proof(s), requesting them")
+        network.request_proofs(missing_digests, sender_address)
+
+    # the requested proofs might have arrived already
+    accept_blocks_awaiting_proofs()
+
+def accept_blocks_awaiting_proofs() -> None:
+    """ Accept the next awaited blocks whose proofs are all available """
+    while True:
+        with network.blocks_awaiting_proofs_lock:
+            latest_block_id = network.blockchain[-1].get_id()
+
+            for block_hash, awaited_block in list(network.blocks_awaiting_proofs.items()):
+                if awaited_block.get_block().get_id() <= latest_block_id:
+                    del network.blocks_awaiting_proofs[block_hash]
+
+            ready_block_hash = None
+
+            for block_hash, awaited_block in network.blocks_awaiting_proofs.items():
+                block = awaited_block.get_block()
+
+                if block.get_id() == latest_block_id + 1 and len(network.proof_store.attach_proofs(block.get_body().get_proof_txs())) == 0:
+                    ready_block_hash = block_hash
+                    break
+
+            if ready_block_hash is None:
+                return
+
+            awaited_block = network.blocks_awaiting_proofs.pop(ready_block_hash)
+
+        accept_block(awaited_block.get_block(), awaited_block.get_sender_address(), awaited_block.is_relayed())
+
+def accept_block(new_block : Block, sender_address : tuple, relay : bool) -> None:
+    if not verify_block(new_block):
+        util.vprint("Failed to verify block")
+        return
+
+    if relay:
+        util.vprint(f"Accepted block with id {new_block.get_id()}")
+
+        # appends the block to the chain and relays it
+        network.broadcast_block(new_block, f"{sender_address[0]}:{sender_address[1]}")
+    else:
+        network.append_block(new_block)
+        util.vprint("Received valid block")
+
 def receive_incoming(client_socket, client_address):
     data = []
 
@@ -173,30 +301,32 @@ def receive_incoming(client_socket, client_address):
     message = None
 
     try:
-        message = json.loads(data.decode())
+        data, compression_dictionary = wire_codec.decompress_message(data)
+        message, wire_version = wire_codec.decode_message(data)
     except:
-        util.vprint(f"Received a message not in JSON format")
+        util.vprint(f"Received a message in an unknown format")
         return
 
     sender = f"{client_address[0]}:{message['port']}"
+    sender_address = (client_address[0], message['port'])
 
     util.vprint(f"Received from {sender}:", json.dumps(message, indent=2))
 
+    sender_peer = network.get_peer(sender_address)
+
     # Disregard reply messages if coming from non-peers
-    if message['command'] in [util.Command.PEERS, util.Command.LATEST_BLOCK_ID, util.Command.BLOCK, util.Command.PENDING_COIN_TXS, util.Command.PENDING_PROOF_TXS] and sender not in [peer.to_string() for peer in network.peers]:
+    if message['command'] in [util.Command.PEERS, util.Command.LATEST_BLOCK_ID, util.Command.BLOCK, util.Command.BLOCK_TXS, util.Command.PROOFS, util.Command.PENDING_COIN_TXS, util.Command.PENDING_PROOF_TXS] and sender_peer is None:
         util.vprint(f"Received reply message from {sender} which is not a peer")
         return
 
-    if sender not in [p.to_string() for p in network.peers]:
-        new_peer = Peer()
-        new_peer.setup_from_string(sender)
-        network.peers.append(new_peer)
+    if sender_peer is None:
+        sender_peer = network.add_peer(sender_address)
+        network.address_book.add(sender)
 
-        sender_peer = new_peer
-    else:
-        for peer in network.peers:
-            if peer.to_string() == sender:
-                sender_peer = peer
+    # the sender has just contacted us, so it is alive
+    sender_peer.mark_seen()
+    network.negotiate_wire_format(sender_peer, message, wire_version, compression_dictionary)
+    network.address_book.record_seen(sender)
 
     # Disregard messages which don't have command and peer fields
     if 'command' not in message or 'port' not in message:
@@ -205,7 +335,7 @@ def receive_incoming(client_socket, client_address):
 
     if message['command'] == util.Command.GET_PEERS:
         util.vprint("Sending peers")
-        network.send_message((client_address[0], message['port']), util.Command.PEERS, { 'peers': [peer.to_string() for peer in network.peers] + [f'{network.self_ip_address}:{network.port}'] })
+        network.send_message((client_address[0], message['port']), util.Command.PEERS, { 'peers': [peer.to_string() for peer in network.get_peer_list()] + [f'{network.self_ip_address}:{network.port}'] })
 
     elif message['command'] == util.Command.PEERS:
         network.accept_peers(message['peers'])
@@ -221,7 +351,10 @@ def receive_incoming(client_socket, client_address):
 
         util.vprint(f"Sending block {message['block_id']}")
 
-        network.send_message((client_address[0], message['port']), util.Command.BLOCK, { 'block': network.blockchain[message['block_id']].encode() })
+        # proofs are fetched separately by nodes which verify them, unless requested along
+        include_proofs = message.get('include_proofs', False) is True
+
+        network.send_message((client_address[0], message['port']), util.Command.BLOCK, { 'block': network.get_encoded_block(message['block_id'], include_proofs) })
 
     elif message['command'] == util.Command.PENDING_COIN_TXS:
         network.receive_pending_coin_transactions(message['pending_txs'], sender)
@@ -243,57 +376,98 @@ def receive_incoming(client_socket, client_address):
         received_block = Block()
         received_block.decode(message['block'])
 
-        if not verify_block(received_block):
-            util.vprint("Failed to verify block")
-            return
-
-        network.blockchain.append(received_block)
-        util.vprint("Received valid block")
+        receive_block(received_block, sender_address, False)
 
     elif message['command'] == util.Command.BROADCAST_BLOCK:
         new_block = Block()
 
         new_block.decode(message['block'])
 
-        if not verify_block(new_block):
-            util.vprint("Failed to verify block")
+        receive_block(new_block, sender_address, True)
+
+    elif message['command'] == util.Command.BROADCAST_COMPACT_BLOCK:
+        compact_block = CompactBlock()
+        compact_block.decode(message['compact_block'])
+
+        if compact_block.get_id() <= network.blockchain[-1].get_id():
+            util.vprint(f"Received already known compact block with id {compact_block.get_id()}")
             return
 
-        util.vprint(f"Accepted block with id {new_block.get_id()}")
+        compact_block.reconstruct(network.pending_coin_transactions, network.pending_proof_transactions)
+
+        if compact_block.is_complete():
+            accept_compact_block(compact_block, sender_address)
+        else:
+            missing_coin_txs = compact_block.get_missing_coin_txs()
+            missing_proof_txs = compact_block.get_missing_proof_txs()
 
-        network.blockchain.append(new_block)
+            util.vprint(f"Compact block {compact_block.get_id()} is missing {len(missing_coin_txs)} coin and {len(missing_proof_txs)} proof transaction(s), requesting them")
 
-        network.broadcast_block(new_block, sender)
+            network.add_pending_compact_block(compact_block)
+            network.send_message(sender_address, util.Command.GET_BLOCK_TXS, { 'block_hash': compact_block.get_current_block_hash().hex(), 'coin_tx_indexes': missing_coin_txs, 'proof_tx_indexes': missing_proof_txs })
 
-    elif message['command'] == util.Command.BROADCAST_PENDING_COIN_TX:
-        new_tx = CoinTransaction()
-        new_tx.decode(message['tx'])
+    elif message['command'] == util.Command.GET_BLOCK_TXS:
+        block = network.get_block_by_hash(bytes.fromhex(message['block_hash']))
+
+        if block is None:
+            util.vprint("Received request for transactions of an unknown block")
+            return
 
         try:
-            new_tx.check_validity()
-        except:
+            coin_txs = [block.get_body().get_coin_txs()[index].encode() for index in message['coin_tx_indexes']]
+            proof_txs = [block.get_body().get_proof_txs()[index].encode(include_proof=False) for index in message['proof_tx_indexes']]
+        except (IndexError, TypeError):
+            util.vprint("Received request for block transactions with invalid indexes")
             return
 
-        if new_tx.verify_transaction():
-            network.pending_coin_transactions.append(new_tx)
+        network.send_message(sender_address, util.Command.BLOCK_TXS, { 'block_hash': message['block_hash'], 'coin_tx_indexes': message['coin_tx_indexes'], 'coin_txs': coin_txs, 'proof_tx_indexes': message['proof_tx_indexes'], 'proof_txs': proof_txs })
 
-            # propagate tx to all peers except the sender
-            network.broadcast_pending_coin_transaction(new_tx, sender)
+    elif message['command'] == util.Command.BLOCK_TXS:
+        compact_block = network.take_pending_compact_block(bytes.fromhex(message['block_hash']))
 
-    elif message['command'] == util.Command.BROADCAST_PENDING_PROOF_TX:
-        new_tx = ProofTransaction()
-        new_tx.decode(message['tx'])
+        if compact_block is None:
+            util.vprint("Received transactions for a block which is not awaited")
+            return
 
         try:
-            new_tx.check_validity()
-        except:
+            compact_block.fill_missing(message['coin_tx_indexes'], message['coin_txs'], message['proof_tx_indexes'], message['proof_txs'])
+        except (ValueError, IndexError):
+            util.vprint("Received block transactions do not match the compact block")
             return
 
-        if new_tx.verify_transaction():
-            network.pending_proof_transactions.append(new_tx)
+        accept_compact_block(compact_block, sender_address)
 
-            # propagate tx to all peers except the sender
-            network.broadcast_pending_proof_transaction(new_tx, sender)
+    elif message['command'] == util.Command.GET_PROOFS:
+        try:
+            proofs = [network.proof_store.get(bytes.fromhex(digest)) for digest in message['digests'][:PROOF_REQUEST_SIZE]]
+        except (ValueError, TypeError):
+            util.vprint("Received request for proofs with invalid digests")
+            return
+
+        network.send_message(sender_address, util.Command.PROOFS, { 'proofs': [base64.b64encode(proof).decode() for proof in proofs if proof is not None] })
+
+    elif message['command'] == util.Command.PROOFS:
+        for encoded_proof in message['proofs']:
+            try:
+                proof = base64.b64decode(encoded_proof, validate=True)
+            except (ValueError, TypeError):
+                util.vprint("Received proof with invalid encoding")
+                continue
+
+            # only proofs of awaited blocks are kept
+            if network.is_proof_awaited(get_proof_digest(proof)):
+                network.proof_store.put(proof)
+
+        accept_blocks_awaiting_proofs()
+
+    elif message['command'] == util.Command.BROADCAST_PENDING_TXS:
+        network.receive_pending_tx_batch(message['coin_txs'], message['proof_txs'], sender)
+
+    elif message['command'] == util.Command.BROADCAST_PENDING_COIN_TX:
+        network.receive_pending_tx_batch([message['tx']], [], sender)
+
+    elif message['command'] == util.Command.BROADCAST_PENDING_PROOF_TX:
+        network.receive_pending_tx_batch([], [message['tx']], sender)
 
     elif message['command'] == util.Command.GET_LATEST_BLOCK_ID:
         util.vprint(f"Peer {client_address[0]}:{message['port']} is requesting latest block id")
@@ -302,9 +476,7 @@ def receive_incoming(client_socket, client_address):
     elif message['command'] == util.Command.LATEST_BLOCK_ID:
         util.vprint(f"Received latest block id from peer {client_address[0]}:{message['port']}: {message['latest_id']}")
 
-        for peer in network.peers:
-            if peer.to_string() == f"{client_address[0]}:{message['port']}":
-                peer.set_latest_block_id(message['latest_id'])
+        sender_peer.set_latest_block_id(message['latest_id'])
 
     else:
         util.vprint(f"Received unknown message command '{message['command']}' from {client_address[0]}:{message['port']}")
@@ -348,13 +520,34 @@ def generate_key(filename):
     util.iprint("Generated address", private_key.get_verifying_key().to_string('compressed').hex())
     util.iprint(f"Private key saved to the file '{filename}'")
 
+def run_prover_worker(coordinator_address : str) -> None:
+    """ Prove jobs leased from a coordinator node until 'exit' is entered """
+    worker = ProverWorker(coordinator_address, prover_backend.get_backend(), network.config.get('proving_workers') or get_worker_count())
+    worker.start()
+
+    while True:
+        try:
+            command = prompt().strip()
+        except:
+            command = "exit"
+
+        if command == "exit":
+            worker.stop()
+            break
+        elif command == "status":
+            util.iprint(f"Worker {worker.get_worker_id()[0:6]}… proved {worker.get_proven_count()} job(s)")
+        else:
+            util.eprint("Only 'status' and 'exit' commands are available in prover worker mode")
+
 def main(argv):
-    global server_running, verbose_logging, private_key
+    global server_running, verbose_logging, private_key, proving_executor
 
     rpc_port = None
+    coordinator_address = None
+    prover_coordinator = None
 
     try:
-        opts, args = getopt.getopt(argv, "hvk:p:c:f:nr:", ["help", "verbose", "key=", "port=", "command=", "config=", "no-color", "rpc="])
+        opts, args = getopt.getopt(argv, "hvk:p:c:f:nr:w:", ["help", "verbose", "key=", "port=", "command=", "config=", "no-color", "rpc=", "worker="])
     except getopt.GetoptError:
         print(USAGE)
         print(USAGE_ARGUMENTS)
@@ -397,11 +590,28 @@ def main(argv):
             except ValueError:
                 util.eprint("Expected -r/--rpc argument to be an integer")
                 sys.exit(-1)
-
-    Zokrates.check_version()
+        elif opt in ['-w', '--worker']:
+            coordinator_address = arg
 
     network.setup_config(config_file)
 
+    try:
+        prover_backend.set_backend(prover_backend.create_backend(network.config))
+    except ValueError as e:
+        util.eprint(e)
+        sys.exit(-1)
+
+    Zokrates.set_limits(network.config.get('zokrates_proving_timeout'), network.config.get('zokrates_memory_limit'))
+
+    if isinstance(prover_backend.get_backend(), prover_backend.MockBackend):
+        util.wprint("Using the mock prover backend -- proofs are not zero-knowledge and can be forged")
+    else:
+        Zokrates.check_version()
+
+    if coordinator_address is not None:
+        run_prover_worker(coordinator_address)
+        return
+
     if private_key is None:
         util.iprint("Private key file was not provided, running in anonymous mode -- transactions cannot be created")
     else:
@@ -413,9 +623,47 @@ def main(argv):
 
     time.sleep(0.1)
 
+    native_verification = network.config.get('proof_verifier', 'zokrates') == 'native'
+
+    if native_verification and not groth16.is_available():
+        util.wprint("Native proof verification requires the 'py_ecc' package, falling back to ZoKrates")
+        native_verification = False
+
+    if native_verification and not isinstance(prover_backend.get_backend(), prover_backend.ZokratesBackend):
+        util.wprint("Native proof verification only supports ZoKrates proofs, ignoring 'proof_verifier'")
+        native_verification = False
+
+    if network.config.get('prover_coordinator_port') is not None:
+        prover_coordinator = ProverCoordinator()
+        prover_coordinator.start(network.self_ip_address, network.config['prover_coordinator_port'])
+        prover_backend.set_backend(RemoteBackend(prover_coordinator, prover_backend.get_backend()))
+
+    proving_executor = ProvingExecutor(network.config.get('proving_workers'), native_verification, network.config.get('witness_workers'), network.config.get('witness_queue_size'))
+    util.vprint(f"Proving: Using up to {proving_executor.get_max_workers()} concurrent proof(s) and {proving_executor.get_witness_workers()} concurrent witness computation(s)")
+
+    if native_verification:
+        util.vprint("Verification: Proofs are batch verified in-process")
+
+    network.setup_address_book()
     network.setup_peers()
     network.setup_circuits()
 
+    # saved on any exit of the interpreter, including Ctrl-C and unhandled errors
+    atexit.register(network.address_book.save_if_changed)
+
+    # SIGTERM interrupts the prompt below, which then exits like the 'exit' command
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    address_book_thread = threading.Thread(target=start_address_book_saving, daemon=True)
+    address_book_thread.start()
+
+    proof_request_thread = threading.Thread(target=start_proof_request_retries, daemon=True)
+    proof_request_thread.start()
+
+    # daemon thread, so that a long rescan interval does not delay exit
+    circuit_rescan_thread = threading.Thread(target=start_circuit_rescan, daemon=True)
+    circuit_rescan_thread.start()
+
     block_sync_thread = threading.Thread(target=start_blockchain_sync)
     block_sync_thread.start()
 
@@ -447,9 +695,18 @@ def main(argv):
         if command == "exit":
             server_running = False
 
+            network.flush_transaction_broadcasts()
+            network.address_book.save_if_changed()
+
             if rpc_port is not None:
                 rpc_interface.server.shutdown()
 
+            if prover_coordinator is not None:
+                prover_coordinator.stop()
+
+            # ZoKrates processes of a block being proven or verified would outlive the client
+            proving_executor.cancel_all()
+
             try:
                 terminating_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                 terminating_socket.connect((network.self_ip_address, network.port))
@@ -464,9 +721,10 @@ def main(argv):
             print(f"{util.Color.YELLOW()}{util.Color.BOLD()}Available commands:{util.Color.RESET()}")
             print(f"  {util.Color.YELLOW()}verbose <on|off>{util.Color.RESET()} -- toggles verbose logging")
             print(f"  {util.Color.YELLOW()}exit{util.Color.RESET()} -- terminates client")
-            print(f"  {util.Color.YELLOW()}send <receiver address> <amount>{util.Color.RESET()} -- create a coin transaction and submit it to the network")
-            print(f"  {util.Color.YELLOW()}request-proof <circuit hash> <parameters>{util.Color.RESET()} -- request a proof to be generated")
+            print(f"  {util.Color.YELLOW()}send <receiver address> <amount> [<receiver address> <amount>...]{util.Color.RESET()} -- create a coin transaction and submit it to the network, several receivers are paid by a single transaction")
+            print(f"  {util.Color.YELLOW()}request-proof <circuit hash> <parameters>{util.Color.RESET()} -- request a proof to be generated, comma separated parameter sets request a batch of proofs")
             print(f"  {util.Color.YELLOW()}select-proof-tx <proof index>{util.Color.RESET()} -- manually produce a proof and include it in partial block")
+            print(f"  {util.Color.YELLOW()}schedule-proofs [<budget ms>]{util.Color.RESET()} -- select the most rewarding pending proofs which can be generated within the block time budget")
             print(f"  {util.Color.YELLOW()}select-coin-tx <coin tx index>{util.Color.RESET()} -- manually confirm a coin transaction and include it in partial block")
             print(f"  {util.Color.YELLOW()}partial{util.Color.RESET()} -- print information about currently produced partial block")
             print(f"  {util.Color.YELLOW()}produce-block{util.Color.RESET()} -- finish and broadcast current block")
@@ -570,6 +828,22 @@ def main(argv):
             network.partial_block_proof_transactions.append(tx)
             util.iprint("Successfully selected the proof transaction")
 
+        elif command.split(" ")[0] == "schedule-proofs":
+            if private_key is None:
+                util.eprint("This command requires authentication, you can use the 'auth' command to authenticate")
+                continue
+
+            try:
+                budget = float(command.split(" ")[1]) if len(command.split(" ")) > 1 else network.config['block_time_budget']
+            except (ValueError, KeyError):
+                util.eprint("Usage: schedule-proofs <budget ms> (or set 'block_time_budget' in the configuration)")
+                continue
+
+            selected, deferred = schedule_proofs(network.pending_proof_transactions, proving_executor.get_proving_time_model(), budget, proving_executor.get_max_workers(), network.config['proof_tx_fee'])
+
+            network.partial_block_proof_transactions = selected
+            util.iprint(f"Selected {len(selected)} proof transaction(s) fitting into {budget:.0f} ms, {len(deferred)} deferred")
+
         elif command.split(" ")[0] == 'balance':
             latest_block = network.blockchain[-1]
 
@@ -603,8 +877,8 @@ def main(argv):
                 util.eprint("This command requires authentication, you can use the 'auth' command to authenticate")
                 continue
 
-            if len(command.split(" ")) != 3:
-                util.eprint("Usage: send <receiver address> <amount>")
+            if len(command.split(" ")) < 3 or len(command.split(" ")) % 2 != 1:
+                util.eprint("Usage: send <receiver address> <amount> [<receiver address> <amount>...]")
                 continue
 
             latest_block = network.blockchain[-1]
@@ -614,13 +888,13 @@ def main(argv):
             util.validate_address(sender_address)
 
             try:
-                receiver_address = bytes.fromhex(command.split(" ")[1])
-                amount = int(command.split(" ")[2])
+                arguments = command.split(" ")[1:]
+                outputs = [(bytes.fromhex(arguments[index]), int(arguments[index + 1])) for index in range(0, len(arguments), 2)]
 
-                assert current_sender_balance >= amount, "Insufficient sender balance"
+                assert current_sender_balance >= sum(amount for _, amount in outputs), "Insufficient sender balance"
 
                 new_tx = CoinTransaction()
-                new_tx.setup(sender_address, receiver_address, amount)
+                new_tx.setup_outputs(sender_address, outputs)
 
                 new_tx.sign(private_key)
 
@@ -638,15 +912,18 @@ def main(argv):
                 continue
 
             if len(command.split(" ")) < 3:
-                util.eprint("Usage: request-proof <circuit hash> <space separated parameters>")
+                util.eprint("Usage: request-proof <circuit hash> <space separated parameters>[, <space separated parameters>...]")
                 continue
 
             try:
                 sender_address = bytes.fromhex(private_key.get_verifying_key().to_string('compressed').hex())
                 new_tx = ProofTransaction()
-                complexity = Zokrates.get_constraint_count(network.circuits[command.split(" ")[1]])
+                complexity = network.get_constraint_count(command.split(" ")[1])
 
-                new_tx.setup(sender_address, bytes.fromhex(command.split(" ")[1]), " ".join(command.split(" ")[2:]), complexity)
+                parameter_sets = [parameters.strip() for parameters in " ".join(command.split(" ")[2:]).split(BATCH_SEPARATOR)]
+
+                new_tx.setup(sender_address, bytes.fromhex(command.split(" ")[1]), BATCH_SEPARATOR.join(parameter_sets), complexity)
+                network.validate_proof_tx_parameters(new_tx)
 
                 new_tx.sign(private_key)
 
@@ -656,6 +933,9 @@ def main(argv):
             except KeyError as e:
                 util.eprint("Failed to create pending proof transaction: Unknown circuit hash")
                 continue
+            except ValueError as e:
+                util.eprint(f"Failed to create pending proof transaction: {e}")
+                continue
             except Exception as e:
                 util.eprint("Failed to create pending proof transaction")
                 traceback.print_exc()
@@ -711,13 +991,17 @@ def main(argv):
             print()
             print(f"{util.Color.YELLOW()}{util.Color.BOLD()}Network status:{util.Color.RESET()}")
 
-            if len(network.peers) == 0:
+            peers = network.get_peer_list()
+
+            if len(peers) == 0:
                 print(f"  {util.Color.YELLOW()}No peers{util.Color.RESET()}")
             else:
-                print(f"  {util.Color.YELLOW()}Peers ({len(network.peers)}):{util.Color.RESET()}")
+                print(f"  {util.Color.YELLOW()}Peers ({len(peers)}):{util.Color.RESET()}")
 
-                for peer in network.peers:
-                    print(f"    - {peer.to_string()}")
+                for peer in peers:
+                    rtt = f"{peer.get_rtt():.1f} ms" if peer.get_rtt() is not None else "unknown"
+                    state = "active" if peer.is_active() else f"inactive, {peer.get_failure_count()} failure(s)"
+                    print(f"    - {peer.to_string()} (rtt {rtt}, score {peer.get_score():.2f}, {state})")
 
             if len(network.pending_coin_transactions) == 0:
                 print(f"  {util.Color.YELLOW()}No pending coin transactions{util.Color.RESET()}")
@@ -735,6 +1019,10 @@ def main(argv):
                 for index, tx in enumerate(network.pending_proof_transactions):
                     print(f"    - {index}: {tx}")
 
+            verification_cache = proving_executor.get_verification_cache()
+            print(f"  {util.Color.YELLOW()}Proof verification cache:{util.Color.RESET()} {len(verification_cache)} entries, {verification_cache.get_hits()} hits, {verification_cache.get_misses()} misses")
+            print(f"  {util.Color.YELLOW()}Encoded block cache:{util.Color.RESET()} {len(network.block_cache)} entries, {network.block_cache.get_hits()} hits, {network.block_cache.get_misses()} misses")
+
             print(f"  {util.Color.YELLOW()}Latest block:{util.Color.RESET()} {network.blockchain[-1].get_current_block_hash().hex()[0:6]}… (id {network.blockchain[-1].get_id()})")
             print()
 
@@ -799,6 +1087,15 @@ def main(argv):
 
             miner_address = bytes.fromhex(private_key.get_verifying_key().to_string('compressed').hex())
 
+            # proofs which would not be generated within the block time budget stay pending for the next block
+            if network.config.get('block_time_budget') is not None:
+                selected, deferred = schedule_proofs(network.partial_block_proof_transactions, proving_executor.get_proving_time_model(), network.config['block_time_budget'], proving_executor.get_max_workers(), network.config['proof_tx_fee'])
+
+                if len(deferred) > 0:
+                    util.iprint(f"Deferred {len(deferred)} proof transaction(s) which do not fit into the block time budget")
+
+                network.partial_block_proof_transactions = selected
+
             for coin_tx in network.partial_block_coin_transactions:
                 state_tree.apply_coin_tx(coin_tx, network.config['coin_tx_fee'], miner_address)
 
@@ -808,16 +1105,18 @@ def main(argv):
             # 3. produce metadata integrity
             metadata_integrity = network.get_pending_block_integrity(state_tree)
 
-            # 4. prove each proof
+            # 4. prove all proofs concurrently
 
-            for proof in network.partial_block_proof_transactions:
-                try:
-                    circuit_folder = network.circuits[proof.get_circuit_hash().hex()]
-                except KeyError:
-                    util.eprint("Unknown circuit inside a proof request")
-                    continue
+            proving_start = time.perf_counter()
+
+            try:
+                proving_timings = proving_executor.prove_all(network.partial_block_proof_transactions, metadata_integrity, network.circuits)
+            except Exception as e:
+                util.eprint("Failed to generate proofs, block was not produced:", e)
+                continue
 
-                proof.prove(metadata_integrity, circuit_folder)
+            if len(proving_timings) > 0:
+                util.iprint(f"Generated {len(proving_timings)} proof(s) in {(time.perf_counter() - proving_start) * 1000:.0f} ms, slowest proof took {max(proving_timings.values()):.0f} ms")
 
             new_block_body = BlockBody()
             new_block_body.setup(network.partial_block_coin_transactions, network.partial_block_proof_transactions, state_tree)
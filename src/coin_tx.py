@@ -8,47 +8,72 @@ import hashlib
 
 import util
 from encodeable import Encodeable
-import ecdsa
+
+MAX_OUTPUTS = 1000 # receivers of a single coin transaction
 
 # TODO: Add timestamp
 class CoinTransaction(Encodeable):
+    """
+    Transfer of coins from a single sender to one or more receivers, all outputs are covered by
+    a single signature and the transaction fee is paid once per transaction
+    """
     __id: bytes           # SHA256 hash (32 bytes)
     __address_from: bytes # SECP256k1 public key in SEC1 format (33 bytes)
-    __address_to: bytes   # SECP256k1 public key in SEC1 format (33 bytes)
-    __amount: int
+    __outputs: list[tuple[bytes, int]] # receiver's SECP256k1 public key in SEC1 format (33 bytes) and amount
     __signature: bytes    # SECP256k1 signature (64 bytes)
 
     def __init__(self):
         pass
 
     def setup(self, address_from : bytes, address_to : bytes, amount : int) -> None:
+        self.setup_outputs(address_from, [(address_to, amount)])
+
+    def setup_outputs(self, address_from : bytes, outputs : list[tuple[bytes, int]]) -> None:
         util.validate_address(address_from)
-        util.validate_address(address_to)
+
+        for address_to, _ in outputs:
+            util.validate_address(address_to)
 
         timestamp = util.get_current_time()
-        serialized_tx = "|".join([str(timestamp), address_from.hex(), address_to.hex(), str(amount)]).encode()
+        serialized_tx = "|".join([str(timestamp), address_from.hex()] + self.__serialize_outputs(outputs)).encode()
 
         self.__id = hashlib.sha256(serialized_tx).digest()
         self.__address_from = address_from
-        self.__address_to = address_to
-        self.__amount = amount
+        self.__outputs = list(outputs)
         self.__signature = None
 
         self.check_validity()
 
+    @staticmethod
+    def __serialize_outputs(outputs : list[tuple[bytes, int]]) -> list[str]:
+        """ Same serialization as the original single receiver transaction when there is one output """
+        return [field for address_to, amount in outputs for field in (address_to.hex(), str(amount))]
+
     def check_validity(self) -> None:
-        if self.__amount <= 0:
-            raise ValueError("Transaction amount must be positive")
+        if len(self.__outputs) == 0:
+            raise ValueError("Transaction must have at least one output")
+
+        if len(self.__outputs) > MAX_OUTPUTS:
+            raise ValueError(f"Transaction has more than {MAX_OUTPUTS} outputs")
+
+        for address_to, amount in self.__outputs:
+            util.validate_address(address_to)
+
+            if type(amount) != int:
+                raise TypeError("Transaction amount must be an integer")
 
-        if self.__address_from == self.__address_to:
-            raise ValueError("Sender and receiver addresses cannot be the same")
+            if amount <= 0:
+                raise ValueError("Transaction amount must be positive")
+
+            if self.__address_from == address_to:
+                raise ValueError("Sender and receiver addresses cannot be the same")
 
     def hash(self) -> bytes:
-        serialized_tx = "|".join([self.__id.hex(), self.__address_from.hex(), self.__address_to.hex(), str(self.__amount)]).encode()
+        serialized_tx = "|".join([self.__id.hex(), self.__address_from.hex()] + self.__serialize_outputs(self.__outputs)).encode()
         return hashlib.sha256(serialized_tx).digest()
 
     def get_integrity(self) -> bytes:
-        serialized_tx = "|".join([self.__id.hex(), self.__address_from.hex(), self.__address_to.hex(), str(self.__amount), self.__signature.hex()]).encode()
+        serialized_tx = "|".join([self.__id.hex(), self.__address_from.hex()] + self.__serialize_outputs(self.__outputs) + [self.__signature.hex()]).encode()
         return hashlib.sha256(serialized_tx).digest()
 
     def sign(self, private_key) -> None:
@@ -61,7 +86,7 @@ class CoinTransaction(Encodeable):
     def verify_transaction(self) -> bool:
         self.check_validity()
 
-        if not ecdsa.VerifyingKey.from_string(self.__address_from, curve=ecdsa.SECP256k1).verify(self.__signature, self.hash()):
+        if not util.get_verifying_key(self.__address_from).verify(self.__signature, self.hash()):
             return False
 
         return True
@@ -76,28 +101,48 @@ class CoinTransaction(Encodeable):
         return self.__address_from
 
     def get_address_to(self) -> bytes:
-        return self.__address_to
+        """ Receiver of a single output transaction, None if there are more outputs """
+        return self.__outputs[0][0] if len(self.__outputs) == 1 else None
 
     def get_amount(self) -> int:
-        return self.__amount
+        """ Total amount sent to all receivers """
+        return sum(amount for _, amount in self.__outputs)
+
+    def get_outputs(self) -> list[tuple[bytes, int]]:
+        return self.__outputs
 
     def encode(self) -> dict:
         if not self.is_signed(): raise ValueError("Cannot encode an unsigned transaction");
 
+        if len(self.__outputs) == 1:
+            return {
+                'id': self.__id.hex(),
+                'address_from': self.__address_from.hex(),
+                'address_to': self.__outputs[0][0].hex(),
+                'amount': self.__outputs[0][1],
+                'signature': self.__signature.hex()
+            }
+
         return {
             'id': self.__id.hex(),
             'address_from': self.__address_from.hex(),
-            'address_to': self.__address_to.hex(),
-            'amount': self.__amount,
+            'outputs': [{ 'address_to': address_to.hex(), 'amount': amount } for address_to, amount in self.__outputs],
             'signature': self.__signature.hex()
         }
 
     def decode(self, obj : dict) -> None:
         self.__id = bytes.fromhex(obj['id'])
         self.__address_from =  bytes.fromhex(obj['address_from'])
-        self.__address_to = bytes.fromhex(obj['address_to'])
-        self.__amount = obj['amount']
+
+        if 'outputs' in obj:
+            self.__outputs = [(bytes.fromhex(output['address_to']), output['amount']) for output in obj['outputs']]
+        else:
+            self.__outputs = [(bytes.fromhex(obj['address_to']), obj['amount'])]
+
         self.__signature = bytes.fromhex(obj['signature'])
 
     def __str__(self) -> str:
-        return f"{self.__id.hex()[0:6]}…: {self.__address_from.hex()[0:6]}… --({self.__amount})--> {self.__address_to.hex()[0:6]}…"
+        if len(self.__outputs) == 1:
+            return f"{self.__id.hex()[0:6]}…: {self.__address_from.hex()[0:6]}… --({self.get_amount()})--> {self.__outputs[0][0].hex()[0:6]}…"
+
+        return f"{self.__id.hex()[0:6]}…: {self.__address_from.hex()[0:6]}… --({self.get_amount()})--> {len(self.__outputs)} receivers"
@@ -0,0 +1,163 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import copy
+import hashlib
+
+from block import Block
+from block_body import BlockBody
+from block_header import BlockHeader
+from coin_tx import CoinTransaction
+from proof_tx import ProofTransaction
+from state_tree import StateTree
+from encodeable import Encodeable
+
+SHORT_ID_LENGTH = 6 # bytes
+
+def get_short_id(block_hash : bytes, tx_id : bytes) -> bytes:
+    """ Short transaction id salted with the block hash so that collisions cannot be precomputed """
+    return hashlib.sha256(block_hash + tx_id).digest()[:SHORT_ID_LENGTH]
+
+class CompactBlock(Encodeable):
+    """
+    Block announcement carrying the header and short ids of the transactions instead of full
+    transactions. Receivers rebuild the block from their mempool and only fetch the missing
+    transactions, the state tree is rebuilt by applying them to the state of the parent block.
+    Pending proof transactions do not contain proofs, so digests of the proofs are sent along and
+    the proofs themselves are fetched separately by nodes which verify them.
+    """
+    __header: BlockHeader
+    __coin_tx_short_ids: list[bytes]
+    __proof_tx_short_ids: list[bytes]
+    __proof_digests: list[bytes]        # None for unproven transactions
+    __coin_txs: list[CoinTransaction]   # reconstructed transactions, None if missing
+    __proof_txs: list[ProofTransaction] # reconstructed transactions, None if missing
+
+    def __init__(self):
+        pass
+
+    def setup(self, block : Block) -> None:
+        block_hash = block.get_current_block_hash()
+
+        self.__header = block.get_header()
+        self.__coin_tx_short_ids = [get_short_id(block_hash, tx.get_id()) for tx in block.get_body().get_coin_txs()]
+        self.__proof_tx_short_ids = [get_short_id(block_hash, tx.get_id()) for tx in block.get_body().get_proof_txs()]
+        self.__proof_digests = [tx.get_proof_digest() for tx in block.get_body().get_proof_txs()]
+        self.__coin_txs = list(block.get_body().get_coin_txs())
+        self.__proof_txs = list(block.get_body().get_proof_txs())
+
+    def encode(self) -> dict:
+        return {
+            'header': self.__header.encode(),
+            'coin_txs': [short_id.hex() for short_id in self.__coin_tx_short_ids],
+            'proof_txs': [short_id.hex() for short_id in self.__proof_tx_short_ids],
+            'proof_digests': [digest.hex() if digest is not None else '' for digest in self.__proof_digests]
+        }
+
+    def decode(self, obj : dict) -> None:
+        header = BlockHeader()
+        header.decode(obj['header'])
+
+        if len(obj['proof_txs']) != len(obj['proof_digests']):
+            raise ValueError("Compact block must contain a proof digest for every proof transaction")
+
+        self.__header = header
+        self.__coin_tx_short_ids = [bytes.fromhex(short_id) for short_id in obj['coin_txs']]
+        self.__proof_tx_short_ids = [bytes.fromhex(short_id) for short_id in obj['proof_txs']]
+        self.__proof_digests = [None if digest == '' else bytes.fromhex(digest) for digest in obj['proof_digests']]
+        self.__coin_txs = [None] * len(self.__coin_tx_short_ids)
+        self.__proof_txs = [None] * len(self.__proof_tx_short_ids)
+
+    def get_id(self) -> int:
+        return self.__header.get_id()
+
+    def get_current_block_hash(self) -> bytes:
+        return self.__header.get_current_block_hash()
+
+    def reconstruct(self, pending_coin_transactions : list[CoinTransaction], pending_proof_transactions : list[ProofTransaction]) -> None:
+        """ Fill in transactions which can be found in the mempool """
+        block_hash = self.get_current_block_hash()
+
+        coin_mempool = { get_short_id(block_hash, tx.get_id()): tx for tx in pending_coin_transactions }
+        proof_mempool = { get_short_id(block_hash, tx.get_id()): tx for tx in pending_proof_transactions }
+
+        for index, short_id in enumerate(self.__coin_tx_short_ids):
+            if self.__coin_txs[index] is None and short_id in coin_mempool:
+                self.__coin_txs[index] = coin_mempool[short_id]
+
+        for index, short_id in enumerate(self.__proof_tx_short_ids):
+            if self.__proof_txs[index] is None and short_id in proof_mempool:
+                # pending transaction is shared with the mempool, reference the proof from a copy
+                proven_tx_obj = proof_mempool[short_id].encode()
+                proven_tx_obj['proof_digest'] = self.__proof_digests[index].hex() if self.__proof_digests[index] is not None else ''
+
+                proven_tx = ProofTransaction()
+                proven_tx.decode(proven_tx_obj)
+
+                self.__proof_txs[index] = proven_tx
+
+    def get_missing_coin_txs(self) -> list[int]:
+        return [index for index, tx in enumerate(self.__coin_txs) if tx is None]
+
+    def get_missing_proof_txs(self) -> list[int]:
+        return [index for index, tx in enumerate(self.__proof_txs) if tx is None]
+
+    def fill_missing(self, coin_tx_indexes : list[int], coin_txs : list[dict], proof_tx_indexes : list[int], proof_txs : list[dict]) -> None:
+        """ Fill in transactions received from the block sender """
+        for index, tx_obj in zip(coin_tx_indexes, coin_txs):
+            tx = CoinTransaction()
+            tx.decode(tx_obj)
+
+            if get_short_id(self.get_current_block_hash(), tx.get_id()) != self.__coin_tx_short_ids[index]:
+                raise ValueError("Received coin transaction does not match the compact block")
+
+            self.__coin_txs[index] = tx
+
+        for index, tx_obj in zip(proof_tx_indexes, proof_txs):
+            tx = ProofTransaction()
+            tx.decode(tx_obj)
+
+            if get_short_id(self.get_current_block_hash(), tx.get_id()) != self.__proof_tx_short_ids[index]:
+                raise ValueError("Received proof transaction does not match the compact block")
+
+            if tx.get_proof_digest() != self.__proof_digests[index]:
+                raise ValueError("Received proof transaction references a different proof")
+
+            self.__proof_txs[index] = tx
+
+    def is_complete(self) -> bool:
+        return None not in self.__coin_txs and None not in self.__proof_txs
+
+    def to_block(self, previous_state_tree : StateTree, coin_tx_fee : int, proof_tx_fee : int) -> Block:
+        """
+        Assemble the full block on top of the state of its parent block, raises ValueError if it does not
+        match the header (e.g. short id collision)
+        """
+        if not self.is_complete():
+            raise ValueError("Cannot assemble a block with missing transactions")
+
+        state_tree = copy.deepcopy(previous_state_tree)
+        miner_address = self.__header.get_miner()
+
+        for tx in self.__coin_txs:
+            state_tree.apply_coin_tx(tx, coin_tx_fee, miner_address)
+
+        for tx in self.__proof_txs:
+            state_tree.apply_proof_tx(tx, proof_tx_fee, miner_address)
+
+        body = BlockBody()
+        body.setup(list(self.__coin_txs), list(self.__proof_txs), state_tree)
+
+        if body.hash_coin_txs() != self.__header.get_coin_txs_hash() or body.hash_proof_txs() != self.__header.get_proof_txs_hash():
+            raise ValueError("Reconstructed transactions do not match the block header")
+
+        if body.hash_state_tree() != self.__header.get_state_root_hash():
+            raise ValueError("Rebuilt state tree does not match the block header")
+
+        block = Block()
+        block.setup(self.__header, body)
+
+        return block
@@ -0,0 +1,62 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+# Builds a compression dictionary from the blocks and pending transactions of a running node
+# Usage: python compression/build_dictionary.py <RPC URL of the node> <output file>
+#
+# Committed dictionaries must never change, since peers only exchange their versions. A dictionary
+# built from newer data is committed as the next version and added to COMPRESSION_DICTIONARY_VERSIONS.
+
+import os
+import sys
+import jsonrpclib
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import util
+import wire_codec
+
+SAMPLE_SIZE = 4096      # bytes of each encoded message kept, so every kind of message fits into the dictionary
+BATCH_SIZE = 20         # transactions of a sampled transaction batch
+
+def collect_messages(server) -> list[dict]:
+    """ Messages which are typically large enough to be compressed, from the least to the most common """
+    latest_id = server.GET_LATEST_BLOCK_ID()['latest_id']
+    blocks = [server.GET_BLOCK(str(block_id))['block'] for block_id in range(1, latest_id + 1)]
+    coin_txs = server.GET_PENDING_COIN_TXS()['pending_coin_txs'][:BATCH_SIZE]
+    proof_txs = server.GET_PENDING_PROOF_TXS()['pending_proof_txs'][:BATCH_SIZE]
+
+    if len(blocks) == 0 or len(coin_txs) == 0 or len(proof_txs) == 0:
+        raise ValueError("The node needs blocks and both pending coin and proof transactions")
+
+    # blocks reference their proofs by digest, proofs themselves are incompressible
+    largest_block = max(blocks, key=lambda block: len(block['body']['coin_txs']) + len(block['body']['proof_txs']))
+
+    return [
+        { 'command': util.Command.BLOCK, 'port': 0, 'block': largest_block },
+        { 'command': util.Command.PENDING_PROOF_TXS, 'port': 0, 'pending_txs': proof_txs },
+        { 'command': util.Command.PENDING_COIN_TXS, 'port': 0, 'pending_txs': coin_txs },
+        { 'command': util.Command.BROADCAST_PENDING_TXS, 'port': 0, 'coin_txs': coin_txs, 'proof_txs': proof_txs }
+    ]
+
+def main(argv):
+    if len(argv) != 2:
+        print("Usage: python compression/build_dictionary.py <RPC URL of the node> <output file>")
+        sys.exit(1)
+
+    messages = collect_messages(jsonrpclib.Server(argv[0]))
+
+    # JSON is the default wire format, so it goes last
+    samples = [wire_codec.encode_message(message, version)[:SAMPLE_SIZE] for version in [wire_codec.WIRE_VERSION, wire_codec.WIRE_FORMAT_JSON] for message in messages]
+    dictionary = wire_codec.build_compression_dictionary(samples)
+
+    with open(argv[1], 'wb') as file:
+        file.write(dictionary)
+
+    print(f"Wrote {len(dictionary)} bytes to {argv[1]}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,156 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import os
+import json
+import secrets
+import functools
+
+bn128 = None    # py_ecc.optimized_bn128, imported on first use since it takes most of the client start up time
+
+BATCH_RANDOMIZER_BITS = 128 # soundness of batch verification is 2^-128
+
+def is_available() -> bool:
+    """ In-process verification needs the optional 'py_ecc' package, it is imported by the first call """
+    global bn128
+
+    if bn128 is None:
+        try:
+            from py_ecc import optimized_bn128
+        except ImportError:
+            return False
+
+        bn128 = optimized_bn128
+
+    return True
+
+def parse_g1(point : list):
+    x, y = [int(coordinate, 16) for coordinate in point]
+
+    if x == 0 and y == 0:
+        return bn128.Z1
+
+    result = (bn128.FQ(x), bn128.FQ(y), bn128.FQ.one())
+
+    if x >= bn128.field_modulus or y >= bn128.field_modulus or not bn128.is_on_curve(result, bn128.b):
+        raise ValueError("G1 point is not on the curve")
+
+    return result
+
+def parse_g2(point : list):
+    # ZoKrates stores every Fq2 coordinate as [c0, c1]
+    (x0, x1), (y0, y1) = [[int(c, 16) for c in coordinate] for coordinate in point]
+
+    if x0 == x1 == y0 == y1 == 0:
+        return bn128.Z2
+
+    result = (bn128.FQ2([x0, x1]), bn128.FQ2([y0, y1]), bn128.FQ2.one())
+
+    if max(x0, x1, y0, y1) >= bn128.field_modulus or not bn128.is_on_curve(result, bn128.b2):
+        raise ValueError("G2 point is not on the curve")
+
+    # G2 of BN254 has a cofactor, points outside the prime order subgroup must be rejected
+    if not bn128.is_inf(bn128.multiply(result, bn128.curve_order)):
+        raise ValueError("G2 point is not in the correct subgroup")
+
+    return result
+
+class Groth16Verifier:
+    """
+    In-process verifier of ZoKrates Groth16 proofs over the bn128 (BN254) curve, which reads
+    'verification.key' and 'proof.json' formats directly instead of calling 'zokrates verify'.
+    """
+    __alpha: tuple
+    __beta: tuple
+    __gamma: tuple
+    __delta: tuple
+    __gamma_abc: list
+
+    def __init__(self, verification_key : dict):
+        if not is_available():
+            raise RuntimeError("In-process verification requires the 'py_ecc' package")
+
+        if verification_key.get('scheme') != 'g16' or verification_key.get('curve') != 'bn128':
+            raise ValueError("Only Groth16 verification keys over bn128 are supported")
+
+        self.__alpha = parse_g1(verification_key['alpha'])
+        self.__beta = parse_g2(verification_key['beta'])
+        self.__gamma = parse_g2(verification_key['gamma'])
+        self.__delta = parse_g2(verification_key['delta'])
+        self.__gamma_abc = [parse_g1(point) for point in verification_key['gamma_abc']]
+
+    def verify(self, proof : str) -> bool:
+        return self.verify_batch([proof])
+
+    def verify_batch(self, proofs : list[str]) -> bool:
+        """
+        Verify all proofs at once using a random linear combination of their pairing equations,
+        which costs one Miller loop per proof plus three and a single final exponentiation.
+        Returns False if any of the proofs is invalid or malformed.
+        """
+        try:
+            parsed_proofs = [self.__parse_proof(proof) for proof in proofs]
+        except (ValueError, KeyError, TypeError):
+            return False
+
+        if len(parsed_proofs) == 0:
+            return True
+
+        # a single proof does not need randomization
+        randomizers = [1] if len(parsed_proofs) == 1 else [secrets.randbits(BATCH_RANDOMIZER_BITS) | 1 for _ in parsed_proofs]
+
+        # prod e(r_i * A_i, B_i) == e(sum(r_i) * alpha, beta) * e(sum(r_i * vk_x_i), gamma) * e(sum(r_i * C_i), delta)
+        combined_vk_x = bn128.Z1
+        combined_c = bn128.Z1
+        miller_product = bn128.FQ12.one()
+
+        for r, (a, b, c, inputs) in zip(randomizers, parsed_proofs):
+            vk_x = self.__gamma_abc[0]
+
+            for value, point in zip(inputs, self.__gamma_abc[1:]):
+                vk_x = bn128.add(vk_x, bn128.multiply(point, value))
+
+            combined_vk_x = bn128.add(combined_vk_x, bn128.multiply(vk_x, r))
+            combined_c = bn128.add(combined_c, bn128.multiply(c, r))
+
+            miller_product *= bn128.pairing(b, bn128.neg(bn128.multiply(a, r)), final_exponentiate=False)
+
+        miller_product *= bn128.pairing(self.__beta, bn128.multiply(self.__alpha, sum(randomizers) % bn128.curve_order), final_exponentiate=False)
+        miller_product *= bn128.pairing(self.__gamma, combined_vk_x, final_exponentiate=False)
+        miller_product *= bn128.pairing(self.__delta, combined_c, final_exponentiate=False)
+
+        return bn128.final_exponentiate(miller_product) == bn128.FQ12.one()
+
+    def __parse_proof(self, proof : str) -> tuple:
+        proof_json = json.loads(proof)
+
+        if proof_json.get('scheme', 'g16') != 'g16' or proof_json.get('curve', 'bn128') != 'bn128':
+            raise ValueError("Only Groth16 proofs over bn128 are supported")
+
+        inputs = [int(value, 16) for value in proof_json['inputs']]
+
+        if len(inputs) != len(self.__gamma_abc) - 1:
+            raise ValueError("Number of public inputs does not match the verification key")
+
+        if any(value >= bn128.curve_order for value in inputs):
+            raise ValueError("Public input is not a field element")
+
+        a = parse_g1(proof_json['proof']['a'])
+        b = parse_g2(proof_json['proof']['b'])
+        c = parse_g1(proof_json['proof']['c'])
+
+        return (a, b, c, inputs)
+
+@functools.lru_cache(maxsize=256)
+def load_verifier(verification_key_filepath : str, mtime_ns : int) -> Groth16Verifier:
+    with open(verification_key_filepath, 'r') as file:
+        return Groth16Verifier(json.load(file))
+
+def get_verifier(circuit_folder : str) -> Groth16Verifier:
+    """ Return verifier for a circuit, parsed verification keys are cached until the key file changes """
+    verification_key_filepath = os.path.join(circuit_folder, "verification.key")
+
+    return load_verifier(verification_key_filepath, os.stat(verification_key_filepath).st_mtime_ns)
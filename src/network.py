@@ -7,19 +7,45 @@
 import socket
 import json
 import hashlib
+import time
+import threading
+import os
 
 import util
 from coin_tx import CoinTransaction
 from proof_tx import ProofTransaction
 from block import Block
+from compact_block import CompactBlock
+from proof_store import ProofStore, AwaitedBlock, PROOF_REQUEST_SIZE
+from block_cache import EncodedBlockCache, BLOCK_CACHE_SIZE
 from state_tree import StateTree
 from peer import Peer
-from bind_zokrates import Zokrates
+from address_book import AddressBook
+from bind_zokrates import Zokrates, validate_parameters
+import wire_codec
+import prover_backend
 
 port = 12346
 
-peers = []
+PEER_CONNECT_TIMEOUT = 2 # s
+TX_BATCH_DELAY = 0.005   # s, how long broadcast transactions are collected before being sent out together
+TX_BATCH_MAX_SIZE = 500  # batch is sent out right away once it reaches this many transactions
+CIRCUIT_RESCAN_INTERVAL = 10 # s, how often circuit folder is checked for new circuits
+WIRE_FORMAT = 'json'     # format of messages to peers, 'binary' is smaller but slower to encode, overridden by 'wire_format'
+COMPRESSION_LEVEL = 6    # zlib level of messages to peers, 0 disables compression, overridden by 'compression_level'
+COMPRESSION_THRESHOLD = 512 # bytes, smaller messages are sent uncompressed, overridden by 'compression_threshold'
+PENDING_COMPACT_BLOCK_TIMEOUT = 10000 # ms, compact blocks whose transactions do not arrive by then are dropped
+PENDING_COMPACT_BLOCKS_MAX_COUNT = 16 # oldest compact blocks are dropped beyond this many
+PROOF_REQUEST_TIMEOUT = 3000 # ms, missing proofs of a received block are requested again from another peer after this long
+PROOF_REQUEST_ATTEMPTS = 3 # blocks are dropped once their proofs were requested this many times
+BLOCKS_AWAITING_PROOFS_WINDOW = 8 # only blocks at most this many ids above the chain tip wait for their proofs
+BLOCKS_AWAITING_PROOFS_MAX_COUNT = 16 # blocks furthest above the chain tip are dropped beyond this many
+
+peers : dict[tuple, Peer] = {} # keyed by (ip address, port)
+peers_lock = threading.RLock() # guards insertions and removals, lookups are plain dict reads
+address_book = AddressBook() # every known peer address, source of replacements for evicted peers
 circuits = None
+circuit_metadata : dict[str, dict] = {} # circuit hash -> constraint count, ABI summary and key hashes
 
 pending_coin_transactions : list[CoinTransaction] = []
 pending_proof_transactions : list[ProofTransaction] = []
@@ -27,13 +53,32 @@ pending_proof_transactions : list[ProofTransaction] = []
 partial_block_coin_transactions : list[CoinTransaction] = []
 partial_block_proof_transactions : list[ProofTransaction] = []
 
+tx_batch : list[tuple] = [] # (transaction, sender) pairs waiting to be broadcast
+tx_batch_condition = threading.Condition()
+tx_batch_thread = None
+
+# compact blocks waiting for missing transactions, keyed by block hash
+pending_compact_blocks : dict[bytes, tuple[CompactBlock, int]] = {} # block hash -> (compact block, time of receipt)
+pending_compact_blocks_lock = threading.Lock()
+
+# proofs of blocks in the chain, served to peers which verify them
+proof_store = ProofStore()
+
+# encodings of blocks in the chain served to peers and RPC clients
+block_cache = EncodedBlockCache()
+
+# received blocks waiting for their proofs, keyed by block hash
+blocks_awaiting_proofs : dict[bytes, AwaitedBlock] = {}
+blocks_awaiting_proofs_lock = threading.Lock()
+
 config = None
 
+
 blockchain = None
 self_ip_address = None
 
 def setup_config(filepath : str):
-    global config, blockchain, self_ip_address
+    global config, blockchain, self_ip_address, block_cache
 
     with open(filepath, 'r') as file:
         json_data = json.load(file)
@@ -45,70 +90,284 @@ def setup_config(filepath : str):
 
     blockchain = [genesis_block]
     self_ip_address = config['self_ip_address']
+    block_cache = EncodedBlockCache(config.get('block_cache_size', BLOCK_CACHE_SIZE))
 
     assert len(blockchain) > 0, "Missing genesis block in 'blockchain' variable"
 
+def setup_address_book():
+    global address_book
+
+    filepath = config.get('address_book_file')
+
+    if filepath is not None:
+        filepath = os.path.join(os.path.dirname(__file__), filepath.format(port=port))
+
+    address_book = AddressBook(filepath)
+    address_book.load()
+
 def setup_peers():
-    global peers
+    self_address = f"{config['self_ip_address']}:{port}"
 
     for peer_str in config['seed_nodes']:
-        if peer_str == f"{config['self_ip_address']}:{port}":
-            continue
+        if peer_str != self_address:
+            address_book.add(peer_str)
 
-        peerObj = Peer()
-        peerObj.setup_from_string(peer_str)
+    # known good peers from previous runs go first, seed nodes fill the remaining slots
+    candidates = address_book.get_best(exclude={ self_address })
+    candidates = candidates + [peer_str for peer_str in config['seed_nodes'] if peer_str not in candidates and peer_str != self_address]
 
-        if peer_str not in [p.to_string() for p in peers]:
-            peers.append(peerObj)
+    new_peers = []
 
-        if len(peers) >= config['max_peer_count']:
-            break
+    for peer_str in candidates[:config['max_peer_count']]:
+        new_peers.append(add_peer(to_address(peer_str)))
 
-        send_message(peerObj.to_tuple(), util.Command.GET_PEERS)
+    # contact all initial peers in parallel so that a single unreachable one does not delay the rest
+    threads = [threading.Thread(target=send_message, args=(peer.to_tuple(), util.Command.GET_PEERS)) for peer in new_peers]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
 
 def setup_circuits():
-    global circuits
+    global circuits, circuit_metadata
 
     circuits = Zokrates.prepare_circuits()
+    circuit_metadata = { circuit_hash: Zokrates.get_circuit_metadata(circuit_folder, circuit_hash, prover_backend.get_backend().get_constraint_count) for circuit_hash, circuit_folder in circuits.items() }
     print(circuits)
 
-def accept_peers(received_peers : list[Peer]):
-    global peers
+def rescan_circuits() -> None:
+    """ Register circuits added and unregister circuits removed while the client is running """
+    global circuits, circuit_metadata
+
+    found_circuits = Zokrates.prepare_circuits(log=False)
 
-    if len(peers) >= config['max_peer_count']:
+    if found_circuits == circuits:
         return
 
-    for peer_str in received_peers:
-        if peer_str == f"{config['self_ip_address']}:{port}":
-            continue
+    new_metadata = {}
+
+    for circuit_hash, circuit_folder in found_circuits.items():
+        if circuit_hash in circuit_metadata and circuits.get(circuit_hash) == circuit_folder:
+            new_metadata[circuit_hash] = circuit_metadata[circuit_hash]
+        else:
+            new_metadata[circuit_hash] = Zokrates.get_circuit_metadata(circuit_folder, circuit_hash, prover_backend.get_backend().get_constraint_count)
+            util.vprint(f"Circuits: Registered circuit from '{circuit_folder}' under hash '{circuit_hash}'")
+
+    for circuit_hash in circuits.keys() - found_circuits.keys():
+        util.vprint(f"Circuits: Unregistered removed circuit '{circuit_hash}'")
+
+    # metadata first so that every registered circuit always has metadata
+    circuit_metadata = new_metadata
+    circuits = found_circuits
 
-        peerObj = Peer()
-        peerObj.setup_from_string(peer_str)
+def get_constraint_count(circuit_hash : str) -> int:
+    """ Return cached constraint count of a registered circuit, raises KeyError for unknown circuits """
+    constraint_count = circuit_metadata[circuit_hash]['constraint_count']
 
-        if peer_str not in [p.to_string() for p in peers]:
-            util.vprint(f"Accepting peer {peer_str}")
-            peers.append(peerObj)
+    if constraint_count is None:
+        raise ValueError(f"Constraint count of circuit '{circuit_hash}' is unknown")
 
+    return constraint_count
+
+def validate_proof_tx_parameters(tx : ProofTransaction) -> None:
+    """
+    Check parameters of a proof request against the cached ABI of its circuit, raises ValueError.
+    Requests for circuits unknown to this node cannot be checked and are admitted.
+    """
+    metadata = circuit_metadata.get(tx.get_circuit_hash().hex())
+
+    if metadata is not None:
+        for parameters in tx.get_parameter_sets():
+            validate_parameters(metadata['inputs'], parameters)
+
+def accept_peers(received_peers : list[str]):
+    addresses = [to_address(peer_str) for peer_str in received_peers]
+    addresses = [address for address in addresses if address != (config['self_ip_address'], port)]
+
+    for address in addresses:
+        address_book.add(f"{address[0]}:{address[1]}")
+
+    for address in addresses:
+        with peers_lock:
             if len(peers) >= config['max_peer_count']:
                 return
 
-            send_message(peerObj.to_tuple(), util.Command.GET_PEERS)
+            if address in peers:
+                continue
+
+            util.vprint(f"Accepting peer {address[0]}:{address[1]}")
+            peerObj = add_peer(address)
+
+        send_message(peerObj.to_tuple(), util.Command.GET_PEERS)
+
+def to_address(peer_str : str) -> tuple:
+    """ Convert 'ip:port' string into (ip, port) tuple used as a key in the peer table """
+    ip_address, peer_port = peer_str.split(":")
+
+    return (ip_address, int(peer_port))
+
+def get_peer(address : tuple) -> Peer:
+    return peers.get(address)
+
+def add_peer(address : tuple) -> Peer:
+    """ Insert a peer into the peer table unless present and return the stored peer """
+    with peers_lock:
+        if address not in peers:
+            peerObj = Peer()
+            peerObj.setup_from_tuple(address)
+            peers[address] = peerObj
+
+        return peers[address]
+
+def get_peer_list() -> list[Peer]:
+    """ Return a snapshot of the peer table which is safe to iterate while other threads modify it """
+    with peers_lock:
+        return list(peers.values())
+
+def get_available_peers() -> list[Peer]:
+    """ Return peers which are not in a backoff period after failed contact """
+    return [peer for peer in get_peer_list() if peer.is_available()]
+
+def get_peers_by_score() -> list[Peer]:
+    """ Return available peers ordered from the best scoring one """
+    return sorted(get_available_peers(), key=lambda peer: peer.get_score(), reverse=True)
+
+def evict_peer(peer : Peer) -> None:
+    with peers_lock:
+        if peers.get(peer.to_tuple()) is peer:
+            del peers[peer.to_tuple()]
+
+    # do not pick the same address again as a replacement
+    address_book.discard(peer.to_string())
+
+    util.vprint(f"Evicted unresponsive peer {peer.to_string()} after {peer.get_failure_count()} failures")
+
+    replace_peers()
+
+def replace_peers() -> None:
+    """ Fill free peer slots with the best addresses from the address book """
+    exclude = { f"{config['self_ip_address']}:{port}" } | { peer.to_string() for peer in get_peer_list() }
+
+    for peer_str in address_book.get_best(exclude=exclude):
+        address = to_address(peer_str)
+
+        with peers_lock:
+            if len(peers) >= config['max_peer_count']:
+                return
+
+            if address in peers:
+                continue
+
+            util.vprint(f"Replacing evicted peer with {peer_str}")
+            peerObj = add_peer(address)
+
+        send_message(peerObj.to_tuple(), util.Command.GET_PEERS)
+
+def get_wire_versions() -> list[int]:
+    """ Binary wire versions accepted by this node, none unless enabled with the 'wire_format' config option """
+    if config is None or config.get('wire_format', WIRE_FORMAT) != 'binary':
+        return []
+
+    return wire_codec.SUPPORTED_WIRE_VERSIONS
+
+def get_compression_level() -> int:
+    if config is None:
+        return 0
+
+    return config.get('compression_level', COMPRESSION_LEVEL)
+
+def get_compression_threshold() -> int:
+    return config.get('compression_threshold', COMPRESSION_THRESHOLD)
+
+def get_compression_dictionaries() -> list[int]:
+    """ Versions of compression dictionaries accepted by this node, none if compression is disabled """
+    if get_compression_level() == 0:
+        return []
+
+    return wire_codec.COMPRESSION_DICTIONARY_VERSIONS
+
+def get_handshake() -> dict:
+    """ Wire formats accepted by this node, advertised in JSON messages """
+    handshake = {}
+
+    if len(get_wire_versions()) > 0:
+        handshake['wire_versions'] = get_wire_versions()
+
+    if len(get_compression_dictionaries()) > 0:
+        handshake['compression'] = get_compression_dictionaries()
+
+    return handshake
+
+def negotiate_wire_format(peer : Peer, message : dict, version : int, compression_dictionary : int = wire_codec.NO_COMPRESSION) -> None:
+    """ Pick the wire version and compression for messages to the peer based on a message received from it """
+    if version != wire_codec.WIRE_FORMAT_JSON:
+        remote_versions = [version]
+    else:
+        remote_versions = message.get('wire_versions', [])
+
+    if type(remote_versions) == list:
+        peer.set_wire_version(wire_codec.negotiate_wire_version(get_wire_versions(), remote_versions))
+
+    # binary messages below the threshold are not compressed and do not carry the handshake
+    if get_compression_level() == 0:
+        peer.set_compression_dictionary(wire_codec.NO_COMPRESSION)
+    elif compression_dictionary != wire_codec.NO_COMPRESSION:
+        peer.set_compression_dictionary(compression_dictionary)
+    elif version == wire_codec.WIRE_FORMAT_JSON:
+        remote_dictionaries = message.get('compression', [])
+
+        if type(remote_dictionaries) == list:
+            peer.set_compression_dictionary(wire_codec.negotiate_compression(get_compression_dictionaries(), remote_dictionaries))
 
 def send_message(receiver, command, message = {}):
+    peer = get_peer(tuple(receiver))
+
     try:
-        sending_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sending_socket.connect(receiver)
+        version = peer.get_wire_version() if peer is not None else wire_codec.WIRE_FORMAT_JSON
 
-        sending_socket.send(json.dumps({
+        # JSON messages advertise the binary versions, peers switch to binary once they see a common one
+        handshake = get_handshake() if version == wire_codec.WIRE_FORMAT_JSON else {}
+
+        data = wire_codec.encode_message({
             'command': command,
             'port': port,
+            **handshake,
             **message
-        }).encode())
+        }, version)
+
+        if peer is not None and peer.is_compression_enabled() and len(data) >= get_compression_threshold():
+            data = wire_codec.compress_message(data, peer.get_compression_dictionary(), get_compression_level())
+
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sending_socket:
+            start = time.perf_counter()
+
+            sending_socket.settimeout(PEER_CONNECT_TIMEOUT)
+            sending_socket.connect(receiver)
+            sending_socket.settimeout(None)
+
+            connected = time.perf_counter()
+
+            sending_socket.sendall(data)
+
+            finished = time.perf_counter()
+
+        if peer is not None:
+            peer.record_success((connected - start) * 1000, len(data), (finished - connected) * 1000)
+            address_book.record_success(peer.to_string(), (connected - start) * 1000)
 
         util.vprint(f"Successfully sent message {command} to peer {receiver}")
     except Exception as error:
         util.vprint(f"Failed to send message {command} to peer {receiver} - {error}")
 
+        if peer is not None:
+            peer.record_failure()
+            address_book.record_failure(peer.to_string())
+
+            if peer.should_evict():
+                evict_peer(peer)
+
 # handle response to request for all coin txs in a mempool during initial synchronization
 def receive_pending_coin_transactions(pending_txs_obj, sender: str = ''):
     for tx in pending_txs_obj:
@@ -124,10 +383,16 @@ def receive_pending_coin_transactions(pending_txs_obj, sender: str = ''):
 # handle response to request for all proof txs in a mempool during initial synchronization
 def receive_pending_proof_transactions(pending_txs_obj, sender: str = ''):
     for tx in pending_txs_obj:
-        # TODO: Check if tx is valid -- structure and signature
-
-        new_tx = ProofTransaction()
-        new_tx.decode(tx)
+        # TODO: Check if tx is valid -- signature
+
+        try:
+            new_tx = ProofTransaction()
+            new_tx.decode(tx)
+            new_tx.check_validity()
+            validate_proof_tx_parameters(new_tx)
+        except Exception:
+            util.vprint("Received an invalid pending proof transaction")
+            continue
 
         if new_tx.get_id() not in [t.get_id() for t in pending_proof_transactions]:
             pending_proof_transactions.append(new_tx)
@@ -137,39 +402,265 @@ def receive_pending_proof_transactions(pending_txs_obj, sender: str = ''):
 def broadcast_pending_coin_transaction(tx : CoinTransaction, sender : str = ''):
     assert tx.is_signed(), "Unsigned coin transactions cannot be broadcast"
 
-    # TODO: Check if transaction is not already included in mempool
+    if tx.get_id() in [t.get_id() for t in pending_coin_transactions]:
+        return
 
     pending_coin_transactions.append(tx)
 
-    message = { 'tx': tx.encode() }
-
-    for peer in peers:
-        if peer.to_string() != sender:
-            send_message(peer.to_tuple(), util.Command.BROADCAST_PENDING_COIN_TX, message)
+    queue_transaction_broadcast(tx, sender)
 
 # broadcast newly created or received coin transaction to the network
 def broadcast_pending_proof_transaction(tx : CoinTransaction, sender : str = ''):
     assert tx.is_signed(), "Unsigned proof transactions cannot be broadcast"
 
-    # TODO: Check if transaction is not already included in mempool
+    if tx.get_id() in [t.get_id() for t in pending_proof_transactions]:
+        return
 
     pending_proof_transactions.append(tx)
 
-    message = { 'tx': tx.encode() }
+    queue_transaction_broadcast(tx, sender)
 
-    for peer in peers:
-        if peer.to_string() != sender:
-            send_message(peer.to_tuple(), util.Command.BROADCAST_PENDING_PROOF_TX, message)
+# handle a batch of broadcast transactions, known ones are dropped before the costly signature verification
+def receive_pending_tx_batch(coin_txs_obj : list[dict], proof_txs_obj : list[dict], sender : str = ''):
+    known_ids = { tx.get_id() for tx in pending_coin_transactions } | { tx.get_id() for tx in pending_proof_transactions }
+
+    new_txs = []
+
+    for tx_class, txs_obj in [(CoinTransaction, coin_txs_obj), (ProofTransaction, proof_txs_obj)]:
+        for tx_obj in txs_obj:
+            try:
+                new_tx = tx_class()
+                new_tx.decode(tx_obj)
+                new_tx.check_validity()
+
+                # malformed proof requests are dropped before they reach any prover
+                if isinstance(new_tx, ProofTransaction):
+                    validate_proof_tx_parameters(new_tx)
+            except Exception:
+                util.vprint("Received an invalid pending transaction")
+                continue
+
+            if new_tx.get_id() in known_ids:
+                continue
+
+            known_ids.add(new_tx.get_id())
+            new_txs.append(new_tx)
+
+    for tx in verify_transactions(new_txs):
+        # propagate tx to all peers except the sender
+        if isinstance(tx, CoinTransaction):
+            broadcast_pending_coin_transaction(tx, sender)
+        else:
+            broadcast_pending_proof_transaction(tx, sender)
+
+def verify_transactions(txs : list) -> list:
+    """ Return transactions with a valid signature, senders' public keys are parsed once thanks to util.get_verifying_key """
+    valid_txs = []
+
+    for tx in txs:
+        try:
+            if tx.verify_transaction():
+                valid_txs.append(tx)
+        except Exception:
+            util.vprint(f"Received a transaction with invalid signature {tx.get_id().hex()}")
+
+    return valid_txs
+
+def queue_transaction_broadcast(tx, sender : str = '') -> None:
+    """ Queue a transaction to be sent out in the next batch """
+    global tx_batch_thread
+
+    with tx_batch_condition:
+        tx_batch.append((tx, sender))
+
+        if tx_batch_thread is None:
+            tx_batch_thread = threading.Thread(target=run_tx_batcher, daemon=True)
+            tx_batch_thread.start()
+
+        tx_batch_condition.notify()
+
+def run_tx_batcher() -> None:
+    while True:
+        with tx_batch_condition:
+            while len(tx_batch) == 0:
+                tx_batch_condition.wait()
+
+            # collect more transactions until the batch is full or the delay runs out
+            deadline = time.monotonic() + TX_BATCH_DELAY
+
+            while len(tx_batch) < TX_BATCH_MAX_SIZE:
+                remaining = deadline - time.monotonic()
+
+                if remaining <= 0:
+                    break
+
+                tx_batch_condition.wait(remaining)
+
+            batch = tx_batch[:TX_BATCH_MAX_SIZE]
+            del tx_batch[:TX_BATCH_MAX_SIZE]
+
+        send_tx_batch(batch)
+
+def flush_transaction_broadcasts() -> None:
+    """ Send out all queued transactions right away, e.g. before exiting """
+    with tx_batch_condition:
+        batch = list(tx_batch)
+        tx_batch.clear()
+
+    for index in range(0, len(batch), TX_BATCH_MAX_SIZE):
+        send_tx_batch(batch[index:index + TX_BATCH_MAX_SIZE])
+
+def send_tx_batch(batch : list[tuple]) -> None:
+    encoded = [(tx.encode(), isinstance(tx, CoinTransaction), sender) for tx, sender in batch]
+
+    for peer in get_available_peers():
+        coin_txs = [tx_obj for tx_obj, is_coin_tx, sender in encoded if is_coin_tx and sender != peer.to_string()]
+        proof_txs = [tx_obj for tx_obj, is_coin_tx, sender in encoded if not is_coin_tx and sender != peer.to_string()]
+
+        if len(coin_txs) == 0 and len(proof_txs) == 0:
+            continue
+
+        send_message(peer.to_tuple(), util.Command.BROADCAST_PENDING_TXS, { 'coin_txs': coin_txs, 'proof_txs': proof_txs })
 
 # broadcast newly generated or received block to the network
+# peers receive a compact block and rebuild it from their mempools
 def broadcast_block(block : Block, sender : str = '') -> None:
-    blockchain.append(block)
+    append_block(block)
+
+    compact_block = CompactBlock()
+    compact_block.setup(block)
 
-    message = { 'block': block.encode() }
+    message = { 'compact_block': compact_block.encode() }
 
-    for peer in peers:
+    for peer in get_available_peers():
         if peer.to_string() != sender:
-            send_message(peer.to_tuple(), util.Command.BROADCAST_BLOCK, message)
+            send_message(peer.to_tuple(), util.Command.BROADCAST_COMPACT_BLOCK, message)
+
+def append_block(block : Block) -> None:
+    """ Append a verified block to the chain, its proofs are kept to be served to peers """
+    proof_store.store_proofs(block.get_body().get_proof_txs())
+    blockchain.append(block)
+
+def add_pending_compact_block(compact_block : CompactBlock) -> None:
+    """ Keep a compact block until its missing transactions arrive, the oldest are dropped beyond the limit """
+    with pending_compact_blocks_lock:
+        prune_pending_compact_blocks()
+
+        if compact_block.get_id() <= blockchain[-1].get_id():
+            return
+
+        pending_compact_blocks.pop(compact_block.get_current_block_hash(), None)
+        pending_compact_blocks[compact_block.get_current_block_hash()] = (compact_block, util.get_current_time())
+
+        # dictionaries keep insertion order, so the first entry is the oldest one
+        while len(pending_compact_blocks) > PENDING_COMPACT_BLOCKS_MAX_COUNT:
+            del pending_compact_blocks[next(iter(pending_compact_blocks))]
+
+def take_pending_compact_block(block_hash : bytes) -> CompactBlock:
+    """ Remove and return the compact block waiting for its transactions, None if it is not awaited anymore """
+    with pending_compact_blocks_lock:
+        prune_pending_compact_blocks()
+
+        entry = pending_compact_blocks.pop(block_hash, None)
+
+    return entry[0] if entry is not None else None
+
+def prune_pending_compact_blocks() -> None:
+    """ Drop compact blocks which timed out or are no longer ahead of the chain, the caller holds the lock """
+    current_time = util.get_current_time()
+    latest_block_id = blockchain[-1].get_id()
+
+    for block_hash, (compact_block, received_time) in list(pending_compact_blocks.items()):
+        if compact_block.get_id() <= latest_block_id or current_time - received_time > PENDING_COMPACT_BLOCK_TIMEOUT:
+            del pending_compact_blocks[block_hash]
+
+def request_proofs(digests : list[bytes], peer_address : tuple) -> None:
+    """ Request proofs in chunks sent concurrently, the peer serves each chunk on its own connection """
+    chunks = [digests[index:index + PROOF_REQUEST_SIZE] for index in range(0, len(digests), PROOF_REQUEST_SIZE)]
+    threads = [threading.Thread(target=send_message, args=(peer_address, util.Command.GET_PROOFS, { 'digests': [digest.hex() for digest in chunk] })) for chunk in chunks]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+def add_block_awaiting_proofs(block : Block, sender_address : tuple, relay : bool) -> bool:
+    """
+    Keep a block until its proofs arrive, the caller holds blocks_awaiting_proofs_lock. Returns False if
+    the block is not kept, blocks far above the chain tip are left to the synchronization instead.
+    """
+    latest_block_id = blockchain[-1].get_id()
+
+    if block.get_id() <= latest_block_id or block.get_id() > latest_block_id + BLOCKS_AWAITING_PROOFS_WINDOW:
+        return False
+
+    block_hash = block.get_current_block_hash()
+
+    # announced again, e.g. relayed by another peer, which has the proofs as well
+    if block_hash in blocks_awaiting_proofs:
+        blocks_awaiting_proofs[block_hash].add_holder(sender_address)
+        return True
+
+    blocks_awaiting_proofs[block_hash] = AwaitedBlock(block, sender_address, relay, util.get_current_time())
+
+    # blocks furthest above the chain tip are accepted last, so they are dropped first
+    while len(blocks_awaiting_proofs) > BLOCKS_AWAITING_PROOFS_MAX_COUNT:
+        furthest_block_hash = max(blocks_awaiting_proofs, key=lambda awaited_hash: blocks_awaiting_proofs[awaited_hash].get_block().get_id())
+        del blocks_awaiting_proofs[furthest_block_hash]
+
+    return block_hash in blocks_awaiting_proofs
+
+def retry_proof_requests() -> None:
+    """
+    Request missing proofs of blocks which did not get them in time again, preferably from another peer
+    which has the block. Blocks are dropped once their proofs were requested PROOF_REQUEST_ATTEMPTS times.
+    """
+    current_time = util.get_current_time()
+    requests = []
+
+    with blocks_awaiting_proofs_lock:
+        for block_hash, awaited_block in list(blocks_awaiting_proofs.items()):
+            if current_time - awaited_block.get_request_time() <= PROOF_REQUEST_TIMEOUT:
+                continue
+
+            block = awaited_block.get_block()
+            missing_digests = proof_store.attach_proofs(block.get_body().get_proof_txs())
+
+            # complete, waits for an earlier block
+            if len(missing_digests) == 0:
+                continue
+
+            if awaited_block.get_attempts() >= PROOF_REQUEST_ATTEMPTS:
+                util.vprint(f"Block {block.get_id()} did not receive its proofs after {awaited_block.get_attempts()} requests, dropping it")
+                del blocks_awaiting_proofs[block_hash]
+                continue
+
+            candidate_addresses = [peer.to_tuple() for peer in get_available_peers() if peer.get_latest_block_id() >= block.get_id()]
+            peer_address = awaited_block.choose_peer(candidate_addresses)
+            awaited_block.record_request(peer_address, current_time)
+            requests.append((missing_digests, peer_address))
+
+            util.vprint(f"Block {block.get_id()} is still missing {len(missing_digests)} proof(s), requesting them from {peer_address[0]}:{peer_address[1]}")
+
+    for missing_digests, peer_address in requests:
+        request_proofs(missing_digests, peer_address)
+
+def is_proof_awaited(digest : bytes) -> bool:
+    with blocks_awaiting_proofs_lock:
+        return any(digest == tx.get_proof_digest() for awaited_block in blocks_awaiting_proofs.values() for tx in awaited_block.get_block().get_body().get_proof_txs())
+
+def get_encoded_block(block_id : int, include_proofs : bool = True) -> wire_codec.PreEncoded:
+    """ Cached encoding of a block in the chain, raises IndexError for unknown ids """
+    return block_cache.get(blockchain[block_id], include_proofs)
+
+def get_block_by_hash(block_hash : bytes) -> Block:
+    # recently announced blocks are at the end of the chain
+    for block in reversed(blockchain):
+        if block.get_current_block_hash() == block_hash:
+            return block
+
+    return None
 
 def get_pending_block_integrity(state_tree : StateTree) -> str:
     integrity = state_tree.get_hash()
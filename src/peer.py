@@ -5,22 +5,44 @@
 # ####################################################################################################
 
 from encodeable import Encodeable
+from wire_codec import WIRE_FORMAT_JSON, NO_COMPRESSION
+import util
+
+PEER_BACKOFF_BASE = 500         # ms, backoff after the first failure, doubled with every next one
+PEER_BACKOFF_MAX = 60000        # ms
+PEER_MAX_FAILURES = 5           # consecutive failures after which the peer is evicted
+PEER_EWMA_WEIGHT = 0.2          # weight of the newest sample in moving averages
+PEER_DEFAULT_RTT = 200          # ms, assumed for peers which were not measured yet
 
-# TODO: Add boolean whether active
 class Peer(Encodeable):
     __ip_address: str
     __port: int
     __latest_block_id: int
+    __active: bool
+    __rtt: float                # exponentially weighted moving average of round trip time in ms
+    __throughput: float         # exponentially weighted moving average of upload speed in bytes per second
+    __failure_count: int        # number of consecutive failed sends
+    __backoff_until: int        # timestamp in ms until which the peer is not contacted
+    __last_seen: int            # timestamp in ms of the last successful contact
+    __wire_version: int         # negotiated wire codec version, WIRE_FORMAT_JSON until the peer advertises another
+    __compression_dictionary: int   # version of the dictionary large messages to the peer are compressed with, negotiated like the wire version
 
     def __init__(self):
-        pass
+        self.__latest_block_id = 0
+        self.__active = True
+        self.__rtt = None
+        self.__throughput = None
+        self.__failure_count = 0
+        self.__backoff_until = 0
+        self.__last_seen = 0
+        self.__wire_version = WIRE_FORMAT_JSON
+        self.__compression_dictionary = NO_COMPRESSION
 
     def setup_from_string(self, ip_address_with_port: str) -> None:
         ip_address, port = ip_address_with_port.split(":")
 
         self.__ip_address = ip_address
         self.__port = int(port)
-        self.__latest_block_id = 0
 
     def setup_from_tuple(self, tuple) -> None:
         self.__ip_address = tuple[0]
@@ -32,6 +54,74 @@ class Peer(Encodeable):
     def get_latest_block_id(self):
         return self.__latest_block_id
 
+    def record_success(self, rtt : float, bytes_sent : int = 0, duration : float = 0) -> None:
+        """ Record a successful exchange with round trip time in ms and optionally upload of bytes_sent in duration ms """
+        self.mark_seen()
+
+        self.__rtt = rtt if self.__rtt is None else (1 - PEER_EWMA_WEIGHT) * self.__rtt + PEER_EWMA_WEIGHT * rtt
+
+        if bytes_sent > 0 and duration > 0:
+            throughput = bytes_sent / (duration / 1000)
+            self.__throughput = throughput if self.__throughput is None else (1 - PEER_EWMA_WEIGHT) * self.__throughput + PEER_EWMA_WEIGHT * throughput
+
+    def record_failure(self) -> None:
+        """ Record a failed exchange and postpone further contact with exponential backoff """
+        self.__failure_count += 1
+        self.__active = False
+
+        backoff = min(PEER_BACKOFF_BASE * 2 ** (self.__failure_count - 1), PEER_BACKOFF_MAX)
+        self.__backoff_until = util.get_current_time() + backoff
+
+    def mark_seen(self) -> None:
+        """ Record that the peer is reachable, e.g. because it has contacted us """
+        self.__active = True
+        self.__failure_count = 0
+        self.__backoff_until = 0
+        self.__last_seen = util.get_current_time()
+
+    def is_active(self) -> bool:
+        return self.__active
+
+    def is_available(self) -> bool:
+        """ Return whether the peer is not in a backoff period """
+        return util.get_current_time() >= self.__backoff_until
+
+    def should_evict(self) -> bool:
+        return self.__failure_count >= PEER_MAX_FAILURES
+
+    def get_rtt(self) -> float:
+        return self.__rtt
+
+    def get_throughput(self) -> float:
+        return self.__throughput
+
+    def get_failure_count(self) -> int:
+        return self.__failure_count
+
+    def get_last_seen(self) -> int:
+        return self.__last_seen
+
+    def set_wire_version(self, version : int) -> None:
+        self.__wire_version = version
+
+    def get_wire_version(self) -> int:
+        return self.__wire_version
+
+    def set_compression_dictionary(self, version : int) -> None:
+        self.__compression_dictionary = version
+
+    def get_compression_dictionary(self) -> int:
+        return self.__compression_dictionary
+
+    def is_compression_enabled(self) -> bool:
+        return self.__compression_dictionary != NO_COMPRESSION
+
+    def get_score(self) -> float:
+        """ Return peer quality score, higher is better -- prefers low latency and penalizes failures """
+        rtt = self.__rtt if self.__rtt is not None else PEER_DEFAULT_RTT
+
+        return 1000 / (1 + rtt) / (1 + self.__failure_count)
+
     def to_tuple(self):
         return (self.__ip_address, self.__port)
 
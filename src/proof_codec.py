@@ -0,0 +1,154 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import json
+import struct
+
+PROOF_ENCODING_VERSION = 1
+FIELD_ELEMENT_SIZE = 32     # bytes, big endian
+
+FLAG_PROOF_LIST = 0x01      # proofs of a batch request, encoded from a JSON list
+
+SCHEME_RAW = 0              # proofs of other schemes are kept as canonical JSON
+SCHEME_G16 = 1
+SCHEME_MOCK = 2
+
+CURVE_NONE = 0
+CURVE_BN128 = 1
+
+G16_POINT_ELEMENTS = 8      # field elements of the a (G1), b (G2) and c (G1) points
+
+def encode_field_element(value : str) -> bytes:
+    number = int(value, 16)
+
+    if number < 0 or number >= 1 << (8 * FIELD_ELEMENT_SIZE):
+        raise ValueError("Field element does not fit into 32 bytes")
+
+    return number.to_bytes(FIELD_ELEMENT_SIZE, 'big')
+
+def decode_field_element(data : bytes) -> str:
+    return f"0x{int.from_bytes(data, 'big'):064x}"
+
+def encode_proof(proof : str) -> bytes:
+    """
+    Canonical binary encoding of a ZoKrates proof or of a JSON list of proofs. Points and public inputs
+    are stored as fixed-width field elements, so the same proof always has the same encoding regardless
+    of the formatting of its JSON. Raises ValueError for malformed proofs.
+    """
+    try:
+        proof_json = json.loads(proof)
+    except (json.JSONDecodeError, TypeError) as e:
+        raise ValueError(f"Proof is not valid JSON - {e}")
+
+    is_list = type(proof_json) == list
+    proofs = proof_json if is_list else [proof_json]
+
+    data = bytearray(struct.pack('>BBH', PROOF_ENCODING_VERSION, FLAG_PROOF_LIST if is_list else 0, len(proofs)))
+
+    for proof_obj in proofs:
+        data += encode_single_proof(proof_obj)
+
+    return bytes(data)
+
+def encode_single_proof(proof_obj : dict) -> bytes:
+    try:
+        scheme, curve = proof_obj['scheme'], proof_obj['curve']
+        inputs = b''.join(encode_field_element(value) for value in proof_obj['inputs'])
+        input_count = len(proof_obj['inputs'])
+
+        if scheme == 'g16' and curve == 'bn128':
+            a, b, c = proof_obj['proof']['a'], proof_obj['proof']['b'], proof_obj['proof']['c']
+            elements = [a[0], a[1], b[0][0], b[0][1], b[1][0], b[1][1], c[0], c[1]]
+
+            return struct.pack('>BBH', SCHEME_G16, CURVE_BN128, input_count) + b''.join(encode_field_element(value) for value in elements) + inputs
+
+        if scheme == 'mock' and curve == 'none':
+            return struct.pack('>BBH', SCHEME_MOCK, CURVE_NONE, input_count) + bytes.fromhex(proof_obj['proof']['digest']) + inputs
+    except (KeyError, IndexError, TypeError, ValueError):
+        pass
+
+    serialized_proof = json.dumps(proof_obj, sort_keys=True, separators=(',', ':')).encode()
+
+    return struct.pack('>BI', SCHEME_RAW, len(serialized_proof)) + serialized_proof
+
+def decode_proof(data : bytes) -> str:
+    """ Convert the binary encoding back to the ZoKrates JSON, raises ValueError for malformed data """
+    try:
+        version, flags, proof_count = struct.unpack_from('>BBH', data, 0)
+        offset = struct.calcsize('>BBH')
+
+        if version != PROOF_ENCODING_VERSION:
+            raise ValueError(f"Unsupported proof encoding version {version}")
+
+        proofs = []
+
+        for _ in range(proof_count):
+            proof_obj, offset = decode_single_proof(data, offset)
+            proofs.append(proof_obj)
+    except struct.error:
+        raise ValueError("Proof encoding is truncated")
+
+    if offset != len(data):
+        raise ValueError("Proof encoding contains trailing data")
+
+    if flags & FLAG_PROOF_LIST:
+        return json.dumps(proofs)
+
+    if proof_count != 1:
+        raise ValueError("Proof encoding contains several proofs without being a list")
+
+    return json.dumps(proofs[0])
+
+def decode_single_proof(data : bytes, offset : int) -> tuple[dict, int]:
+    scheme = data[offset] if offset < len(data) else None
+
+    if scheme == SCHEME_RAW:
+        length, = struct.unpack_from('>I', data, offset + 1)
+        offset += struct.calcsize('>BI')
+
+        if offset + length > len(data):
+            raise ValueError("Proof encoding is truncated")
+
+        return json.loads(data[offset:offset + length]), offset + length
+
+    _, curve, input_count = struct.unpack_from('>BBH', data, offset)
+    offset += struct.calcsize('>BBH')
+
+    if scheme == SCHEME_G16 and curve == CURVE_BN128:
+        elements = read_field_elements(data, offset, G16_POINT_ELEMENTS)
+        offset += G16_POINT_ELEMENTS * FIELD_ELEMENT_SIZE
+
+        proof_obj = {
+            'scheme': 'g16',
+            'curve': 'bn128',
+            'proof': {
+                'a': elements[0:2],
+                'b': [elements[2:4], elements[4:6]],
+                'c': elements[6:8]
+            }
+        }
+    elif scheme == SCHEME_MOCK and curve == CURVE_NONE:
+        if offset + 32 > len(data):
+            raise ValueError("Proof encoding is truncated")
+
+        proof_obj = {
+            'scheme': 'mock',
+            'curve': 'none',
+            'proof': { 'digest': data[offset:offset + 32].hex() }
+        }
+        offset += 32
+    else:
+        raise ValueError(f"Unknown proof scheme {scheme} or curve {curve}")
+
+    proof_obj['inputs'] = read_field_elements(data, offset, input_count)
+
+    return proof_obj, offset + input_count * FIELD_ELEMENT_SIZE
+
+def read_field_elements(data : bytes, offset : int, count : int) -> list[str]:
+    if offset + count * FIELD_ELEMENT_SIZE > len(data):
+        raise ValueError("Proof encoding is truncated")
+
+    return [decode_field_element(data[offset + index * FIELD_ELEMENT_SIZE:offset + (index + 1) * FIELD_ELEMENT_SIZE]) for index in range(count)]
@@ -0,0 +1,121 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import hashlib
+import threading
+
+PROOF_REQUEST_SIZE = 16 # proofs requested from a peer in a single message
+
+def get_proof_digest(proof : bytes) -> bytes:
+    """ SHA256 hash of the compact proof encoding, used to reference proofs stored outside of blocks """
+    return hashlib.sha256(proof).digest()
+
+class ProofStore:
+    """
+    Content-addressed storage of proofs. Blocks reference proofs of their proof transactions by digest
+    and the proofs themselves travel as separate sidecars, so nodes which do not verify proofs never
+    download them. Anything stored is checked against its digest, so proofs can come from any peer.
+    """
+    __proofs: dict[bytes, bytes]    # proof digest -> compact proof
+    __lock: threading.Lock
+
+    def __init__(self):
+        self.__proofs = {}
+        self.__lock = threading.Lock()
+
+    def put(self, proof : bytes) -> bytes:
+        digest = get_proof_digest(proof)
+
+        with self.__lock:
+            self.__proofs[digest] = proof
+
+        return digest
+
+    def get(self, digest : bytes) -> bytes:
+        """ Return the proof or None if it is not stored """
+        with self.__lock:
+            return self.__proofs.get(digest)
+
+    def store_proofs(self, proof_txs : list) -> None:
+        """ Keep attached proofs of transactions, e.g. of a newly produced or verified block """
+        for tx in proof_txs:
+            if tx.get_compact_proof() is not None:
+                self.put(tx.get_compact_proof())
+
+    def attach_proofs(self, proof_txs : list) -> list[bytes]:
+        """ Attach stored proofs to transactions which only reference them, returns digests of proofs still missing """
+        missing_digests = []
+
+        for tx in proof_txs:
+            if tx.get_compact_proof() is not None or tx.get_proof_digest() is None:
+                continue
+
+            proof = self.get(tx.get_proof_digest())
+
+            if proof is None:
+                missing_digests.append(tx.get_proof_digest())
+            else:
+                tx.attach_proof(proof)
+
+        return missing_digests
+
+    def __contains__(self, digest : bytes) -> bool:
+        with self.__lock:
+            return digest in self.__proofs
+
+    def __len__(self) -> int:
+        return len(self.__proofs)
+
+class AwaitedBlock:
+    """ Received block waiting for its proofs, with the peers which sent it and the peers asked for its proofs """
+    __block: object
+    __sender_address: tuple     # peer the block came from first, it is not relayed back to it
+    __relay: bool               # whether to relay the block once it is accepted
+    __request_time: int         # ms, time of the last proof request
+    __attempts: int             # proof requests sent so far
+    __holders: list[tuple]      # addresses of peers which sent the block, so they have its proofs
+    __asked: set[tuple]         # addresses of peers which were asked for the proofs
+
+    def __init__(self, block, sender_address : tuple, relay : bool, request_time : int):
+        self.__block = block
+        self.__sender_address = sender_address
+        self.__relay = relay
+        self.__request_time = request_time
+        self.__attempts = 1
+        self.__holders = [sender_address]
+        self.__asked = { sender_address }
+
+    def get_block(self):
+        return self.__block
+
+    def get_sender_address(self) -> tuple:
+        return self.__sender_address
+
+    def is_relayed(self) -> bool:
+        return self.__relay
+
+    def get_request_time(self) -> int:
+        return self.__request_time
+
+    def get_attempts(self) -> int:
+        return self.__attempts
+
+    def add_holder(self, address : tuple) -> None:
+        if address not in self.__holders:
+            self.__holders.append(address)
+
+    def choose_peer(self, candidate_addresses : list[tuple]) -> tuple:
+        """ Peer to ask for the proofs again, a holder or candidate not asked yet is preferred over the ones already asked """
+        for address in self.__holders + candidate_addresses:
+            if address not in self.__asked:
+                return address
+
+        return self.__holders[(self.__attempts - 1) % len(self.__holders)]
+
+    def record_request(self, address : tuple, request_time : int) -> None:
+        self.__asked.add(address)
+        self.__attempts += 1
+        self.__request_time = request_time
@@ -4,21 +4,37 @@
 # Samuel Olekšák
 # ####################################################################################################
 
+import json
+import base64
 import hashlib
-import ecdsa
+import threading
 
 from encodeable import Encodeable
-from bind_zokrates import Zokrates
+from proof_store import get_proof_digest
+from proof_codec import encode_proof, decode_proof
+import prover_backend
 import util
 
+BATCH_SEPARATOR = ','   # separates parameter sets of a batch proof request
+MAX_BATCH_SIZE = 1000   # parameter sets in a single proof request
+
 class ProofTransaction(Encodeable):
+    """
+    Request for proofs of a circuit. A batch request lists several parameter sets separated by
+    BATCH_SEPARATOR under a single signature, its proof is then a JSON list with a proof per set.
+    Transactions in blocks may carry only the digest of their proof, which is fetched separately.
+    Proofs are kept in the compact binary encoding of proof_codec and converted to the ZoKrates JSON
+    only when they are verified.
+    """
     __id: bytes             # SHA256 hash (32 bytes)
     __address_from: bytes   # SECP256k1 public key in SEC1 format (33 bytes)
-    __proof: str            # encoded JSON
+    __proof: bytes          # compact binary encoding, None if unproven or not fetched yet
+    __proof_digest: bytes   # SHA256 hash of the compact proof (32 bytes), None if unproven
     __circuit_hash: bytes   # SHA256 hash (32 bytes)
     __parameters: str
-    __complexity: int       # number of constraints
+    __complexity: int       # number of constraints of a single proof
     __signature: bytes      # SECP256k1 signature (64 bytes)
+    __proof_parts: list     # proofs of parameter sets generated so far, not encoded
 
     def __init__(self) -> None:
         pass
@@ -30,10 +46,12 @@ class ProofTransaction(Encodeable):
         self.__id = hashlib.sha256(serialized_tx).digest()
         self.__address_from = address_from
         self.__proof = None
+        self.__proof_digest = None
         self.__circuit_hash = circuit_hash
         self.__parameters = parameters
         self.__complexity = complexity
         self.__signature = None
+        self.__proof_parts = [None] * self.get_batch_size()
 
         self.check_validity()
 
@@ -47,6 +65,12 @@ class ProofTransaction(Encodeable):
         if self.__complexity <= 0:
             raise ValueError("Complexity must be a positive integer")
 
+        if type(self.__parameters) != str:
+            raise TypeError("Parameters must be a string")
+
+        if self.get_batch_size() > MAX_BATCH_SIZE:
+            raise ValueError(f"Batch contains more than {MAX_BATCH_SIZE} parameter sets")
+
     def hash(self) -> bytes:
         serialized_tx = "|".join([self.__id.hex(), self.__address_from.hex(), self.__circuit_hash.hex(), self.__parameters, str(self.__complexity)]).encode()
 
@@ -64,7 +88,7 @@ class ProofTransaction(Encodeable):
         self.__signature = private_key.sign(self.hash())
 
     def verify_transaction(self) -> bool:
-        if not ecdsa.VerifyingKey.from_string(self.__address_from, curve=ecdsa.SECP256k1).verify(self.__signature, self.hash()):
+        if not util.get_verifying_key(self.__address_from).verify(self.__signature, self.hash()):
             return False
 
         return True
@@ -81,6 +105,15 @@ class ProofTransaction(Encodeable):
     def get_parameters(self) -> str:
         return self.__parameters
 
+    def get_parameter_sets(self) -> list[str]:
+        return self.__parameters.split(BATCH_SEPARATOR)
+
+    def get_batch_size(self) -> int:
+        return self.__parameters.count(BATCH_SEPARATOR) + 1
+
+    def is_batch(self) -> bool:
+        return self.get_batch_size() > 1
+
     def get_complexity(self) -> int:
         return self.__complexity
 
@@ -88,36 +121,138 @@ class ProofTransaction(Encodeable):
         return self.__address_from
 
     def get_proof(self) -> str:
+        """ ZoKrates JSON of the proof, a JSON list of proofs for a batch """
+        if self.__proof is None:
+            return None
+
+        return decode_proof(self.__proof)
+
+    def get_compact_proof(self) -> bytes:
         return self.__proof
 
-    def encode(self) -> dict:
-        return {
+    def get_proof_digest(self) -> bytes:
+        return self.__proof_digest
+
+    def is_proven(self) -> bool:
+        """ The proof is known to exist, although it might not be attached """
+        return self.__proof_digest is not None
+
+    def attach_proof(self, proof : bytes) -> None:
+        """ Attach a compact proof fetched separately, it has to match the digest referenced by the transaction """
+        if get_proof_digest(proof) != self.__proof_digest:
+            raise ValueError("Proof does not match the referenced digest")
+
+        self.__proof = proof
+
+    def get_proofs(self) -> list[str]:
+        """ Proof of each parameter set or None if the proof is not attached """
+        if self.__proof is None:
+            return None
+
+        if not self.is_batch():
+            return [self.get_proof()]
+
+        return [json.dumps(proof) for proof in json.loads(self.get_proof())]
+
+    def __set_proof_part(self, index : int, proof : str) -> None:
+        self.__proof_parts[index] = proof
+
+        if all(part is not None for part in self.__proof_parts):
+            if self.is_batch():
+                self.__proof = encode_proof(json.dumps([json.loads(part) for part in self.__proof_parts]))
+            else:
+                self.__proof = encode_proof(self.__proof_parts[0])
+
+            self.__proof_digest = get_proof_digest(self.__proof)
+
+    def encode(self, include_proof : bool = True) -> dict:
+        """ Without the proof, a proven transaction references it by its digest instead """
+        proof = self.__proof if include_proof else None
+
+        obj = {
             'id': self.__id.hex(),
             'address_from': self.__address_from.hex(),
-            'proof': self.__proof if self.__proof is not None else '',
+            'proof': base64.b64encode(proof).decode() if proof is not None else '',
             'circuit_hash': self.__circuit_hash.hex(),
             'parameters': self.__parameters,
             'complexity': self.__complexity,
             'signature': self.__signature.hex()
         }
 
+        if proof is None and self.__proof_digest is not None:
+            obj['proof_digest'] = self.__proof_digest.hex()
+
+        return obj
+
     def decode(self, obj : dict) -> None:
         self.__id = bytes.fromhex(obj['id'])
         self.__address_from = bytes.fromhex(obj['address_from'])
-        self.__proof = None if obj['proof'] == '' else obj['proof']
+        self.__proof = None if obj['proof'] == '' else self.__decode_proof(obj['proof'])
+
+        if self.__proof is not None:
+            self.__proof_digest = get_proof_digest(self.__proof)
+        elif obj.get('proof_digest', '') != '':
+            self.__proof_digest = bytes.fromhex(obj['proof_digest'])
+            util.validate_hash(self.__proof_digest)
+        else:
+            self.__proof_digest = None
+
         self.__circuit_hash = bytes.fromhex(obj['circuit_hash'])
         self.__parameters = obj['parameters']
         self.__complexity = obj['complexity']
         self.__signature = bytes.fromhex(obj['signature'])
+        self.__proof_parts = [None] * self.get_batch_size()
+
+    @staticmethod
+    def __decode_proof(proof : str) -> bytes:
+        """ Proofs are transmitted in base64, the ZoKrates JSON of older blocks is converted """
+        if proof.lstrip().startswith(('{', '[')):
+            return encode_proof(proof)
+
+        return base64.b64decode(proof, validate=True)
 
     def __str__(self) -> str:
-        if self.__proof is None:
-            return f"{self.__id.hex()[0:6]}…: {self.__address_from.hex()[0:6]}… --({self.__parameters})--> {self.__circuit_hash.hex()[0:6]}… @ {self.__complexity} constraints ({util.Color.RED()}unproven{util.Color.RESET()})"
+        parameters = self.__parameters if not self.is_batch() else f"{self.get_batch_size()} parameter sets"
+
+        if self.__proof_digest is None:
+            return f"{self.__id.hex()[0:6]}…: {self.__address_from.hex()[0:6]}… --({parameters})--> {self.__circuit_hash.hex()[0:6]}… @ {self.__complexity} constraints ({util.Color.RED()}unproven{util.Color.RESET()})"
         else:
-            return f"{self.__id.hex()[0:6]}…: {self.__address_from.hex()[0:6]}… --({self.__parameters})--> {self.__circuit_hash.hex()[0:6]}… @ {self.__complexity} constraints ({util.Color.GREEN()}proven{util.Color.RESET()})"
+            return f"{self.__id.hex()[0:6]}…: {self.__address_from.hex()[0:6]}… --({parameters})--> {self.__circuit_hash.hex()[0:6]}… @ {self.__complexity} constraints ({util.Color.GREEN()}proven{util.Color.RESET()})"
+
+    def prove(self, block_metadata, circuit_folder, cancel_event : threading.Event = None) -> None:
+        batch = self.prepare_batch(circuit_folder)
+
+        try:
+            for index in range(self.get_batch_size()):
+                self.prove_witness(self.compute_witness(block_metadata, circuit_folder, index, batch, cancel_event), index, cancel_event)
+        finally:
+            self.close_batch(batch)
+
+    def prepare_batch(self, circuit_folder):
+        """ Setup shared by all parameter sets of a batch request, None for a single proof """
+        return prover_backend.get_backend().prepare_batch(circuit_folder) if self.is_batch() else None
+
+    def close_batch(self, batch) -> None:
+        if batch is not None:
+            prover_backend.get_backend().close_batch(batch)
+
+    def compute_witness(self, block_metadata, circuit_folder, index : int = 0, batch = None, cancel_event : threading.Event = None):
+        """ First stage of proving the parameter set at index, the result is passed to prove_witness or discard_witness """
+        return prover_backend.get_backend().compute_witness(block_metadata, circuit_folder, self.get_parameter_sets()[index], batch, cancel_event)
+
+    def prove_witness(self, witness, index : int = 0, cancel_event : threading.Event = None) -> None:
+        """ The proof is complete once every parameter set is proven """
+        self.__set_proof_part(index, prover_backend.get_backend().prove_witness(witness, cancel_event))
+
+    def discard_witness(self, witness) -> None:
+        prover_backend.get_backend().discard_witness(witness)
+
+    def validate(self, block_metadata, circuit_folder, cancel_event : threading.Event = None) -> bool:
+        proofs = self.get_proofs()
+
+        if proofs is None or len(proofs) != self.get_batch_size():
+            return False
 
-    def prove(self, block_metadata, circuit_folder) -> None:
-        self.__proof = Zokrates.generate_proof(block_metadata, circuit_folder, self.__parameters)
+        backend = prover_backend.get_backend()
 
-    def validate(self, block_metadata, circuit_folder) -> bool:
-        return Zokrates.verify_proof(block_metadata, circuit_folder, self.__proof, self.__parameters)
+        return all(backend.verify_proof(block_metadata, circuit_folder, proof, parameters, cancel_event) for proof, parameters in zip(proofs, self.get_parameter_sets()))
@@ -0,0 +1,208 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+
+from bind_zokrates import Zokrates, Witness, ProvingBatch, read_manifest
+
+class ProverBackend(ABC):
+    """ Generates and verifies proofs of circuits, used by proof transactions """
+
+    @abstractmethod
+    def generate_proof(self, block_metadata : str, circuit_folder : str, parameters : str, cancel_event : threading.Event = None) -> str:
+        """ Raises an Exception if proving fails or is cancelled by setting cancel_event """
+        pass
+
+    @abstractmethod
+    def verify_proof(self, block_metadata : str, circuit_folder : str, proof : str, parameters : str, cancel_event : threading.Event = None) -> bool:
+        """ Raises an Exception if verification cannot be completed, e.g. when it is cancelled by setting cancel_event """
+        pass
+
+    @abstractmethod
+    def get_constraint_count(self, circuit_folder : str) -> int:
+        """ Number of constraints of a circuit, raises an Exception if it cannot be determined """
+        pass
+
+    def prepare_batch(self, circuit_folder : str):
+        """ Setup shared by the parameter sets of a batch proof request, None if the backend has nothing to share """
+        return None
+
+    def close_batch(self, batch) -> None:
+        """ Release the setup of a batch once all of its witnesses are proven or discarded """
+        pass
+
+    def compute_witness(self, block_metadata : str, circuit_folder : str, parameters : str, batch = None, cancel_event : threading.Event = None):
+        """ First stage of pipelined proving, backends which cannot split proving do all the work in prove_witness """
+        return (block_metadata, circuit_folder, parameters)
+
+    def prove_witness(self, witness, cancel_event : threading.Event = None) -> str:
+        """ Second stage of pipelined proving, takes the result of compute_witness """
+        return self.generate_proof(*witness, cancel_event)
+
+    def discard_witness(self, witness) -> None:
+        """ Release a witness which will not be proven """
+        pass
+
+class ZokratesBackend(ProverBackend):
+    """ Default backend, calls the ZoKrates command line interface """
+
+    def generate_proof(self, block_metadata : str, circuit_folder : str, parameters : str, cancel_event : threading.Event = None) -> str:
+        return Zokrates.generate_proof(block_metadata, circuit_folder, parameters, cancel_event)
+
+    def prepare_batch(self, circuit_folder : str) -> ProvingBatch:
+        return Zokrates.prepare_batch(circuit_folder)
+
+    def close_batch(self, batch : ProvingBatch) -> None:
+        batch.close()
+
+    def compute_witness(self, block_metadata : str, circuit_folder : str, parameters : str, batch : ProvingBatch = None, cancel_event : threading.Event = None) -> Witness:
+        return Zokrates.compute_witness(block_metadata, circuit_folder, parameters, cancel_event, batch)
+
+    def prove_witness(self, witness : Witness, cancel_event : threading.Event = None) -> str:
+        return Zokrates.prove_witness(witness, cancel_event)
+
+    def discard_witness(self, witness : Witness) -> None:
+        witness.discard()
+
+    def verify_proof(self, block_metadata : str, circuit_folder : str, proof : str, parameters : str, cancel_event : threading.Event = None) -> bool:
+        return Zokrates.verify_proof(block_metadata, circuit_folder, proof, parameters, cancel_event)
+
+    def get_constraint_count(self, circuit_folder : str) -> int:
+        return Zokrates.get_constraint_count(circuit_folder)
+
+class MockBackend(ProverBackend):
+    """
+    Fast deterministic stand-in for ZoKrates for benchmarks and load tests. Proofs are hashes of the
+    circuit, parameters and block metadata in the ZoKrates proof layout, so they are not zero-knowledge
+    and anybody can forge them. Proving and verification wait according to a latency model of
+    a base time plus time per constraint, with optional jitter derived from the proven statement.
+    Constraint counts come from the configuration, or from a manifest written by an earlier ZoKrates
+    run, so ZoKrates is not needed at all.
+    """
+    __prove_latency: float                  # ms
+    __prove_latency_per_constraint: float   # ms
+    __verify_latency: float                 # ms
+    __jitter: float                         # relative, e.g. 0.1 for +-10 %
+    __constraint_counts: dict[str, int]     # circuit folder name -> constraint count
+
+    def __init__(self, prove_latency : float = 0, prove_latency_per_constraint : float = 0, verify_latency : float = 0, jitter : float = 0, constraint_counts : dict[str, int] = None):
+        self.__prove_latency = prove_latency
+        self.__prove_latency_per_constraint = prove_latency_per_constraint
+        self.__verify_latency = verify_latency
+        self.__jitter = jitter
+        self.__constraint_counts = constraint_counts or {}
+
+    def get_constraint_count(self, circuit_folder : str) -> int:
+        circuit_name = os.path.basename(os.path.normpath(circuit_folder))
+
+        if circuit_name in self.__constraint_counts:
+            return self.__constraint_counts[circuit_name]
+
+        manifest = read_manifest(circuit_folder)
+
+        if manifest is None or manifest.get('constraint_count') is None:
+            raise Exception(f"Constraint count of circuit {circuit_folder} is neither in the 'mock_prover' configuration nor in its manifest")
+
+        return manifest['constraint_count']
+
+    def get_proving_time(self, circuit_folder : str, parameters : str, block_metadata : str) -> float:
+        """ Simulated proving time in ms, the same statement always takes the same time """
+        duration = self.__prove_latency + self.__prove_latency_per_constraint * self.get_constraint_count(circuit_folder)
+
+        return duration * self.__get_jitter_factor(circuit_folder, parameters, block_metadata)
+
+    def generate_proof(self, block_metadata : str, circuit_folder : str, parameters : str, cancel_event : threading.Event = None) -> str:
+        if type(parameters) != str:
+            raise TypeError("Parameters must be a string")
+
+        try:
+            inputs = [int(parameter, 0) for parameter in parameters.split(" ")] + [int(block_metadata)]
+        except ValueError:
+            raise Exception(f"Failed to compute witness for circuit {circuit_folder}")
+
+        with open(os.path.join(circuit_folder, "abi.json"), 'r') as file:
+            abi = json.load(file)
+
+        if len(inputs) != len(abi['inputs']):
+            raise Exception(f"Failed to compute witness for circuit {circuit_folder}")
+
+        self.__wait(self.get_proving_time(circuit_folder, parameters, block_metadata), cancel_event)
+
+        return json.dumps({
+            'scheme': 'mock',
+            'curve': 'none',
+            'proof': { 'digest': self.__get_digest(circuit_folder, inputs) },
+            'inputs': [f"0x{value:064x}" for value in inputs] + [f"0x{1:064x}"]
+        })
+
+    def verify_proof(self, block_metadata : str, circuit_folder : str, proof : str, parameters : str, cancel_event : threading.Event = None) -> bool:
+        proof_json = json.loads(proof)
+
+        # check the block metadata integrity
+        assert int(proof_json['inputs'][-2], 0) == int(block_metadata)
+
+        self.__wait(self.__verify_latency, cancel_event)
+
+        inputs = [int(value, 0) for value in proof_json['inputs'][:-1]]
+
+        return proof_json.get('scheme') == 'mock' and proof_json['proof'].get('digest') == self.__get_digest(circuit_folder, inputs)
+
+    @staticmethod
+    def __wait(duration : float, cancel_event : threading.Event) -> None:
+        """ Simulate work of duration ms, raises an Exception once cancel_event is set like a killed ZoKrates process """
+        if cancel_event is None:
+            time.sleep(duration / 1000)
+        elif cancel_event.wait(duration / 1000):
+            raise Exception("Mock prover job was cancelled")
+
+    def __get_digest(self, circuit_folder : str, inputs : list[int]) -> str:
+        circuit_name = os.path.basename(os.path.normpath(circuit_folder))
+        serialized_statement = "|".join([circuit_name, *[str(value) for value in inputs]]).encode()
+
+        return hashlib.sha256(serialized_statement).hexdigest()
+
+    def __get_jitter_factor(self, circuit_folder : str, parameters : str, block_metadata : str) -> float:
+        if self.__jitter == 0:
+            return 1
+
+        seed = "|".join([os.path.basename(os.path.normpath(circuit_folder)), parameters, str(block_metadata)])
+
+        return 1 + random.Random(seed).uniform(-self.__jitter, self.__jitter)
+
+backend : ProverBackend = ZokratesBackend()
+
+def get_backend() -> ProverBackend:
+    return backend
+
+def set_backend(new_backend : ProverBackend) -> None:
+    global backend
+
+    backend = new_backend
+
+def create_backend(config : dict) -> ProverBackend:
+    """ Create backend from the 'prover_backend' field and optional 'mock_prover' latency model and constraint counts of the configuration """
+    name = config.get('prover_backend', 'zokrates')
+
+    if name == 'zokrates':
+        return ZokratesBackend()
+    elif name == 'mock':
+        latency_model = config.get('mock_prover', {})
+
+        return MockBackend(
+            latency_model.get('prove_latency', 0),
+            latency_model.get('prove_latency_per_constraint', 0),
+            latency_model.get('verify_latency', 0),
+            latency_model.get('jitter', 0),
+            latency_model.get('constraint_counts', {})
+        )
+    else:
+        raise ValueError(f"Unknown prover backend '{name}'")
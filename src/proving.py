@@ -0,0 +1,507 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import os
+import json
+import math
+import time
+import heapq
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from proof_tx import ProofTransaction
+import groth16
+import util
+
+PROOF_MEMORY_ESTIMATE = 512 * 1024 * 1024 # bytes of memory reserved for a single running proof
+VERIFICATION_CACHE_SIZE = 10000            # number of remembered verification outcomes
+PROVING_TIME_DEFAULT = 1000                # ms, assumed for any proof before the first proof is measured
+PROVING_TIME_EWMA_WEIGHT = 0.3             # weight of the newest measurement of a circuit
+
+def get_available_memory() -> int:
+    """ Return available physical memory in bytes or None if it cannot be determined """
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def get_worker_count() -> int:
+    """ Number of proofs which can run at once, limited both by CPU cores and available memory """
+    workers = os.cpu_count() or 1
+
+    available_memory = get_available_memory()
+
+    if available_memory is not None:
+        workers = min(workers, available_memory // PROOF_MEMORY_ESTIMATE)
+
+    return max(1, workers)
+
+class VerificationCache:
+    """ Bounded LRU cache of proof verification outcomes, so the same proof received repeatedly is verified once """
+    __entries: OrderedDict
+    __max_size: int
+    __hits: int
+    __misses: int
+    __lock: threading.Lock
+
+    def __init__(self, max_size : int = VERIFICATION_CACHE_SIZE):
+        self.__entries = OrderedDict()
+        self.__max_size = max_size
+        self.__hits = 0
+        self.__misses = 0
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def get_key(tx : ProofTransaction, block_metadata : str) -> tuple:
+        return (tx.get_circuit_hash(), str(block_metadata), tx.get_proof_digest() or b'')
+
+    def get(self, key : tuple) -> bool:
+        """ Return remembered outcome or None if the proof was not verified yet """
+        with self.__lock:
+            if key not in self.__entries:
+                self.__misses += 1
+                return None
+
+            self.__hits += 1
+            self.__entries.move_to_end(key)
+
+            return self.__entries[key]
+
+    def put(self, key : tuple, valid : bool) -> None:
+        with self.__lock:
+            self.__entries[key] = valid
+            self.__entries.move_to_end(key)
+
+            while len(self.__entries) > self.__max_size:
+                self.__entries.popitem(last=False)
+
+    def get_hits(self) -> int:
+        return self.__hits
+
+    def get_misses(self) -> int:
+        return self.__misses
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+class ProvingTimeModel:
+    """
+    Learns how long proofs take from past runs. Known circuits are predicted from the moving average
+    of their own proving times, unknown ones from a linear fit of proving time over constraint count.
+    """
+    __circuits: dict            # circuit hash -> [constraint count, moving average of proving time in ms]
+    __lock: threading.Lock
+
+    def __init__(self):
+        self.__circuits = {}
+        self.__lock = threading.Lock()
+
+    def record(self, circuit_hash : bytes, constraint_count : int, duration : float) -> None:
+        with self.__lock:
+            entry = self.__circuits.get(circuit_hash)
+
+            if entry is None:
+                self.__circuits[circuit_hash] = [constraint_count, duration]
+            else:
+                entry[0] = constraint_count
+                entry[1] = (1 - PROVING_TIME_EWMA_WEIGHT) * entry[1] + PROVING_TIME_EWMA_WEIGHT * duration
+
+    def predict(self, circuit_hash : bytes, constraint_count : int) -> float:
+        """ Predicted proving time in ms """
+        with self.__lock:
+            if circuit_hash in self.__circuits:
+                return self.__circuits[circuit_hash][1]
+
+            points = list(self.__circuits.values())
+
+        if len(points) == 0:
+            return PROVING_TIME_DEFAULT
+
+        mean_count = sum(count for count, _ in points) / len(points)
+        mean_duration = sum(duration for _, duration in points) / len(points)
+        variance = sum((count - mean_count) ** 2 for count, _ in points)
+
+        if variance == 0:
+            # a single constraint count measured, assume proving time proportional to it
+            return mean_duration * constraint_count / mean_count if mean_count > 0 else mean_duration
+
+        slope = sum((count - mean_count) * (duration - mean_duration) for count, duration in points) / variance
+        intercept = mean_duration - slope * mean_count
+
+        return max(intercept + slope * constraint_count, min(duration for _, duration in points))
+
+    def __len__(self) -> int:
+        return len(self.__circuits)
+
+def get_proof_reward(tx : ProofTransaction, fee : int) -> int:
+    """ Price paid to the miner for a proof or a batch of proofs, see StateTree.apply_proof_tx """
+    return math.ceil(tx.get_complexity() * tx.get_batch_size() / fee)
+
+def schedule_proofs(proof_txs : list[ProofTransaction], model : ProvingTimeModel, budget : float, workers : int, fee : int) -> tuple[list, list]:
+    """
+    Select proofs which maximize the reward while all of them can be proven within budget ms on
+    the given number of workers. Proofs are taken by reward per predicted ms and placed onto the
+    least loaded worker, the single most rewarding proof is taken instead if it alone pays more.
+    Parameter sets of a batch are proven concurrently, so they are placed one by one and the batch
+    is taken only if all of them fit. Before any proof is measured, only the most rewarding proof
+    is selected. Returns the selected and deferred transactions, both in the original order.
+    """
+    workers = max(1, workers)
+
+    # predicted time of a single parameter set
+    predictions = { tx.get_id(): model.predict(tx.get_circuit_hash(), tx.get_complexity()) for tx in proof_txs }
+    feasible = [tx for tx in proof_txs if predictions[tx.get_id()] * math.ceil(tx.get_batch_size() / workers) <= budget]
+
+    candidates = sorted(feasible, key=lambda tx: (get_proof_reward(tx, fee) / max(predictions[tx.get_id()] * tx.get_batch_size(), 1), get_proof_reward(tx, fee)), reverse=True)
+
+    worker_loads = [0.0] * workers
+    selected_ids = set()
+
+    for tx in candidates:
+        loads = list(worker_loads)
+
+        for _ in range(tx.get_batch_size()):
+            load = heapq.heappop(loads) + predictions[tx.get_id()]
+
+            if load > budget:
+                break
+
+            heapq.heappush(loads, load)
+        else:
+            selected_ids.add(tx.get_id())
+            worker_loads = loads
+
+    if len(feasible) > 0:
+        best_single = max(feasible, key=lambda tx: get_proof_reward(tx, fee))
+
+        if get_proof_reward(best_single, fee) > sum(get_proof_reward(tx, fee) for tx in feasible if tx.get_id() in selected_ids):
+            selected_ids = { best_single.get_id() }
+
+    # nothing was measured yet, prove the most rewarding proof alone so the model can learn
+    if len(model) == 0 and len(proof_txs) > 0:
+        selected_ids = { max(proof_txs, key=lambda tx: get_proof_reward(tx, fee)).get_id() }
+
+    selected = [tx for tx in proof_txs if tx.get_id() in selected_ids]
+    deferred = [tx for tx in proof_txs if tx.get_id() not in selected_ids]
+
+    return selected, deferred
+
+class ProvingExecutor:
+    """
+    Proves or verifies all proof transactions of a block concurrently on a bounded pool of worker threads.
+    Proving is pipelined, witnesses of the next proofs are computed on their own pool while earlier
+    proofs are generated, with at most witness_queue_size computed witnesses waiting for a prover.
+    Parameter sets of a batch request are separate jobs, so a batch is spread across all workers.
+    With native verification, proofs are batch verified in-process per circuit instead of calling ZoKrates.
+    Every call gets a cancel event passed down to the prover backend, setting it kills its running processes.
+    """
+    __max_workers: int
+    __witness_workers: int
+    __witness_queue_size: int
+    __verification_cache: VerificationCache
+    __native_verification: bool
+    __proving_time_model: ProvingTimeModel
+    __cancel_events: set[threading.Event]   # of prove_all and verify_all calls in progress
+    __cancel_events_lock: threading.Lock
+
+    def __init__(self, max_workers : int = None, native_verification : bool = False, witness_workers : int = None, witness_queue_size : int = None):
+        if native_verification and not groth16.is_available():
+            raise RuntimeError("Native verification requires the 'py_ecc' package")
+
+        self.__max_workers = max_workers if max_workers is not None else get_worker_count()
+        self.__witness_workers = witness_workers if witness_workers is not None else self.__max_workers
+        self.__witness_queue_size = witness_queue_size if witness_queue_size is not None else self.__max_workers
+        self.__verification_cache = VerificationCache()
+        self.__native_verification = native_verification
+        self.__proving_time_model = ProvingTimeModel()
+        self.__cancel_events = set()
+        self.__cancel_events_lock = threading.Lock()
+
+    def get_max_workers(self) -> int:
+        return self.__max_workers
+
+    def get_witness_workers(self) -> int:
+        return self.__witness_workers
+
+    def get_witness_queue_size(self) -> int:
+        return self.__witness_queue_size
+
+    def uses_native_verification(self) -> bool:
+        return self.__native_verification
+
+    def get_proving_time_model(self) -> ProvingTimeModel:
+        return self.__proving_time_model
+
+    def get_verification_cache(self) -> VerificationCache:
+        return self.__verification_cache
+
+    def cancel_all(self) -> None:
+        """ Cancel proving and verification in progress, e.g. when the client exits """
+        with self.__cancel_events_lock:
+            for cancel_event in self.__cancel_events:
+                cancel_event.set()
+
+    def __add_cancel_event(self) -> threading.Event:
+        cancel_event = threading.Event()
+
+        with self.__cancel_events_lock:
+            self.__cancel_events.add(cancel_event)
+
+        return cancel_event
+
+    def __remove_cancel_event(self, cancel_event : threading.Event) -> None:
+        with self.__cancel_events_lock:
+            self.__cancel_events.discard(cancel_event)
+
+    def prove_all(self, proof_txs : list[ProofTransaction], block_metadata : str, circuits : dict) -> dict[bytes, float]:
+        """
+        Generate proofs for all transactions and return the proving time in ms for each transaction id,
+        summed over the parameter sets of batches. Transactions with unknown circuits are skipped.
+        Raises the first proving failure once all jobs finish, the block cannot be produced after it,
+        so witnesses which are not being proven yet are discarded and running jobs are cancelled.
+        """
+        jobs = []
+        batches = [] # (transaction, setup shared by the parameter sets of a batch request)
+        cancel_event = self.__add_cancel_event()
+
+        try:
+            for tx in proof_txs:
+                try:
+                    circuit_folder = circuits[tx.get_circuit_hash().hex()]
+                except KeyError:
+                    util.eprint("Unknown circuit inside a proof request")
+                    continue
+
+                batch = tx.prepare_batch(circuit_folder)
+
+                if batch is not None:
+                    batches.append((tx, batch))
+
+                jobs.extend((tx, index, circuit_folder, batch) for index in range(tx.get_batch_size()))
+
+            return self.__prove_jobs(jobs, block_metadata, cancel_event)
+        finally:
+            for tx, batch in batches:
+                tx.close_batch(batch)
+
+            self.__remove_cancel_event(cancel_event)
+
+    def __prove_jobs(self, jobs : list[tuple], block_metadata : str, cancel_event : threading.Event) -> dict[bytes, float]:
+        timings = {}
+
+        if len(jobs) == 0:
+            return timings
+
+        first_error = None
+
+        # witnesses being computed, waiting in the queue or being proven
+        slots = threading.Semaphore(self.__max_workers + self.__witness_queue_size)
+        failed = threading.Event()
+
+        with ThreadPoolExecutor(max_workers=min(self.__witness_workers, len(jobs))) as witness_pool, ThreadPoolExecutor(max_workers=min(self.__max_workers, len(jobs))) as proving_pool:
+            witness_futures = { witness_pool.submit(self.__compute_witness, tx, index, block_metadata, circuit_folder, batch, slots, failed, cancel_event, proving_pool): (tx, index) for tx, index, circuit_folder, batch in jobs }
+            proof_futures = {}
+
+            for future in as_completed(witness_futures):
+                tx, index = witness_futures[future]
+
+                try:
+                    proof_future = future.result()
+
+                    if proof_future is not None:
+                        proof_futures[proof_future] = (tx, index)
+                except Exception as e:
+                    util.vprint(f"Proving: Failed to compute witness for transaction {tx.get_id().hex()[0:6]}… - {e}")
+
+                    if first_error is None:
+                        first_error = e
+
+            for future in as_completed(proof_futures):
+                tx, index = proof_futures[future]
+
+                try:
+                    result = future.result()
+
+                    if result is None:
+                        continue
+
+                    witness_time, proving_time = result
+                    timings[tx.get_id()] = timings.get(tx.get_id(), 0) + witness_time + proving_time
+                    self.__proving_time_model.record(tx.get_circuit_hash(), tx.get_complexity(), witness_time + proving_time)
+                    util.vprint(f"Proving: Proof {index + 1}/{tx.get_batch_size()} for transaction {tx.get_id().hex()[0:6]}… generated in {witness_time + proving_time:.0f} ms (witness {witness_time:.0f} ms)")
+                except Exception as e:
+                    util.vprint(f"Proving: Failed to generate proof for transaction {tx.get_id().hex()[0:6]}… - {e}")
+
+                    if first_error is None:
+                        first_error = e
+
+        if first_error is not None:
+            raise first_error
+
+        return timings
+
+    def __compute_witness(self, tx : ProofTransaction, index : int, block_metadata : str, circuit_folder : str, batch, slots : threading.Semaphore, failed : threading.Event, cancel_event : threading.Event, proving_pool : ThreadPoolExecutor):
+        """ Compute witness and queue it for proving, blocks while the queue of computed witnesses is full """
+        slots.acquire()
+
+        if failed.is_set():
+            slots.release()
+            return None
+
+        try:
+            start = time.perf_counter()
+            witness = tx.compute_witness(block_metadata, circuit_folder, index, batch, cancel_event)
+            witness_time = (time.perf_counter() - start) * 1000
+        except:
+            slots.release()
+
+            if self.__cancel_after_failure(failed, cancel_event):
+                return None
+
+            raise
+
+        try:
+            return proving_pool.submit(self.__prove_witness, tx, index, witness, witness_time, slots, failed, cancel_event)
+        except:
+            tx.discard_witness(witness)
+            slots.release()
+            raise
+
+    def __prove_witness(self, tx : ProofTransaction, index : int, witness, witness_time : float, slots : threading.Semaphore, failed : threading.Event, cancel_event : threading.Event) -> tuple[float, float]:
+        """ Returns witness and proving time in ms, None if the witness was discarded or the job cancelled after another job failed """
+        try:
+            if failed.is_set():
+                tx.discard_witness(witness)
+                return None
+
+            start = time.perf_counter()
+
+            try:
+                tx.prove_witness(witness, index, cancel_event)
+            except:
+                if self.__cancel_after_failure(failed, cancel_event):
+                    return None
+
+                raise
+
+            return witness_time, (time.perf_counter() - start) * 1000
+        finally:
+            slots.release()
+
+    def __cancel_after_failure(self, failed : threading.Event, cancel_event : threading.Event) -> bool:
+        """
+        Called when a job raises, returns True if it was only cancelled because another job failed before,
+        otherwise cancels the running jobs, so that only the original failure is raised
+        """
+        if failed.is_set():
+            return True
+
+        failed.set()
+        cancel_event.set()
+
+        return False
+
+    def verify_all(self, proof_txs : list[ProofTransaction], block_metadata : str, circuits : dict) -> bool:
+        """
+        Verify proofs of all transactions concurrently. Returns False as soon as any proof is invalid
+        or references an unknown circuit, verifications still in progress are cancelled.
+        """
+        jobs = []
+
+        for tx in proof_txs:
+            circuit_folder = circuits.get(tx.get_circuit_hash().hex())
+
+            if circuit_folder is None:
+                util.vprint(f"Verification: Unknown circuit in transaction {tx.get_id().hex()[0:6]}…")
+                return False
+
+            # e.g. the same block delivered by several peers
+            cached_result = self.__verification_cache.get(VerificationCache.get_key(tx, block_metadata))
+
+            if cached_result is False:
+                util.vprint(f"Verification: Invalid proof in transaction {tx.get_id().hex()[0:6]}… (cached)")
+                return False
+            elif cached_result is True:
+                continue
+
+            jobs.append((tx, circuit_folder))
+
+        if len(jobs) == 0:
+            return True
+
+        if self.__native_verification:
+            return self.__verify_batches(jobs, block_metadata)
+
+        pool = ThreadPoolExecutor(max_workers=min(self.__max_workers, len(jobs)))
+        cancel_event = self.__add_cancel_event()
+
+        try:
+            futures = { pool.submit(self.__verify, tx, block_metadata, circuit_folder, cancel_event): tx for tx, circuit_folder in jobs }
+
+            for future in as_completed(futures):
+                if not future.result():
+                    util.vprint(f"Verification: Invalid proof in transaction {futures[future].get_id().hex()[0:6]}…")
+                    return False
+
+            return True
+        finally:
+            # kills ZoKrates processes of verifications whose result no longer matters
+            cancel_event.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+            self.__remove_cancel_event(cancel_event)
+
+    def __verify(self, tx : ProofTransaction, block_metadata : str, circuit_folder : str, cancel_event : threading.Event) -> bool:
+        try:
+            valid = tx.validate(block_metadata, circuit_folder, cancel_event)
+        except Exception as e:
+            if cancel_event.is_set():
+                return False
+
+            # not cached, the failure might be caused by the environment rather than the proof
+            util.vprint(f"Verification: Failed to verify proof in transaction {tx.get_id().hex()[0:6]}… - {e}")
+            return False
+
+        self.__verification_cache.put(VerificationCache.get_key(tx, block_metadata), valid)
+
+        return valid
+
+    def __verify_batches(self, jobs : list[tuple], block_metadata : str) -> bool:
+        """ Verify all proofs of each circuit, including every proof of batch requests, with a single batched pairing check """
+        batches = {}
+
+        for tx, circuit_folder in jobs:
+            batches.setdefault(circuit_folder, []).append(tx)
+
+        for circuit_folder, txs in batches.items():
+            try:
+                proofs = []
+
+                for tx in txs:
+                    tx_proofs = tx.get_proofs()
+
+                    # check the block metadata integrity, same as the ZoKrates verifier
+                    if tx_proofs is None or len(tx_proofs) != tx.get_batch_size() or any(int(json.loads(proof)['inputs'][-2], 0) != int(block_metadata) for proof in tx_proofs):
+                        util.vprint(f"Verification: Invalid proof in transaction {tx.get_id().hex()[0:6]}…")
+                        self.__verification_cache.put(VerificationCache.get_key(tx, block_metadata), False)
+                        return False
+
+                    proofs.extend(tx_proofs)
+
+                valid = groth16.get_verifier(circuit_folder).verify_batch(proofs)
+            except Exception as e:
+                util.vprint(f"Verification: Failed to verify proofs of circuit {os.path.basename(circuit_folder)} - {e}")
+                return False
+
+            if not valid:
+                # the batch does not tell which proof is invalid, so nothing is cached
+                util.vprint(f"Verification: Invalid proof among {len(txs)} transaction(s) of circuit {os.path.basename(circuit_folder)}")
+                return False
+
+            for tx in txs:
+                self.__verification_cache.put(VerificationCache.get_key(tx, block_metadata), True)
+
+        return True
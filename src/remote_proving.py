@@ -0,0 +1,432 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import os
+import time
+import uuid
+import threading
+import socketserver
+from collections import deque
+
+import jsonrpclib
+from jsonrpclib.SimpleJSONRPCServer import SimpleJSONRPCServer
+
+from bind_zokrates import Zokrates
+from prover_backend import ProverBackend
+import util
+
+PROVER_LEASE_DURATION = 10000       # ms a leased job stays with a worker without a heartbeat
+PROVER_HEARTBEAT_INTERVAL = 2000    # ms between heartbeats of a worker proving a job
+PROVER_WORKER_TIMEOUT = 15000       # ms without contact after which a worker is considered gone
+PROVER_LEASE_POLL = 5000            # ms a lease request waits for a job to appear
+PROVER_MAX_ATTEMPTS = 3             # leases of a single job before it is failed
+
+class ThreadedJSONRPCServer(socketserver.ThreadingMixIn, SimpleJSONRPCServer):
+    """ Lease requests are long polled, so every request is handled in its own thread """
+    daemon_threads = True
+
+class ProofJob:
+    __id: str
+    __circuit_hash: str
+    __parameters: str
+    __block_metadata: str
+    __state: str                # 'pending', 'leased', 'done' or 'failed'
+    __worker_id: str
+    __lease_until: int          # timestamp in ms
+    __attempts: int
+    __proof: str
+    __error: str
+
+    def __init__(self, circuit_hash : str, parameters : str, block_metadata : str):
+        self.__id = uuid.uuid4().hex
+        self.__circuit_hash = circuit_hash
+        self.__parameters = parameters
+        self.__block_metadata = block_metadata
+        self.__state = 'pending'
+        self.__worker_id = None
+        self.__lease_until = 0
+        self.__attempts = 0
+        self.__proof = None
+        self.__error = None
+
+    def lease(self, worker_id : str) -> None:
+        self.__state = 'leased'
+        self.__worker_id = worker_id
+        self.__attempts += 1
+        self.renew()
+
+    def renew(self) -> None:
+        self.__lease_until = util.get_current_time() + PROVER_LEASE_DURATION
+
+    def release(self, error : str) -> None:
+        """ Return the job to the queue, or fail it once it was leased too many times """
+        self.__worker_id = None
+
+        if self.__attempts >= PROVER_MAX_ATTEMPTS:
+            self.fail(error)
+        else:
+            self.__state = 'pending'
+
+    def complete(self, proof : str) -> None:
+        self.__state = 'done'
+        self.__proof = proof
+
+    def fail(self, error : str) -> None:
+        self.__state = 'failed'
+        self.__error = error
+
+    def is_lease_expired(self) -> bool:
+        return self.__state == 'leased' and util.get_current_time() > self.__lease_until
+
+    def is_finished(self) -> bool:
+        return self.__state in ['done', 'failed']
+
+    def get_id(self) -> str:
+        return self.__id
+
+    def get_state(self) -> str:
+        return self.__state
+
+    def get_worker_id(self) -> str:
+        return self.__worker_id
+
+    def get_attempts(self) -> int:
+        return self.__attempts
+
+    def get_proof(self) -> str:
+        return self.__proof
+
+    def get_error(self) -> str:
+        return self.__error
+
+    def encode(self) -> dict:
+        return {
+            'id': self.__id,
+            'circuit_hash': self.__circuit_hash,
+            'parameters': self.__parameters,
+            'block_metadata': self.__block_metadata
+        }
+
+class ProverCoordinator:
+    """
+    Hands out proving jobs to remote prover workers over JSON-RPC. Workers lease jobs, keep the lease
+    with heartbeats and return proofs. Jobs of workers which stop sending heartbeats are leased again.
+    """
+    __jobs: dict[str, ProofJob]
+    __queue: deque              # ids of pending jobs
+    __workers: dict[str, int]   # worker id -> timestamp in ms of the last contact
+    __condition: threading.Condition
+    __server: ThreadedJSONRPCServer
+
+    def __init__(self):
+        self.__jobs = {}
+        self.__queue = deque()
+        self.__workers = {}
+        self.__condition = threading.Condition()
+        self.__server = None
+
+    def start(self, host : str, port : int) -> None:
+        self.__server = ThreadedJSONRPCServer((host, port), logRequests=False)
+
+        self.__server.register_function(self.lease_job, util.Command.LEASE_PROOF_JOB)
+        self.__server.register_function(self.heartbeat, util.Command.PROOF_JOB_HEARTBEAT)
+        self.__server.register_function(self.submit_proof, util.Command.SUBMIT_PROOF)
+        self.__server.register_function(self.fail_job, util.Command.FAIL_PROOF_JOB)
+
+        threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+
+        util.vprint(f"Remote proving: Coordinator listening on {host}:{port}")
+
+    def stop(self) -> None:
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+
+        with self.__condition:
+            self.__condition.notify_all()
+
+    def get_active_worker_count(self) -> int:
+        with self.__condition:
+            now = util.get_current_time()
+
+            return len([worker_id for worker_id, last_contact in self.__workers.items() if now - last_contact <= PROVER_WORKER_TIMEOUT])
+
+    def submit(self, circuit_hash : str, parameters : str, block_metadata : str) -> ProofJob:
+        job = ProofJob(circuit_hash, parameters, block_metadata)
+
+        with self.__condition:
+            self.__jobs[job.get_id()] = job
+            self.__queue.append(job.get_id())
+            self.__condition.notify_all()
+
+        return job
+
+    def wait(self, job : ProofJob) -> str:
+        """
+        Wait until a worker proves the job and return the proof. Returns None if there is no worker
+        left to prove it, so the caller can prove it locally. Raises if the job failed.
+        """
+        with self.__condition:
+            while not job.is_finished():
+                self.__expire_leases()
+
+                if job.get_state() == 'pending' and self.__count_active_workers() == 0:
+                    self.__remove(job)
+                    return None
+
+                self.__condition.wait(timeout=0.5)
+
+            self.__remove(job)
+
+        if job.get_state() == 'failed':
+            raise Exception(f"Remote proving failed after {job.get_attempts()} attempt(s) - {job.get_error()}")
+
+        return job.get_proof()
+
+    def lease_job(self, worker_id : str) -> dict:
+        """ RPC: lease the next pending job, waits for one to appear for a while """
+        deadline = time.monotonic() + PROVER_LEASE_POLL / 1000
+
+        with self.__condition:
+            self.__workers[worker_id] = util.get_current_time()
+
+            while True:
+                self.__expire_leases()
+
+                while len(self.__queue) > 0:
+                    job = self.__jobs.get(self.__queue.popleft())
+
+                    if job is not None and job.get_state() == 'pending':
+                        job.lease(worker_id)
+                        util.vprint(f"Remote proving: Leased job {job.get_id()[0:6]}… to worker {worker_id[0:6]}… (attempt {job.get_attempts()})")
+
+                        return { 'job': job.encode() }
+
+                remaining = deadline - time.monotonic()
+
+                if remaining <= 0:
+                    return { 'job': None }
+
+                self.__condition.wait(timeout=min(remaining, 0.5))
+
+    def heartbeat(self, worker_id : str, job_id : str) -> dict:
+        """ RPC: extend the lease, returns whether the worker still holds it """
+        with self.__condition:
+            self.__workers[worker_id] = util.get_current_time()
+
+            job = self.__jobs.get(job_id)
+
+            if job is None or job.get_state() != 'leased' or job.get_worker_id() != worker_id:
+                return { 'leased': False }
+
+            job.renew()
+
+            return { 'leased': True }
+
+    def submit_proof(self, worker_id : str, job_id : str, proof : str) -> dict:
+        """ RPC: return a proof, accepted even after the lease expired while nobody else finished the job """
+        with self.__condition:
+            self.__workers[worker_id] = util.get_current_time()
+
+            job = self.__jobs.get(job_id)
+
+            if job is None or job.is_finished():
+                return { 'accepted': False }
+
+            job.complete(proof)
+            self.__condition.notify_all()
+
+            return { 'accepted': True }
+
+    def fail_job(self, worker_id : str, job_id : str, error : str) -> dict:
+        """ RPC: report that the worker could not prove the job, it is given to another worker """
+        with self.__condition:
+            self.__workers[worker_id] = util.get_current_time()
+
+            job = self.__jobs.get(job_id)
+
+            if job is None or job.get_state() != 'leased' or job.get_worker_id() != worker_id:
+                return { 'accepted': False }
+
+            util.vprint(f"Remote proving: Worker {worker_id[0:6]}… failed job {job_id[0:6]}… - {error}")
+
+            self.__release(job, error)
+
+            return { 'accepted': True }
+
+    def __expire_leases(self) -> None:
+        for job in self.__jobs.values():
+            if job.is_lease_expired():
+                util.vprint(f"Remote proving: Lease of job {job.get_id()[0:6]}… by worker {job.get_worker_id()[0:6]}… expired")
+                self.__release(job, "Lease expired")
+
+    def __release(self, job : ProofJob, error : str) -> None:
+        job.release(error)
+
+        if job.get_state() == 'pending':
+            self.__queue.append(job.get_id())
+
+        self.__condition.notify_all()
+
+    def __remove(self, job : ProofJob) -> None:
+        self.__jobs.pop(job.get_id(), None)
+
+        if job.get_id() in self.__queue:
+            self.__queue.remove(job.get_id())
+
+    def __count_active_workers(self) -> int:
+        now = util.get_current_time()
+
+        return len([last_contact for last_contact in self.__workers.values() if now - last_contact <= PROVER_WORKER_TIMEOUT])
+
+def get_circuit_hash(circuit_folder : str) -> str:
+    zokrates_files = util.find_files_with_extension(circuit_folder, ".zok")
+
+    if len(zokrates_files) != 1:
+        raise Exception(f"Expected a single Zokrates (.zok) file in {circuit_folder}")
+
+    return Zokrates.get_source_hash(os.path.join(circuit_folder, zokrates_files[0]))
+
+class RemoteBackend(ProverBackend):
+    """
+    Proves on remote workers through the coordinator and verifies locally. Proofs are generated
+    locally while no worker is connected, returned proofs are checked before they are used.
+    """
+    __coordinator: ProverCoordinator
+    __local_backend: ProverBackend
+
+    def __init__(self, coordinator : ProverCoordinator, local_backend : ProverBackend):
+        self.__coordinator = coordinator
+        self.__local_backend = local_backend
+
+    def generate_proof(self, block_metadata : str, circuit_folder : str, parameters : str, cancel_event : threading.Event = None) -> str:
+        """ Cancellation only stops local proving, jobs already submitted to workers run to completion """
+        if self.__coordinator.get_active_worker_count() == 0:
+            return self.__local_backend.generate_proof(block_metadata, circuit_folder, parameters, cancel_event)
+
+        job = self.__coordinator.submit(get_circuit_hash(circuit_folder), parameters, block_metadata)
+        proof = self.__coordinator.wait(job)
+
+        if proof is None:
+            util.vprint(f"Remote proving: No worker left for job {job.get_id()[0:6]}…, proving locally")
+            return self.__local_backend.generate_proof(block_metadata, circuit_folder, parameters, cancel_event)
+
+        if not self.__local_backend.verify_proof(block_metadata, circuit_folder, proof, parameters, cancel_event):
+            raise Exception("Remote worker returned an invalid proof")
+
+        return proof
+
+    def verify_proof(self, block_metadata : str, circuit_folder : str, proof : str, parameters : str, cancel_event : threading.Event = None) -> bool:
+        return self.__local_backend.verify_proof(block_metadata, circuit_folder, proof, parameters, cancel_event)
+
+    def get_constraint_count(self, circuit_folder : str) -> int:
+        return self.__local_backend.get_constraint_count(circuit_folder)
+
+class ProverWorker:
+    """ Leases proving jobs from a coordinator and proves them with the local backend, one job per thread """
+    __coordinator_url: str
+    __backend: ProverBackend
+    __threads: int
+    __worker_id: str
+    __circuits: dict            # circuit hash -> circuit folder
+    __running: threading.Event
+    __stopped: threading.Event  # cancels jobs being proven
+    __proven_count: int
+    __lock: threading.Lock
+
+    def __init__(self, coordinator_address : str, backend : ProverBackend, threads : int = 1):
+        self.__coordinator_url = f"http://{coordinator_address}"
+        self.__backend = backend
+        self.__threads = threads
+        self.__worker_id = uuid.uuid4().hex
+        self.__circuits = Zokrates.prepare_circuits(log=False)
+        self.__running = threading.Event()
+        self.__stopped = threading.Event()
+        self.__proven_count = 0
+        self.__lock = threading.Lock()
+
+    def get_worker_id(self) -> str:
+        return self.__worker_id
+
+    def get_proven_count(self) -> int:
+        return self.__proven_count
+
+    def start(self) -> None:
+        self.__running.set()
+        self.__stopped.clear()
+
+        for _ in range(self.__threads):
+            threading.Thread(target=self.__work, daemon=True).start()
+
+        util.iprint(f"Remote proving: Worker {self.__worker_id[0:6]}… proving up to {self.__threads} job(s) at once for {self.__coordinator_url}")
+
+    def stop(self) -> None:
+        self.__running.clear()
+        self.__stopped.set()
+
+    def __work(self) -> None:
+        coordinator = jsonrpclib.Server(self.__coordinator_url)
+
+        while self.__running.is_set():
+            try:
+                job = coordinator.LEASE_PROOF_JOB(self.__worker_id)['job']
+            except Exception as e:
+                util.vprint(f"Remote proving: Failed to contact coordinator -", e)
+                time.sleep(PROVER_HEARTBEAT_INTERVAL / 1000)
+                continue
+
+            if job is not None:
+                self.__prove(coordinator, job)
+
+    def __prove(self, coordinator, job : dict) -> None:
+        finished = threading.Event()
+        heartbeat_thread = threading.Thread(target=self.__send_heartbeats, args=(job['id'], finished), daemon=True)
+        heartbeat_thread.start()
+
+        try:
+            circuit_folder = self.__get_circuit_folder(job['circuit_hash'])
+            proof = self.__backend.generate_proof(job['block_metadata'], circuit_folder, job['parameters'], self.__stopped)
+        except Exception as e:
+            finished.set()
+            util.vprint(f"Remote proving: Failed to prove job {job['id'][0:6]}… - {e}")
+
+            try:
+                coordinator.FAIL_PROOF_JOB(self.__worker_id, job['id'], str(e))
+            except Exception:
+                pass
+
+            return
+
+        finished.set()
+
+        try:
+            coordinator.SUBMIT_PROOF(self.__worker_id, job['id'], proof)
+
+            with self.__lock:
+                self.__proven_count += 1
+
+            util.vprint(f"Remote proving: Submitted proof of job {job['id'][0:6]}…")
+        except Exception as e:
+            util.vprint(f"Remote proving: Failed to submit proof of job {job['id'][0:6]}… -", e)
+
+    def __send_heartbeats(self, job_id : str, finished : threading.Event) -> None:
+        coordinator = jsonrpclib.Server(self.__coordinator_url)
+
+        while not finished.wait(PROVER_HEARTBEAT_INTERVAL / 1000):
+            try:
+                coordinator.PROOF_JOB_HEARTBEAT(self.__worker_id, job_id)
+            except Exception:
+                pass
+
+    def __get_circuit_folder(self, circuit_hash : str) -> str:
+        if circuit_hash not in self.__circuits:
+            # the circuit might have been added after the worker started
+            self.__circuits = Zokrates.prepare_circuits(log=False)
+
+        if circuit_hash not in self.__circuits:
+            raise Exception(f"Unknown circuit {circuit_hash}")
+
+        return self.__circuits[circuit_hash]
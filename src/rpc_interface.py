@@ -1,8 +1,10 @@
 from jsonrpclib.SimpleJSONRPCServer import SimpleJSONRPCServer, SimpleJSONRPCRequestHandler
+import json
 
 import util
 import network
-from bind_zokrates import Zokrates
+from proof_codec import decode_proof
+from wire_codec import WIRE_FORMAT_JSON
 
 """ curl -X POST http://localhost:9545 -H "Content-Type: application/json" -d '{"params": [0], "method":"GET_BLOCK", "id": 123}' """
 
@@ -52,17 +54,43 @@ class CustomJSONRPCRequestHandler(SimpleJSONRPCRequestHandler):
         self.wfile.flush()
         self.connection.shutdown(1)
 
+class CustomJSONRPCServer(SimpleJSONRPCServer):
+    def _marshaled_single_dispatch(self, request):
+        """ Blocks are served by splicing their cached JSON into the response instead of serializing them again """
+        params = request.get('params')
+
+        if request.get('method') == util.Command.GET_BLOCK and request.get('id') is not None and type(params) == list and len(params) == 1:
+            try:
+                encoded_block = network.get_encoded_block(int(params[0]), include_proofs=False)
+            except (ValueError, TypeError, IndexError):
+                encoded_block = None
+
+            if encoded_block is not None:
+                return f'{{"result": {{"block": {encoded_block.get_encoding(WIRE_FORMAT_JSON).decode()}}}, "id": {json.dumps(request["id"])}, "jsonrpc": "2.0"}}'
+
+        return super()._marshaled_single_dispatch(request)
+
 def get_latest_block_id_response() -> dict:
     return { 'latest_id': network.blockchain[-1].get_id() }
 
 def get_block_response(block_id : str) -> dict:
+    # proofs are fetched on demand with GET_PROOFS
     try:
-        return { 'block': network.blockchain[int(block_id)].encode() }
+        return { 'block': network.get_encoded_block(int(block_id), include_proofs=False).get_value() }
     except ValueError:
         return { 'error': 'Invalid block_id provided: id cannot be converted to int' }
     except IndexError:
         return { 'error': 'Invalid block_id provided: id is out of bounds' }
 
+def get_proofs_response(digests : list) -> dict:
+    try:
+        proofs = [network.proof_store.get(bytes.fromhex(digest)) for digest in digests]
+    except (ValueError, TypeError):
+        return { 'error': 'Invalid digests provided: digests must be a list of hex strings' }
+
+    # proofs are stored in the compact encoding, clients get the ZoKrates JSON
+    return { 'proofs': [decode_proof(proof) for proof in proofs if proof is not None] }
+
 def get_pending_coin_txs_response() -> dict:
     return { 'pending_coin_txs': [tx.encode() for tx in network.pending_coin_transactions] }
 
@@ -70,7 +98,7 @@ def get_pending_proof_txs_response() -> dict:
     return { 'pending_proof_txs': [tx.encode() for tx in network.pending_proof_transactions] }
 
 def get_circuits() -> dict:
-    return { 'circuits': [{ 'hash': hash, 'constraint_count': Zokrates.get_constraint_count(filepath) } for hash, filepath in network.circuits.items()] }
+    return { 'circuits': [{ 'hash': hash, 'constraint_count': metadata['constraint_count'] } for hash, metadata in network.circuit_metadata.items()] }
 
 def submit_coin_tx(coin_tx : dict):
     new_tx = CoinTransaction()
@@ -83,12 +111,13 @@ def submit_coin_tx(coin_tx : dict):
 def start_json_rpc_server(port : int) -> None:
     global server
 
-    server = SimpleJSONRPCServer(('localhost', port), requestHandler=CustomJSONRPCRequestHandler, logRequests=False)
+    server = CustomJSONRPCServer(('localhost', port), requestHandler=CustomJSONRPCRequestHandler, logRequests=False)
 
     util.vprint(f"Starting RPC server on port {port}")
 
     server.register_function(get_latest_block_id_response, util.Command.GET_LATEST_BLOCK_ID)
     server.register_function(get_block_response, util.Command.GET_BLOCK)
+    server.register_function(get_proofs_response, util.Command.GET_PROOFS)
     server.register_function(get_pending_coin_txs_response, util.Command.GET_PENDING_COIN_TXS)
     server.register_function(get_pending_proof_txs_response, util.Command.GET_PENDING_PROOF_TXS)
     server.register_function(get_circuits, util.Command.GET_CIRCUITS)
@@ -48,17 +48,20 @@ class StateTree(Encodeable):
     def apply_coin_tx(self, coin_tx : CoinTransaction, fee : int, fee_beneficiary : bytes):
         amount = coin_tx.get_amount()
 
+        # the fee is paid once for all outputs
         sender_balance = self.get(coin_tx.get_address_from())
         self.set(coin_tx.get_address_from(), sender_balance - amount - fee)
 
-        receiver_balance = self.get(coin_tx.get_address_to())
-        self.set(coin_tx.get_address_to(), receiver_balance + amount)
+        for address_to, output_amount in coin_tx.get_outputs():
+            receiver_balance = self.get(address_to)
+            self.set(address_to, receiver_balance + output_amount)
 
         miner_balance = self.get(fee_beneficiary)
         self.set(fee_beneficiary, miner_balance + fee)
 
     def apply_proof_tx(self, proof_tx : ProofTransaction, fee : int, fee_beneficiary : bytes):
-        price = math.ceil(proof_tx.get_complexity() / fee)
+        # every parameter set of a batch is a separate proof
+        price = math.ceil(proof_tx.get_complexity() * proof_tx.get_batch_size() / fee)
 
         sender_balance = self.get(proof_tx.get_address_from())
         self.set(proof_tx.get_address_from(), sender_balance - price)
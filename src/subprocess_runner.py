@@ -0,0 +1,151 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import os
+import time
+import signal
+import threading
+import subprocess
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+OUTPUT_LIMIT = 1024 * 1024  # bytes of stdout and stderr each kept in memory, the oldest output is dropped
+POLL_INTERVAL = 0.05        # seconds between checks of timeout and cancellation
+
+class ProcessResult:
+    """ Outcome of a finished, timed out or cancelled process """
+    __args: list
+    __return_code: int
+    __stdout: bytes
+    __stderr: bytes
+    __start_time: int           # timestamp in ms
+    __duration: float           # ms
+    __timed_out: bool
+    __cancelled: bool
+
+    def __init__(self, args : list, return_code : int, stdout : bytes, stderr : bytes, start_time : int, duration : float, timed_out : bool, cancelled : bool):
+        self.__args = args
+        self.__return_code = return_code
+        self.__stdout = stdout
+        self.__stderr = stderr
+        self.__start_time = start_time
+        self.__duration = duration
+        self.__timed_out = timed_out
+        self.__cancelled = cancelled
+
+    def get_args(self) -> list:
+        return self.__args
+
+    def get_return_code(self) -> int:
+        return self.__return_code
+
+    def get_stdout(self) -> bytes:
+        return self.__stdout
+
+    def get_stderr(self) -> bytes:
+        return self.__stderr
+
+    def get_start_time(self) -> int:
+        return self.__start_time
+
+    def get_duration(self) -> float:
+        return self.__duration
+
+    def is_timed_out(self) -> bool:
+        return self.__timed_out
+
+    def is_cancelled(self) -> bool:
+        return self.__cancelled
+
+    def is_success(self) -> bool:
+        return self.__return_code == 0 and not self.__timed_out and not self.__cancelled
+
+    def __str__(self) -> str:
+        if self.__timed_out:
+            outcome = "timed out"
+        elif self.__cancelled:
+            outcome = "cancelled"
+        else:
+            outcome = f"exited with {self.__return_code}"
+
+        return f"'{' '.join(self.__args[0:2])}' {outcome} after {self.__duration:.0f} ms"
+
+def read_stream(stream, buffer : bytearray, stream_name : str, on_output) -> None:
+    """ Drain a pipe line by line so the process never blocks on a full pipe """
+    for line in iter(stream.readline, b''):
+        buffer.extend(line)
+
+        if len(buffer) > OUTPUT_LIMIT:
+            del buffer[:len(buffer) - OUTPUT_LIMIT]
+
+        if on_output is not None:
+            on_output(stream_name, line.decode(errors='replace').rstrip('\n'))
+
+    stream.close()
+
+def kill_process(process : subprocess.Popen) -> None:
+    """ Kill the process along with any children it started """
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, AttributeError):
+        process.kill()
+
+def run_process(args : list, cwd : str = None, timeout : float = None, memory_limit : int = None, cancel_event : threading.Event = None, on_output = None) -> ProcessResult:
+    """
+    Run a command and capture its output while it runs. The process is killed once it runs longer
+    than timeout seconds or when cancel_event is set, memory_limit caps its address space in bytes.
+    Optional on_output(stream_name, line) receives every line of stdout and stderr as it is printed.
+    Raises OSError if the command cannot be started.
+    """
+    start_time = int(time.time() * 1000)
+    start = time.perf_counter()
+
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL, cwd=cwd, start_new_session=True)
+
+    if memory_limit is not None and resource is not None and hasattr(resource, 'prlimit'):
+        try:
+            resource.prlimit(process.pid, resource.RLIMIT_AS, (memory_limit, memory_limit))
+        except (ProcessLookupError, OSError):
+            pass
+
+    stdout, stderr = bytearray(), bytearray()
+    readers = [
+        threading.Thread(target=read_stream, args=(process.stdout, stdout, 'stdout', on_output), daemon=True),
+        threading.Thread(target=read_stream, args=(process.stderr, stderr, 'stderr', on_output), daemon=True)
+    ]
+
+    for reader in readers:
+        reader.start()
+
+    timed_out, cancelled = False, False
+
+    while True:
+        try:
+            process.wait(timeout=POLL_INTERVAL)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+
+        if timeout is not None and time.perf_counter() - start > timeout:
+            timed_out = True
+        elif cancel_event is not None and cancel_event.is_set():
+            cancelled = True
+        else:
+            continue
+
+        kill_process(process)
+        process.wait()
+        break
+
+    for reader in readers:
+        reader.join()
+
+    duration = (time.perf_counter() - start) * 1000
+
+    return ProcessResult(args, process.returncode, bytes(stdout), bytes(stderr), start_time, duration, timed_out, cancelled)
@@ -0,0 +1,51 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+# Payload size and encode/decode time of the wire formats, and compression with the committed dictionary
+# compared to plain zlib
+# Usage: python test/benchmark_wire_codec.py [repeats]
+
+import os
+import sys
+import time
+import zlib
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import wire_codec
+from test_wire_codec import create_block_message, create_tx_batch_message
+
+def measure(function, repeats):
+    """ Average time of a call in milliseconds and its result """
+    start = time.perf_counter()
+
+    for _ in range(repeats):
+        result = function()
+
+    return (time.perf_counter() - start) / repeats * 1000, result
+
+def main(repeats):
+    dictionary_version = wire_codec.COMPRESSION_DICTIONARY_VERSIONS[-1]
+    messages = [('block', create_block_message(300, 30)), ('tx batch', create_tx_batch_message(300)), ('small tx batch', create_tx_batch_message(5))]
+
+    for name, message in messages:
+        for version in [wire_codec.WIRE_FORMAT_JSON] + wire_codec.SUPPORTED_WIRE_VERSIONS:
+            encode_time, data = measure(lambda: wire_codec.encode_message(message, version), repeats)
+            decode_time, _ = measure(lambda: wire_codec.decode_message(data), repeats)
+
+            format_name = f"{name} {'json' if version == wire_codec.WIRE_FORMAT_JSON else f'binary v{version}'}"
+
+            print(f"{format_name:>26}: {len(data):>7} B, encode {encode_time:5.2f} ms, decode {decode_time:5.2f} ms")
+
+            for level in [1, 6, 9]:
+                compress_time, compressed_data = measure(lambda: wire_codec.compress_message(data, dictionary_version, level), repeats)
+                decompress_time, _ = measure(lambda: wire_codec.decompress_message(compressed_data), repeats)
+                plain_size = len(zlib.compress(data, level))
+
+                print(f"{format_name:>26} zlib {level}: {len(compressed_data):>7} B ({plain_size:>7} B without the dictionary), compress {compress_time:5.2f} ms, decompress {decompress_time:5.2f} ms")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
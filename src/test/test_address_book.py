@@ -0,0 +1,87 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from address_book import AddressBook
+
+def test_add_discard():
+    book = AddressBook()
+    book.add("127.0.0.1:2222")
+    book.add("127.0.0.1:2222")
+
+    assert "127.0.0.1:2222" in book
+    assert len(book) == 1
+
+    book.discard("127.0.0.1:2222")
+
+    assert "127.0.0.1:2222" not in book
+
+def test_best_ordering():
+    book = AddressBook()
+
+    for peer_str in ["127.0.0.1:2222", "127.0.0.1:3333", "127.0.0.1:4444"]:
+        book.add(peer_str)
+
+    book.record_success("127.0.0.1:3333", 1)
+    book.record_failure("127.0.0.1:4444")
+
+    assert book.get_best() == ["127.0.0.1:3333", "127.0.0.1:2222", "127.0.0.1:4444"]
+    assert book.get_best(1) == ["127.0.0.1:3333"]
+    assert book.get_best(exclude={ "127.0.0.1:3333" }) == ["127.0.0.1:2222", "127.0.0.1:4444"]
+
+def test_persistence(tmp_path):
+    filepath = os.path.join(tmp_path, "address_book.json")
+
+    book = AddressBook(filepath)
+    book.add("127.0.0.1:2222")
+    book.record_success("127.0.0.1:2222", 10)
+    book.save()
+
+    loaded_book = AddressBook(filepath)
+    loaded_book.load()
+
+    entry = loaded_book.get_entry("127.0.0.1:2222")
+
+    assert entry['successes'] == 1
+    assert entry['failures'] == 0
+    assert entry['rtt'] == 10
+    assert entry['last_seen'] > 0
+
+def test_load_corrupted(tmp_path):
+    filepath = os.path.join(tmp_path, "address_book.json")
+
+    with open(filepath, 'w') as file:
+        file.write("not a json")
+
+    book = AddressBook(filepath)
+    book.load()
+
+    assert len(book) == 0
+
+def test_save_if_changed(tmp_path):
+    filepath = os.path.join(tmp_path, "address_book.json")
+
+    book = AddressBook(filepath)
+    book.save_if_changed()
+
+    assert not os.path.exists(filepath)
+
+    book.add("127.0.0.1:2222")
+
+    assert book.is_changed()
+
+    book.save_if_changed()
+
+    assert os.path.exists(filepath)
+    assert not book.is_changed()
+
+    book.record_failure("127.0.0.1:2222")
+
+    assert book.is_changed()
@@ -6,12 +6,15 @@
 
 import os
 import sys
+import time
 import pytest
 import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from bind_zokrates import Zokrates, CIRCUIT_PATH
+from bind_zokrates import Zokrates, CIRCUIT_PATH, CIRCUIT_MANIFEST, ZOKRATES_PROVING_TIMEOUT, FIELD_MODULUS, get_scratch_root, source_hash_cache, process_limits, validate_parameters, flatten_abi_type
 import util
 
 EXAMPLE_CORRECT_ZOKRATES = """
@@ -40,6 +43,60 @@ def test_get_constraint_count():
     assert Zokrates.get_constraint_count(os.path.join(os.path.dirname(__file__), CIRCUIT_PATH, 'b')) == 55
     assert Zokrates.get_constraint_count(os.path.join(os.path.dirname(__file__), CIRCUIT_PATH, 'c')) == 761
 
+def test_get_circuit_metadata(tmp_path):
+    circuit_folder = os.path.join(tmp_path, 'a')
+    shutil.copytree(os.path.join(os.path.dirname(__file__), CIRCUIT_PATH, 'a'), circuit_folder)
+
+    metadata = Zokrates.get_circuit_metadata(circuit_folder, '00845b36c160d19764a21fc5fcadd5e6a28c29d5fa6fd307026e0ecb8305e1ee')
+
+    assert metadata['constraint_count'] == 3
+    assert [i['name'] for i in metadata['inputs']] == ['factor1', 'factor2', 'product', 'integrity']
+    assert metadata['verification_key_hash'] == util.get_file_hash(os.path.join(circuit_folder, 'verification.key'))
+    assert os.path.exists(os.path.join(circuit_folder, CIRCUIT_MANIFEST))
+
+def test_get_circuit_metadata_from_manifest(tmp_path):
+    circuit_folder = os.path.join(tmp_path, 'a')
+    shutil.copytree(os.path.join(os.path.dirname(__file__), CIRCUIT_PATH, 'a'), circuit_folder)
+
+    with open(os.path.join(circuit_folder, CIRCUIT_MANIFEST), 'w') as file:
+        file.write('{"circuit_hash": "abc", "constraint_count": 42, "inputs": []}')
+
+    # manifest of the same circuit is served without running Zokrates
+    assert Zokrates.get_circuit_metadata(circuit_folder, 'abc')['constraint_count'] == 42
+
+    # manifest of a different circuit is ignored
+    assert Zokrates.get_circuit_metadata(circuit_folder, 'def')['circuit_hash'] == 'def'
+
+def test_source_hash_cache(tmp_path):
+    zokrates_filepath = os.path.join(tmp_path, 'a.zok')
+
+    with open(zokrates_filepath, 'w') as file:
+        file.write(EXAMPLE_CORRECT_ZOKRATES)
+
+    first_hash = Zokrates.get_source_hash(zokrates_filepath)
+
+    assert first_hash == util.get_file_hash(zokrates_filepath)
+    assert source_hash_cache[zokrates_filepath][1] == first_hash
+
+    with open(zokrates_filepath, 'w') as file:
+        file.write(EXAMPLE_INCORRECT_ZOKRATES)
+
+    # changed size invalidates the cached hash
+    assert Zokrates.get_source_hash(zokrates_filepath) == util.get_file_hash(zokrates_filepath) != first_hash
+
+def test_source_hash_from_manifest(tmp_path):
+    circuit_folder = os.path.join(tmp_path, 'a')
+    shutil.copytree(os.path.join(os.path.dirname(__file__), CIRCUIT_PATH, 'a'), circuit_folder)
+
+    zokrates_filepath = os.path.join(circuit_folder, 'a.zok')
+    stat = os.stat(zokrates_filepath)
+
+    with open(os.path.join(circuit_folder, CIRCUIT_MANIFEST), 'w') as file:
+        file.write(f'{{"circuit_hash": "abc", "source": {{"file": "a.zok", "size": {stat.st_size}, "mtime_ns": {stat.st_mtime_ns}}}}}')
+
+    # unchanged source file is not rehashed
+    assert Zokrates.get_source_hash(zokrates_filepath) == "abc"
+
 def test_prepare_circuits():
     for directory in os.listdir(CIRCUIT_PATH):
             subfolder = os.path.join(CIRCUIT_PATH, directory)
@@ -119,6 +176,35 @@ def test_verify_proof():
     # check if temp folder and file were deleted
     assert not os.path.exists(os.path.join(circuit_folder, 'temp'))
 
+def test_concurrent_proofs_same_circuit():
+    circuit_folder = os.path.join(os.path.dirname(__file__), CIRCUIT_PATH, 'a')
+    circuit_files = sorted(os.listdir(circuit_folder))
+
+    parameters = ['2 2 4', '2 3 6', '3 3 9', '4 5 20']
+
+    with ThreadPoolExecutor(max_workers=len(parameters)) as pool:
+        proofs = list(pool.map(lambda p: Zokrates.generate_proof('1', circuit_folder, p), parameters))
+
+    with ThreadPoolExecutor(max_workers=len(parameters)) as pool:
+        results = list(pool.map(lambda args: Zokrates.verify_proof('1', circuit_folder, *args), zip(proofs, parameters)))
+
+    assert all(results)
+
+    # each proof carries its own public inputs
+    assert len(set(proofs)) == len(parameters)
+
+    # no intermediate files are left in the circuit folder
+    assert sorted(os.listdir(circuit_folder)) == circuit_files
+
+def test_scratch_folder_cleanup_on_failure():
+    scratch_root = get_scratch_root() or tempfile.gettempdir()
+    scratch_folders = set(os.listdir(scratch_root))
+
+    with pytest.raises(Exception):
+        Zokrates.generate_proof('1', os.path.join(os.path.dirname(__file__), CIRCUIT_PATH, 'a'), '2 2 3')
+
+    assert set(f for f in os.listdir(scratch_root) if f.startswith("zokrates-")) <= scratch_folders
+
 def test_generate_proof_invalid_params():
     with pytest.raises(Exception):
         proof = Zokrates.generate_proof('1', os.path.join(os.path.dirname(__file__), CIRCUIT_PATH, 'a'), '')
@@ -145,3 +231,104 @@ def test_get_circuit_hash():
 
     assert hash == "00845b36c160d19764a21fc5fcadd5e6a28c29d5fa6fd307026e0ecb8305e1ee"
 
+
+@pytest.fixture
+def fake_zokrates(tmp_path, monkeypatch):
+    """ Replace ZoKrates on PATH with a script, returns a function setting the script body """
+    def set_script(body):
+        script_filepath = tmp_path / 'zokrates'
+        script_filepath.write_text("#!/bin/sh\n" + body)
+        script_filepath.chmod(0o755)
+
+    monkeypatch.setenv('PATH', str(tmp_path) + os.pathsep + os.environ['PATH'])
+
+    yield set_script
+
+    Zokrates.set_limits()
+
+def test_verbose_output_does_not_deadlock(fake_zokrates):
+    fake_zokrates("head -c 4194304 /dev/zero; echo; echo 'constraint_count: 7'\n")
+
+    assert Zokrates.get_constraint_count(os.path.join(os.path.dirname(__file__), CIRCUIT_PATH, 'a')) == 7
+
+def test_proving_timeout(fake_zokrates):
+    fake_zokrates("sleep 10\n")
+    Zokrates.set_limits(proving_timeout=0.3)
+
+    start = time.perf_counter()
+
+    with pytest.raises(Exception):
+        Zokrates.generate_proof('1', os.path.join(os.path.dirname(__file__), CIRCUIT_PATH, 'a'), '2 2 4')
+
+    assert time.perf_counter() - start < 2
+
+    Zokrates.set_limits()
+
+    assert process_limits['proving_timeout'] == ZOKRATES_PROVING_TIMEOUT
+
+def test_batch_shares_scratch_folder(fake_zokrates, tmp_path):
+    log_filepath = tmp_path / 'calls.log'
+    fake_zokrates(f"""echo "$1 $PWD" >> {log_filepath}
+command=$1
+while [ $# -gt 0 ]; do
+    if [ "$command" = "compute-witness" ] && [ "$1" = "-o" ]; then echo witness > "$2"; fi
+    if [ "$command" = "generate-proof" ] && [ "$1" = "-j" ]; then echo "$2" > "$2"; fi
+    shift
+done
+""")
+
+    batch = Zokrates.prepare_batch(os.path.join(os.path.dirname(__file__), CIRCUIT_PATH, 'a'))
+    witnesses = [Zokrates.compute_witness('1', batch.get_circuit_folder(), parameters, batch=batch) for parameters in ['2 2 4', '2 3 6', '3 3 9']]
+
+    assert len(set(witness.get_witness_filepath() for witness in witnesses)) == 3
+    assert all(witness.get_work_folder() == batch.get_work_folder() for witness in witnesses)
+
+    proofs = [Zokrates.prove_witness(witness) for witness in witnesses]
+
+    assert len(set(proofs)) == 3
+
+    # ZoKrates takes a single witness per process, every process runs in the scratch folder of the batch
+    with open(log_filepath) as file:
+        calls = [line.split() for line in file.read().splitlines()]
+
+    assert [command for command, _ in calls] == ['compute-witness'] * 3 + ['generate-proof'] * 3
+    assert all(folder == batch.get_work_folder() for _, folder in calls)
+
+    # proven witnesses are removed right away, the folder once the batch is closed
+    assert os.listdir(batch.get_work_folder()) == []
+
+    batch.close()
+
+    assert not os.path.exists(batch.get_work_folder())
+
+FACTOR_INPUTS = [{ 'name': name, 'type': 'field', 'public': True } for name in ['factor1', 'factor2', 'product', 'integrity']]
+SQUARE_INPUTS = [{ 'name': 'x', 'type': 'u16', 'public': True }, { 'name': 'integrity', 'type': 'field', 'public': True }]
+
+def test_validate_parameters():
+    validate_parameters(FACTOR_INPUTS, '2 3 6')
+    validate_parameters(FACTOR_INPUTS, f'0 1 {FIELD_MODULUS - 1}')
+    validate_parameters(SQUARE_INPUTS, '65535')
+
+    for inputs, parameters in [(FACTOR_INPUTS, '2 3'), (FACTOR_INPUTS, '2 3 6 7'), (FACTOR_INPUTS, ''), (FACTOR_INPUTS, '2  3 6'),
+                               (FACTOR_INPUTS, '2 a 6'), (FACTOR_INPUTS, '-2 3 6'), (FACTOR_INPUTS, f'2 3 {FIELD_MODULUS}'),
+                               (SQUARE_INPUTS, '65536'), (SQUARE_INPUTS, 123)]:
+        with pytest.raises(ValueError):
+            validate_parameters(inputs, parameters)
+
+def test_flatten_abi_type():
+    array_type = { 'type': 'array', 'components': { 'size': 2, 'type': 'array', 'components': { 'size': 3, 'type': 'bool' } } }
+    struct_type = { 'type': 'struct', 'components': { 'name': 'Point', 'members': [{ 'name': 'x', 'type': 'field' }, { 'name': 'y', 'type': 'u8' }] } }
+
+    assert flatten_abi_type(array_type) == ['bool'] * 6
+    assert flatten_abi_type(struct_type) == ['field', 'u8']
+    assert flatten_abi_type({ 'type': 'tuple' }) is None
+
+    # unsupported inputs are not checked
+    validate_parameters([{ 'name': 't', 'type': 'tuple' }, FACTOR_INPUTS[-1]], 'anything')
+
+def test_validate_abi_of_circuits():
+    circuits = Zokrates.prepare_circuits()
+
+    for circuit_hash, circuit_folder in circuits.items():
+        inputs = Zokrates.get_circuit_metadata(circuit_folder, circuit_hash)['inputs']
+        validate_parameters(inputs, " ".join(["4"] * (len(inputs) - 1)))
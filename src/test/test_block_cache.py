@@ -0,0 +1,86 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import os
+import sys
+import json
+import hashlib
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import util
+import wire_codec
+from block import Block
+from block_header import BlockHeader
+from block_body import BlockBody
+from state_tree import StateTree
+from coin_tx import CoinTransaction
+from block_cache import EncodedBlockCache
+from utils import load_ecdsa_private_key
+
+SENDER = bytes.fromhex("0318b58b73bbfd6ec26f599649ecc624863c775e034c2afea0c94a1c0641d8f6f2")
+RECEIVER = bytes.fromhex("0008b58b73bbfd6ec26f599649ecc624863c775e034c2afea0c94a1c0641d8f000")
+
+def create_block(coin_tx_count):
+    private_key = load_ecdsa_private_key(os.path.join(os.path.dirname(__file__), 'misc/private_key'))
+
+    coin_txs = []
+
+    for amount in range(1, coin_tx_count + 1):
+        tx = CoinTransaction()
+        tx.setup(SENDER, RECEIVER, amount)
+        tx.sign(private_key)
+        coin_txs.append(tx)
+
+    body = BlockBody()
+    body.setup(coin_txs, [], StateTree())
+
+    header = BlockHeader()
+    header.setup(1, util.get_current_time(), 1, hashlib.sha256("abc".encode()).digest(), body.hash_coin_txs(), body.hash_proof_txs(), body.hash_state_tree(), RECEIVER)
+
+    block = Block()
+    block.setup(header, body)
+    block.finish_block()
+
+    return block
+
+def test_cached_encoding():
+    cache = EncodedBlockCache()
+    block = create_block(3)
+
+    encoded_block = cache.get(block)
+
+    assert encoded_block.get_value() == block.encode()
+    assert cache.get(block) is encoded_block
+    assert cache.get(block, include_proofs=False).get_value() == block.encode(include_proofs=False)
+    assert cache.get_hits() == 1
+    assert cache.get_misses() == 2
+
+    # serialized once, the same bytes are spliced into every message
+    assert encoded_block.get_encoding(wire_codec.WIRE_FORMAT_JSON) is encoded_block.get_encoding(wire_codec.WIRE_FORMAT_JSON)
+    assert json.loads(encoded_block.get_encoding(wire_codec.WIRE_FORMAT_JSON)) == block.encode()
+
+def test_bounded():
+    cache = EncodedBlockCache(max_size=2)
+    blocks = [create_block(count) for count in [1, 2, 3]]
+
+    for block in blocks:
+        cache.get(block)
+
+    cache.get(blocks[0])
+
+    assert len(cache) == 2
+    assert cache.get_misses() == 4
+
+def test_message_with_cached_block():
+    cache = EncodedBlockCache()
+    block = create_block(3)
+
+    message = { 'command': 'BLOCK', 'port': 2222, 'block': cache.get(block) }
+    expected_message = { 'command': 'BLOCK', 'port': 2222, 'block': block.encode() }
+
+    for version in [wire_codec.WIRE_FORMAT_JSON] + wire_codec.SUPPORTED_WIRE_VERSIONS:
+        assert wire_codec.decode_message(wire_codec.encode_message(message, version)) == (expected_message, version)
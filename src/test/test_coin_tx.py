@@ -141,3 +141,46 @@ def test_encode_decode_unsigned():
 
         # Cannot encode unsigned transactions
         tx.encode()
+
+def test_multiple_outputs():
+    private_key = load_ecdsa_private_key(os.path.join(os.path.dirname(__file__), './misc/private_key'))
+
+    outputs = [(bytes.fromhex(f"02{index:02x}" + "22" * 31), 10 * index) for index in range(1, 4)]
+
+    tx1 = CoinTransaction()
+    tx1.setup_outputs(bytes.fromhex("0318b58b73bbfd6ec26f599649ecc624863c775e034c2afea0c94a1c0641d8f6f2"), outputs)
+    tx1.sign(private_key)
+
+    encoded = tx1.encode()
+    tx2 = CoinTransaction()
+    tx2.decode(encoded)
+
+    assert tx2.verify_transaction()
+    assert tx2.get_outputs() == outputs
+    assert tx2.get_address_to() is None
+    assert tx2.get_amount() == 60
+    assert tx2.get_integrity() == tx1.get_integrity()
+
+    # the signature covers every output
+    encoded['outputs'][1]['amount'] = 21
+    tx3 = CoinTransaction()
+    tx3.decode(encoded)
+
+    with pytest.raises(ecdsa.BadSignatureError):
+        tx3.verify_transaction()
+
+def test_invalid_outputs():
+    sender = bytes.fromhex("0318b58b73bbfd6ec26f599649ecc624863c775e034c2afea0c94a1c0641d8f6f2")
+    receiver = bytes.fromhex("222222222222222222222222222222222222222222222222222222222222222222")
+
+    with pytest.raises(ValueError):
+        CoinTransaction().setup_outputs(sender, [])
+
+    with pytest.raises(ValueError):
+        CoinTransaction().setup_outputs(sender, [(receiver, 10), (sender, 10)])
+
+    with pytest.raises(ValueError):
+        CoinTransaction().setup_outputs(sender, [(receiver, 10), (receiver, 0)])
+
+    with pytest.raises(ValueError):
+        CoinTransaction().setup_outputs(sender, [(receiver, 1)] * 1001)
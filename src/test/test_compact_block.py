@@ -0,0 +1,203 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import os
+import sys
+import hashlib
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import util
+from block import Block
+from block_header import BlockHeader
+from block_body import BlockBody
+from state_tree import StateTree
+from coin_tx import CoinTransaction
+from proof_tx import ProofTransaction
+from compact_block import CompactBlock
+from proof_codec import encode_proof
+from utils import load_ecdsa_private_key
+
+SENDER = bytes.fromhex("0318b58b73bbfd6ec26f599649ecc624863c775e034c2afea0c94a1c0641d8f6f2")
+RECEIVER = bytes.fromhex("0008b58b73bbfd6ec26f599649ecc624863c775e034c2afea0c94a1c0641d8f000")
+CIRCUIT_HASH = bytes.fromhex("00845b36c160d19764a21fc5fcadd5e6a28c29d5fa6fd307026e0ecb8305e1ee")
+COIN_TX_FEE = 1
+PROOF_TX_FEE = 100
+
+def create_previous_state_tree():
+    state_tree = StateTree()
+    state_tree.set(SENDER, 1000)
+
+    return state_tree
+
+def create_transactions():
+    private_key = load_ecdsa_private_key(os.path.join(os.path.dirname(__file__), 'misc/private_key'))
+
+    coin_txs = []
+
+    for amount in [10, 20, 30]:
+        tx = CoinTransaction()
+        tx.setup(SENDER, RECEIVER, amount)
+        tx.sign(private_key)
+        coin_txs.append(tx)
+
+    proof_tx = ProofTransaction()
+    proof_tx.setup(SENDER, CIRCUIT_HASH, "2 3 6", 3)
+    proof_tx.sign(private_key)
+
+    return coin_txs, [proof_tx]
+
+def create_block(coin_txs, proof_txs):
+    # proven copies of the pending proof transactions
+    proven_txs = []
+
+    for tx in proof_txs:
+        obj = tx.encode()
+        obj['proof'] = '{"proof": "abc"}'
+
+        proven_tx = ProofTransaction()
+        proven_tx.decode(obj)
+        proven_txs.append(proven_tx)
+
+    state_tree = create_previous_state_tree()
+
+    for tx in coin_txs:
+        state_tree.apply_coin_tx(tx, COIN_TX_FEE, RECEIVER)
+
+    for tx in proven_txs:
+        state_tree.apply_proof_tx(tx, PROOF_TX_FEE, RECEIVER)
+
+    body = BlockBody()
+    body.setup(coin_txs, proven_txs, state_tree)
+
+    header = BlockHeader()
+    header.setup(1, util.get_current_time(), 1, hashlib.sha256("abc".encode()).digest(), body.hash_coin_txs(), body.hash_proof_txs(), body.hash_state_tree(), RECEIVER)
+
+    block = Block()
+    block.setup(header, body)
+    block.finish_block()
+
+    return block
+
+def transmit(block):
+    compact_block = CompactBlock()
+    compact_block.setup(block)
+
+    received = CompactBlock()
+    received.decode(compact_block.encode())
+
+    return received
+
+def test_reconstruct_from_mempool():
+    coin_txs, proof_txs = create_transactions()
+    block = create_block(coin_txs, proof_txs)
+
+    compact_block = transmit(block)
+    compact_block.reconstruct(coin_txs, proof_txs)
+
+    assert compact_block.is_complete()
+
+    reconstructed = compact_block.to_block(create_previous_state_tree(), COIN_TX_FEE, PROOF_TX_FEE)
+
+    assert reconstructed.get_current_block_hash() == block.get_current_block_hash()
+    assert reconstructed.get_state_tree().get_hash() == block.get_state_tree().get_hash()
+
+    # the proof is only referenced, it is fetched separately
+    reconstructed_tx = reconstructed.get_body().get_proof_txs()[0]
+
+    assert reconstructed_tx.get_proof() is None
+    assert reconstructed_tx.get_proof_digest() == hashlib.sha256(encode_proof('{"proof": "abc"}')).digest()
+
+    reconstructed_tx.attach_proof(encode_proof('{"proof": "abc"}'))
+
+    assert reconstructed_tx.get_proof() == '{"proof": "abc"}'
+
+    # mempool transaction is left unproven
+    assert proof_txs[0].get_proof() is None
+    assert not proof_txs[0].is_proven()
+
+def test_fetch_missing():
+    coin_txs, proof_txs = create_transactions()
+    block = create_block(coin_txs, proof_txs)
+
+    compact_block = transmit(block)
+    compact_block.reconstruct(coin_txs[1:], [])
+
+    assert not compact_block.is_complete()
+    assert compact_block.get_missing_coin_txs() == [0]
+    assert compact_block.get_missing_proof_txs() == [0]
+
+    with pytest.raises(ValueError):
+        compact_block.to_block(create_previous_state_tree(), COIN_TX_FEE, PROOF_TX_FEE)
+
+    compact_block.fill_missing([0], [coin_txs[0].encode()], [0], [block.get_body().get_proof_txs()[0].encode(include_proof=False)])
+
+    assert compact_block.is_complete()
+    assert compact_block.to_block(create_previous_state_tree(), COIN_TX_FEE, PROOF_TX_FEE).get_body().hash_coin_txs() == block.get_body().hash_coin_txs()
+
+def test_state_tree_mismatch():
+    coin_txs, proof_txs = create_transactions()
+    block = create_block(coin_txs, proof_txs)
+
+    compact_block = transmit(block)
+    compact_block.reconstruct(coin_txs, proof_txs)
+
+    # the state tree is not sent, a parent state which differs from the sender's does not match the header
+    with pytest.raises(ValueError):
+        compact_block.to_block(StateTree(), COIN_TX_FEE, PROOF_TX_FEE)
+
+def test_fill_mismatch():
+    coin_txs, proof_txs = create_transactions()
+    block = create_block(coin_txs, proof_txs)
+
+    compact_block = transmit(block)
+
+    with pytest.raises(ValueError):
+        compact_block.fill_missing([0], [coin_txs[1].encode()], [], [])
+
+def test_smaller_than_block():
+    coin_txs, proof_txs = create_transactions()
+    block = create_block(coin_txs, proof_txs)
+
+    compact_block = CompactBlock()
+    compact_block.setup(block)
+
+    assert len(str(compact_block.encode())) < len(str(block.encode()))
+
+def test_fill_different_proof():
+    coin_txs, proof_txs = create_transactions()
+    block = create_block(coin_txs, proof_txs)
+
+    compact_block = transmit(block)
+    compact_block.reconstruct(coin_txs, [])
+
+    # proof transactions are not in the mempool, so the one sent along has to reference the same proof
+    with pytest.raises(ValueError):
+        compact_block.fill_missing([], [], [0], [proof_txs[0].encode()])
+
+def test_size_independent_of_proofs():
+    coin_txs, proof_txs = create_transactions()
+    block = create_block(coin_txs, proof_txs)
+
+    large_proof_tx_obj = block.get_body().get_proof_txs()[0].encode()
+    large_proof_tx_obj['proof'] = '{"proof": "' + 'a' * 10000 + '"}'
+
+    large_proof_tx = ProofTransaction()
+    large_proof_tx.decode(large_proof_tx_obj)
+
+    large_block = create_block(coin_txs, [])
+    large_block.get_body().set_proof_txs([large_proof_tx])
+
+    compact_block = CompactBlock()
+    compact_block.setup(block)
+
+    large_compact_block = CompactBlock()
+    large_compact_block.setup(large_block)
+
+    assert len(str(large_compact_block.encode())) == len(str(compact_block.encode()))
+    assert len(str(large_block.encode(include_proofs=False))) == len(str(block.encode(include_proofs=False)))
+    assert len(str(large_block.encode())) > len(str(block.encode())) + 9000
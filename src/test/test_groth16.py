@@ -0,0 +1,207 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import os
+import sys
+import json
+import shutil
+import subprocess
+import hashlib
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from py_ecc import optimized_bn128 as bn128
+
+from bind_zokrates import Zokrates, CIRCUIT_PATH
+from proving import ProvingExecutor
+from groth16 import Groth16Verifier, get_verifier
+
+# toxic waste of the synthetic trusted setup, known so that valid proofs can be made without a prover
+ALPHA, BETA, GAMMA, DELTA = 11, 13, 17, 19
+GAMMA_ABC = [23, 29, 31]
+
+def encode_g1(point):
+    x, y = bn128.normalize(point)
+    return [hex(x.n), hex(y.n)]
+
+def encode_g2(point):
+    x, y = bn128.normalize(point)
+    return [[hex(c) for c in x.coeffs], [hex(c) for c in y.coeffs]]
+
+def make_verification_key():
+    return {
+        'scheme': 'g16',
+        'curve': 'bn128',
+        'alpha': encode_g1(bn128.multiply(bn128.G1, ALPHA)),
+        'beta': encode_g2(bn128.multiply(bn128.G2, BETA)),
+        'gamma': encode_g2(bn128.multiply(bn128.G2, GAMMA)),
+        'delta': encode_g2(bn128.multiply(bn128.G2, DELTA)),
+        'gamma_abc': [encode_g1(bn128.multiply(bn128.G1, ic)) for ic in GAMMA_ABC]
+    }
+
+def make_proof(inputs, a = 3, b = 5):
+    """ Pick A and B freely and solve the verification equation for C using the toxic waste """
+    vk_x = GAMMA_ABC[0] + sum(value * ic for value, ic in zip(inputs, GAMMA_ABC[1:]))
+    c = (a * b - ALPHA * BETA - vk_x * GAMMA) * pow(DELTA, -1, bn128.curve_order) % bn128.curve_order
+
+    return json.dumps({
+        'scheme': 'g16',
+        'curve': 'bn128',
+        'proof': {
+            'a': encode_g1(bn128.multiply(bn128.G1, a)),
+            'b': encode_g2(bn128.multiply(bn128.G2, b)),
+            'c': encode_g1(bn128.multiply(bn128.G1, c))
+        },
+        'inputs': [hex(value) for value in inputs]
+    })
+
+class ProvenTransaction:
+    """ Stands in for a proof transaction with an attached proof """
+
+    def __init__(self, index, proof):
+        self.__id = bytes([index]) * 32
+        self.__proof = proof
+
+    def get_id(self):
+        return self.__id
+
+    def get_circuit_hash(self):
+        return bytes(32)
+
+    def get_proof(self):
+        return self.__proof
+
+    def get_proofs(self):
+        return [self.__proof]
+
+    def get_proof_digest(self):
+        return hashlib.sha256(self.__proof.encode()).digest()
+
+    def get_batch_size(self):
+        return 1
+
+@pytest.fixture
+def synthetic_circuit(tmp_path):
+    with open(tmp_path / 'verification.key', 'w') as file:
+        json.dump(make_verification_key(), file)
+
+    return str(tmp_path)
+
+def test_verify():
+    verifier = Groth16Verifier(make_verification_key())
+
+    assert verifier.verify(make_proof([1, 1]))
+    assert verifier.verify(make_proof([7, 1], a=101, b=103))
+
+def test_reject_tampered_proof():
+    verifier = Groth16Verifier(make_verification_key())
+    proof = json.loads(make_proof([1, 1]))
+
+    proof['inputs'][0] = hex(2)
+    assert not verifier.verify(json.dumps(proof))
+
+    proof = json.loads(make_proof([1, 1]))
+    proof['proof']['c'] = encode_g1(bn128.multiply(bn128.G1, 5))
+    assert not verifier.verify(json.dumps(proof))
+
+def test_reject_malformed_proof():
+    verifier = Groth16Verifier(make_verification_key())
+    proof = json.loads(make_proof([1, 1]))
+
+    # wrong number of public inputs
+    proof['inputs'] = proof['inputs'][:1]
+    assert not verifier.verify(json.dumps(proof))
+
+    # point outside of the curve
+    proof = json.loads(make_proof([1, 1]))
+    proof['proof']['a'] = [hex(1), hex(3)]
+    assert not verifier.verify(json.dumps(proof))
+
+    # public input outside of the scalar field
+    proof = json.loads(make_proof([1, 1]))
+    proof['inputs'][0] = hex(bn128.curve_order + 1)
+    assert not verifier.verify(json.dumps(proof))
+
+def test_verify_batch():
+    verifier = Groth16Verifier(make_verification_key())
+    proofs = [make_proof([index, 1], a=index + 2, b=index + 3) for index in range(4)]
+
+    assert verifier.verify_batch(proofs)
+    assert verifier.verify_batch([])
+
+    invalid_proof = json.loads(proofs[2])
+    invalid_proof['inputs'][0] = hex(99)
+
+    assert not verifier.verify_batch(proofs[:2] + [json.dumps(invalid_proof)] + proofs[3:])
+
+def test_verifier_cache(synthetic_circuit):
+    assert get_verifier(synthetic_circuit) is get_verifier(synthetic_circuit)
+
+def test_native_verify_all(synthetic_circuit):
+    executor = ProvingExecutor(2, native_verification=True)
+    circuits = { bytes(32).hex(): synthetic_circuit }
+
+    # block metadata is the second to last public input
+    txs = [ProvenTransaction(index, make_proof([42, 1], a=index + 2, b=5)) for index in range(3)]
+
+    assert executor.verify_all(txs, '42', circuits)
+    assert len(executor.get_verification_cache()) == 3
+
+    # proof made for a different block
+    assert not executor.verify_all(txs, '43', circuits)
+
+    invalid_tx = ProvenTransaction(9, make_proof([42, 1], a=2, b=5).replace(hex(42), hex(41)))
+    assert not executor.verify_all([invalid_tx], '41', circuits)
+
+def test_py_ecc_imported_lazily():
+    # the client does not pay for loading py_ecc unless native verification is configured
+    code = "import sys, client; print('py_ecc' in sys.modules)"
+
+    assert subprocess.run([sys.executable, "-c", code], cwd=os.path.join(os.path.dirname(__file__), ".."), capture_output=True, text=True).stdout.strip() == "False"
+
+def test_parse_zokrates_verification_key():
+    circuit_folder = os.path.join(os.path.dirname(__file__), CIRCUIT_PATH, 'a')
+
+    get_verifier(circuit_folder)
+
+def load_recorded_proofs():
+    """ proof.json files of circuit 'a' with the outcome of 'zokrates verify' for each of them """
+    proofs_folder = os.path.join(os.path.dirname(__file__), 'misc/proofs/a')
+
+    with open(os.path.join(proofs_folder, 'expected.json')) as file:
+        cases = json.load(file)
+
+    for case in cases:
+        with open(os.path.join(proofs_folder, case['file'])) as file:
+            case['proof'] = file.read()
+
+    return cases
+
+def test_matches_zokrates_verifier():
+    circuit_folder = os.path.join(os.path.dirname(__file__), CIRCUIT_PATH, 'a')
+    verifier = get_verifier(circuit_folder)
+    cases = load_recorded_proofs()
+
+    assert any(case['verified'] for case in cases) and not all(case['verified'] for case in cases)
+
+    for case in cases:
+        assert verifier.verify(case['proof']) == case['verified']
+
+    valid_proofs = [case['proof'] for case in cases if case['verified']]
+    invalid_proofs = [case['proof'] for case in cases if not case['verified']]
+
+    assert verifier.verify_batch(valid_proofs)
+
+    for proof in invalid_proofs:
+        assert not verifier.verify_batch(valid_proofs + [proof])
+
+@pytest.mark.skipif(shutil.which('zokrates') is None, reason="ZoKrates is not installed")
+def test_recorded_proofs_match_zokrates():
+    circuit_folder = os.path.join(os.path.dirname(__file__), CIRCUIT_PATH, 'a')
+
+    for case in load_recorded_proofs():
+        assert Zokrates.verify_proof(case['block_metadata'], circuit_folder, case['proof'], case['parameters']) == case['verified']
@@ -0,0 +1,349 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import os
+import sys
+import pytest
+import shutil
+import hashlib
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import util
+import network
+import wire_codec
+import prover_backend
+from prover_backend import MockBackend
+from bind_zokrates import CIRCUIT_PATH
+from address_book import AddressBook
+from block import Block
+from block_header import BlockHeader
+from block_body import BlockBody
+from state_tree import StateTree
+from compact_block import CompactBlock
+from coin_tx import CoinTransaction
+from proof_tx import ProofTransaction
+from utils import load_ecdsa_private_key
+
+SENDER = bytes.fromhex("0318b58b73bbfd6ec26f599649ecc624863c775e034c2afea0c94a1c0641d8f6f2")
+RECEIVER = bytes.fromhex("0008b58b73bbfd6ec26f599649ecc624863c775e034c2afea0c94a1c0641d8f000")
+
+@pytest.fixture
+def empty_network():
+    network.setup_config(os.path.join(os.path.dirname(__file__), "misc/config/1_peer.json"))
+    network.peers.clear()
+    network.address_book = AddressBook()
+
+    yield
+
+    network.peers.clear()
+    network.address_book = AddressBook()
+
+def test_to_address():
+    assert network.to_address("127.0.0.1:2222") == ("127.0.0.1", 2222)
+
+@pytest.mark.usefixtures('empty_network')
+def test_add_peer():
+    peer = network.add_peer(("127.0.0.1", 2222))
+
+    assert network.get_peer(("127.0.0.1", 2222)) is peer
+    assert network.add_peer(("127.0.0.1", 2222)) is peer
+    assert network.get_peer(("127.0.0.1", 3333)) is None
+    assert len(network.get_peer_list()) == 1
+
+@pytest.mark.usefixtures('empty_network')
+def test_accept_peers():
+    network.port = 2222
+
+    # unreachable peers are kept until they fail repeatedly
+    network.accept_peers(["127.0.0.1:2222", "127.0.0.1:45671", "127.0.0.1:45672", "127.0.0.1:45671"])
+
+    assert network.get_peer(("127.0.0.1", 2222)) is None
+    assert network.get_peer(("127.0.0.1", 45671)) is not None
+    assert network.get_peer(("127.0.0.1", 45672)) is not None
+    assert len(network.get_peer_list()) == 2
+    assert "127.0.0.1:45671" in network.address_book
+
+@pytest.mark.usefixtures('empty_network')
+def test_evict_peer():
+    peer = network.add_peer(("127.0.0.1", 45671))
+    network.address_book.add(peer.to_string())
+
+    network.evict_peer(peer)
+
+    assert network.get_peer(("127.0.0.1", 45671)) is None
+    assert peer.to_string() not in network.address_book
+
+@pytest.mark.usefixtures('empty_network')
+def test_receive_pending_tx_batch():
+    private_key = load_ecdsa_private_key(os.path.join(os.path.dirname(__file__), 'misc/private_key'))
+
+    network.pending_coin_transactions = []
+
+    txs = []
+
+    for amount in [10, 20]:
+        tx = CoinTransaction()
+        tx.setup(SENDER, RECEIVER, amount)
+        tx.sign(private_key)
+        txs.append(tx.encode())
+
+    forged_tx = dict(txs[0])
+    forged_tx['id'] = "00" * 32
+
+    # duplicates are accepted only once and forged transactions are dropped
+    network.receive_pending_tx_batch([txs[0], txs[1], txs[0], forged_tx], [])
+    network.receive_pending_tx_batch([txs[1]], [])
+
+    assert [tx.encode() for tx in network.pending_coin_transactions] == txs
+
+    network.flush_transaction_broadcasts()
+    network.pending_coin_transactions = []
+
+@pytest.mark.usefixtures('empty_network')
+def test_reject_malformed_proof_request():
+    private_key = load_ecdsa_private_key(os.path.join(os.path.dirname(__file__), 'misc/private_key'))
+    circuit_hash = bytes.fromhex("00845b36c160d19764a21fc5fcadd5e6a28c29d5fa6fd307026e0ecb8305e1ee")
+
+    network.setup_circuits()
+    network.pending_proof_transactions = []
+
+    txs = []
+
+    for parameters in ["2 3 6", "2 3", "2 x 6"]:
+        tx = ProofTransaction()
+        tx.setup(SENDER, circuit_hash, parameters, 3)
+        tx.sign(private_key)
+        txs.append(tx.encode())
+
+    network.receive_pending_tx_batch([], txs)
+
+    assert [tx.get_parameters() for tx in network.pending_proof_transactions] == ["2 3 6"]
+
+    network.pending_proof_transactions = []
+    network.receive_pending_proof_transactions(txs)
+
+    assert [tx.get_parameters() for tx in network.pending_proof_transactions] == ["2 3 6"]
+
+    network.flush_transaction_broadcasts()
+    network.pending_proof_transactions = []
+
+@pytest.fixture
+def extra_circuit():
+    folder = os.path.join(CIRCUIT_PATH, 'klmnop4')
+
+    yield folder
+
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+
+@pytest.mark.usefixtures('empty_network')
+def test_rescan_circuits(extra_circuit):
+    network.setup_circuits()
+
+    circuit_count = len(network.circuits)
+
+    shutil.copytree(os.path.join(CIRCUIT_PATH, 'a'), extra_circuit)
+
+    with open(os.path.join(extra_circuit, 'a.zok'), 'a') as file:
+        file.write("\n")
+
+    network.rescan_circuits()
+
+    assert len(network.circuits) == circuit_count + 1
+    assert extra_circuit in network.circuits.values()
+    assert network.circuits.keys() == network.circuit_metadata.keys()
+
+    shutil.rmtree(extra_circuit)
+
+    network.rescan_circuits()
+
+    assert len(network.circuits) == circuit_count
+    assert network.circuits.keys() == network.circuit_metadata.keys()
+
+@pytest.mark.usefixtures('empty_network')
+def test_mock_backend_without_zokrates(tmp_path, monkeypatch):
+    monkeypatch.setenv('PATH', str(tmp_path))
+    monkeypatch.setattr(prover_backend, 'backend', MockBackend(constraint_counts={ 'a': 3, 'b': 55, 'c': 761 }))
+
+    assert shutil.which('zokrates') is None
+
+    network.setup_circuits()
+
+    circuit_hash = "00845b36c160d19764a21fc5fcadd5e6a28c29d5fa6fd307026e0ecb8305e1ee"
+
+    assert network.get_constraint_count(circuit_hash) == 3
+
+    private_key = load_ecdsa_private_key(os.path.join(os.path.dirname(__file__), 'misc/private_key'))
+
+    tx = ProofTransaction()
+    tx.setup(SENDER, bytes.fromhex(circuit_hash), "2 3 6", network.get_constraint_count(circuit_hash))
+    tx.sign(private_key)
+    tx.prove('1', network.circuits[circuit_hash])
+
+    assert tx.validate('1', network.circuits[circuit_hash])
+
+@pytest.mark.usefixtures('empty_network')
+def test_negotiate_wire_version():
+    peer = network.add_peer(("127.0.0.1", 2222))
+
+    assert peer.get_wire_version() == wire_codec.WIRE_FORMAT_JSON
+
+    # peers which do not advertise the binary codec keep receiving JSON
+    network.negotiate_wire_format(peer, { 'command': util.Command.GET_PEERS }, wire_codec.WIRE_FORMAT_JSON)
+
+    assert peer.get_wire_version() == wire_codec.WIRE_FORMAT_JSON
+
+    # JSON is sent by default even to peers which support the binary codec
+    network.negotiate_wire_format(peer, { 'command': util.Command.GET_PEERS, 'wire_versions': [wire_codec.WIRE_VERSION, 99] }, wire_codec.WIRE_FORMAT_JSON)
+
+    assert peer.get_wire_version() == wire_codec.WIRE_FORMAT_JSON
+    assert 'wire_versions' not in network.get_handshake()
+
+    network.config['wire_format'] = 'binary'
+
+    try:
+        network.negotiate_wire_format(peer, { 'command': util.Command.GET_PEERS, 'wire_versions': [wire_codec.WIRE_VERSION, 99] }, wire_codec.WIRE_FORMAT_JSON)
+
+        assert peer.get_wire_version() == wire_codec.WIRE_VERSION
+        assert network.get_handshake()['wire_versions'] == wire_codec.SUPPORTED_WIRE_VERSIONS
+    finally:
+        del network.config['wire_format']
+
+@pytest.mark.usefixtures('empty_network')
+def test_negotiate_compression():
+    peer = network.add_peer(("127.0.0.1", 2222))
+    handshake = network.get_handshake()
+
+    assert not peer.is_compression_enabled()
+
+    assert handshake['compression'] == wire_codec.COMPRESSION_DICTIONARY_VERSIONS
+
+    network.negotiate_wire_format(peer, { 'command': util.Command.GET_PEERS, **handshake }, wire_codec.WIRE_FORMAT_JSON)
+
+    assert peer.get_compression_dictionary() == wire_codec.COMPRESSION_DICTIONARY_VERSIONS[-1]
+
+    # the peer only knows dictionaries this node does not
+    network.negotiate_wire_format(peer, { 'command': util.Command.GET_PEERS, **handshake, 'compression': [99] }, wire_codec.WIRE_FORMAT_JSON)
+
+    assert not peer.is_compression_enabled()
+
+    # a compressed message enables compression with its dictionary
+    network.negotiate_wire_format(peer, { 'command': util.Command.GET_PEERS }, wire_codec.WIRE_VERSION, 1)
+
+    assert peer.get_compression_dictionary() == 1
+
+    network.config['compression_level'] = 0
+
+    try:
+        network.negotiate_wire_format(peer, { 'command': util.Command.GET_PEERS, **handshake }, wire_codec.WIRE_FORMAT_JSON)
+
+        assert not peer.is_compression_enabled()
+        assert 'compression' not in network.get_handshake()
+    finally:
+        del network.config['compression_level']
+
+def create_block(block_id, proof_txs = []):
+    body = BlockBody()
+    body.setup([], proof_txs, StateTree())
+
+    header = BlockHeader()
+    header.setup(block_id, util.get_current_time(), 1, hashlib.sha256(str(block_id).encode()).digest(), body.hash_coin_txs(), body.hash_proof_txs(), body.hash_state_tree(), RECEIVER)
+
+    block = Block()
+    block.setup(header, body)
+    block.finish_block()
+
+    return block
+
+def create_compact_block(block_id):
+    compact_block = CompactBlock()
+    compact_block.setup(create_block(block_id))
+
+    return compact_block
+
+@pytest.mark.usefixtures('empty_network')
+def test_pending_compact_blocks(monkeypatch):
+    monkeypatch.setattr(network, 'PENDING_COMPACT_BLOCKS_MAX_COUNT', 2)
+    network.pending_compact_blocks.clear()
+
+    compact_blocks = [create_compact_block(block_id) for block_id in [1, 2, 3]]
+
+    for compact_block in compact_blocks:
+        network.add_pending_compact_block(compact_block)
+
+    # the oldest compact block is dropped beyond the limit
+    assert network.take_pending_compact_block(compact_blocks[0].get_current_block_hash()) is None
+    assert network.take_pending_compact_block(compact_blocks[1].get_current_block_hash()) is compact_blocks[1]
+    assert network.take_pending_compact_block(compact_blocks[1].get_current_block_hash()) is None
+
+    # compact blocks at or below the chain tip are dropped
+    network.add_pending_compact_block(create_compact_block(network.blockchain[-1].get_id()))
+
+    assert len(network.pending_compact_blocks) == 1
+
+    # compact blocks whose transactions did not arrive in time are dropped
+    monkeypatch.setattr(network, 'PENDING_COMPACT_BLOCK_TIMEOUT', -1)
+
+    assert network.take_pending_compact_block(compact_blocks[2].get_current_block_hash()) is None
+    assert len(network.pending_compact_blocks) == 0
+
+def create_proof_tx_referencing_proof():
+    private_key = load_ecdsa_private_key(os.path.join(os.path.dirname(__file__), 'misc/private_key'))
+
+    tx = ProofTransaction()
+    tx.setup(SENDER, bytes.fromhex("00845b36c160d19764a21fc5fcadd5e6a28c29d5fa6fd307026e0ecb8305e1ee"), "2 3 6", 3)
+    tx.sign(private_key)
+
+    proven_tx = ProofTransaction()
+    proven_tx.decode({ **tx.encode(), 'proof_digest': 'ab' * 32 })
+
+    return proven_tx
+
+@pytest.mark.usefixtures('empty_network')
+def test_blocks_awaiting_proofs(monkeypatch):
+    monkeypatch.setattr(network, 'BLOCKS_AWAITING_PROOFS_MAX_COUNT', 2)
+    network.blocks_awaiting_proofs.clear()
+
+    latest_block_id = network.blockchain[-1].get_id()
+    blocks = [create_block(latest_block_id + offset, [create_proof_tx_referencing_proof()]) for offset in [1, 2, 3]]
+
+    with network.blocks_awaiting_proofs_lock:
+        # only blocks within the window above the chain tip are kept
+        assert not network.add_block_awaiting_proofs(create_block(latest_block_id), ("127.0.0.1", 2222), True)
+        assert not network.add_block_awaiting_proofs(create_block(latest_block_id + network.BLOCKS_AWAITING_PROOFS_WINDOW + 1), ("127.0.0.1", 2222), True)
+
+        # the block furthest above the chain tip is dropped beyond the limit
+        assert network.add_block_awaiting_proofs(blocks[0], ("127.0.0.1", 2222), True)
+        assert network.add_block_awaiting_proofs(blocks[2], ("127.0.0.1", 2222), True)
+        assert network.add_block_awaiting_proofs(blocks[1], ("127.0.0.1", 2222), True)
+
+        assert blocks[2].get_current_block_hash() not in network.blocks_awaiting_proofs
+
+        # relayed by another peer, which then has the proofs as well
+        assert network.add_block_awaiting_proofs(blocks[0], ("127.0.0.1", 3333), True)
+
+    requests = []
+    monkeypatch.setattr(network, 'request_proofs', lambda digests, peer_address: requests.append((digests, peer_address)))
+
+    # proofs requested within the timeout are not requested again
+    network.retry_proof_requests()
+
+    assert requests == []
+
+    monkeypatch.setattr(network, 'PROOF_REQUEST_TIMEOUT', -1)
+
+    network.retry_proof_requests()
+
+    # the peer which relayed the block is asked instead of the silent sender
+    assert (bytes.fromhex('ab' * 32) in requests[0][0]) and (("127.0.0.1", 3333) in [peer_address for _, peer_address in requests])
+    assert len(requests) == 2
+
+    for _ in range(network.PROOF_REQUEST_ATTEMPTS - 1):
+        network.retry_proof_requests()
+
+    # blocks whose proofs never arrive are dropped
+    assert len(network.blocks_awaiting_proofs) == 0
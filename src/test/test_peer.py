@@ -0,0 +1,68 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from peer import Peer, PEER_MAX_FAILURES
+
+def test_setup():
+    peer = Peer()
+    peer.setup_from_string("127.0.0.1:2222")
+
+    assert peer.to_tuple() == ("127.0.0.1", 2222)
+    assert peer.to_string() == "127.0.0.1:2222"
+    assert peer.get_latest_block_id() == 0
+    assert peer.is_active()
+    assert peer.is_available()
+
+def test_backoff():
+    peer = Peer()
+    peer.setup_from_string("127.0.0.1:2222")
+
+    peer.record_failure()
+
+    assert not peer.is_active()
+    assert not peer.is_available()
+    assert peer.get_failure_count() == 1
+
+    peer.mark_seen()
+
+    assert peer.is_active()
+    assert peer.is_available()
+    assert peer.get_failure_count() == 0
+
+def test_eviction():
+    peer = Peer()
+    peer.setup_from_string("127.0.0.1:2222")
+
+    for _ in range(PEER_MAX_FAILURES - 1):
+        peer.record_failure()
+
+    assert not peer.should_evict()
+
+    peer.record_failure()
+
+    assert peer.should_evict()
+
+def test_score():
+    fast_peer = Peer()
+    fast_peer.setup_from_string("127.0.0.1:2222")
+    fast_peer.record_success(5, 1000, 1)
+
+    slow_peer = Peer()
+    slow_peer.setup_from_string("127.0.0.1:3333")
+    slow_peer.record_success(500, 1000, 10)
+
+    assert fast_peer.get_rtt() == 5
+    assert fast_peer.get_throughput() == 1e6
+    assert fast_peer.get_score() > slow_peer.get_score()
+
+    fast_peer.record_failure()
+
+    assert fast_peer.get_score() < 1000 / (1 + 5)
@@ -0,0 +1,91 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import os
+import sys
+import json
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from proof_codec import encode_proof, decode_proof
+
+def field_element(value):
+    return f"0x{value:064x}"
+
+def create_g16_proof():
+    return {
+        'scheme': 'g16',
+        'curve': 'bn128',
+        'proof': {
+            'a': [field_element(1), field_element(2)],
+            'b': [[field_element(3), field_element(4)], [field_element(5), field_element(6)]],
+            'c': [field_element(7), field_element(8)]
+        },
+        'inputs': [field_element(2), field_element(3), field_element(6), field_element(1 << 250), field_element(1)]
+    }
+
+def create_mock_proof():
+    return {
+        'scheme': 'mock',
+        'curve': 'none',
+        'proof': { 'digest': 'ab' * 32 },
+        'inputs': [field_element(2), field_element(1)]
+    }
+
+def test_g16_round_trip():
+    # ZoKrates writes the proof indented
+    proof = json.dumps(create_g16_proof(), indent=4)
+
+    assert json.loads(decode_proof(encode_proof(proof))) == create_g16_proof()
+
+def test_mock_round_trip():
+    proof = json.dumps(create_mock_proof())
+
+    assert decode_proof(encode_proof(proof)) == proof
+
+def test_batch_round_trip():
+    proof = json.dumps([create_g16_proof(), create_g16_proof()])
+
+    assert json.loads(decode_proof(encode_proof(proof))) == [create_g16_proof(), create_g16_proof()]
+
+    # a batch of a single proof stays a list
+    assert json.loads(decode_proof(encode_proof(json.dumps([create_mock_proof()])))) == [create_mock_proof()]
+
+def test_unknown_scheme_round_trip():
+    proof = '{"scheme": "gm17", "curve": "bn128", "proof": {}, "inputs": []}'
+
+    assert json.loads(decode_proof(encode_proof(proof))) == json.loads(proof)
+
+def test_canonical():
+    proof = create_g16_proof()
+    reformatted_proof = create_g16_proof()
+    reformatted_proof['proof']['a'] = ['0x1', '0X0002']
+
+    assert encode_proof(json.dumps(proof, indent=4)) == encode_proof(json.dumps(reformatted_proof))
+
+def test_size():
+    proof = json.dumps(create_g16_proof(), indent=4)
+
+    assert len(encode_proof(proof)) * 3 < len(proof)
+
+def test_malformed():
+    data = encode_proof(json.dumps(create_g16_proof()))
+
+    with pytest.raises(ValueError):
+        decode_proof(data[:-1])
+
+    with pytest.raises(ValueError):
+        decode_proof(data + b'\x00')
+
+    with pytest.raises(ValueError):
+        encode_proof('not a proof')
+
+    proof = create_g16_proof()
+    proof['inputs'][0] = field_element(1 << 256)
+
+    # does not fit into a field element, so it is not compacted
+    assert json.loads(decode_proof(encode_proof(json.dumps(proof)))) == proof
@@ -0,0 +1,78 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import os
+import sys
+import base64
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from proof_tx import ProofTransaction
+from proof_store import ProofStore, get_proof_digest
+from proof_codec import encode_proof
+from utils import load_ecdsa_private_key
+
+SENDER = bytes.fromhex("0318b58b73bbfd6ec26f599649ecc624863c775e034c2afea0c94a1c0641d8f6f2")
+CIRCUIT_HASH = bytes.fromhex("00845b36c160d19764a21fc5fcadd5e6a28c29d5fa6fd307026e0ecb8305e1ee")
+PROOF = encode_proof('{"proof": "abc"}')
+OTHER_PROOF = encode_proof('{"proof": "def"}')
+
+def create_detached_proof_tx(proof):
+    private_key = load_ecdsa_private_key(os.path.join(os.path.dirname(__file__), 'misc/private_key'))
+
+    tx = ProofTransaction()
+    tx.setup(SENDER, CIRCUIT_HASH, "2 3 6", 3)
+    tx.sign(private_key)
+
+    obj = tx.encode()
+    obj['proof_digest'] = get_proof_digest(proof).hex()
+
+    detached_tx = ProofTransaction()
+    detached_tx.decode(obj)
+
+    return detached_tx
+
+def test_put_get():
+    store = ProofStore()
+
+    digest = store.put(PROOF)
+
+    assert digest == get_proof_digest(PROOF)
+    assert digest in store
+    assert store.get(digest) == PROOF
+    assert store.get(get_proof_digest(encode_proof('{}'))) is None
+    assert len(store) == 1
+
+def test_attach_proofs():
+    store = ProofStore()
+    txs = [create_detached_proof_tx(PROOF), create_detached_proof_tx(OTHER_PROOF)]
+
+    store.put(PROOF)
+
+    assert store.attach_proofs(txs) == [get_proof_digest(OTHER_PROOF)]
+    assert txs[0].get_compact_proof() == PROOF
+    assert txs[0].get_proof() == '{"proof": "abc"}'
+    assert txs[1].get_proof() is None
+
+def test_attach_mismatching_proof():
+    tx = create_detached_proof_tx(PROOF)
+
+    with pytest.raises(ValueError):
+        tx.attach_proof(OTHER_PROOF)
+
+def test_encode_without_proof():
+    tx = create_detached_proof_tx(PROOF)
+    tx.attach_proof(PROOF)
+
+    # full encoding is unchanged, the digest is derived from the proof
+    assert 'proof_digest' not in tx.encode()
+    assert tx.encode()['proof'] == base64.b64encode(PROOF).decode()
+
+    obj = tx.encode(include_proof=False)
+
+    assert obj['proof'] == ''
+    assert obj['proof_digest'] == get_proof_digest(PROOF).hex()
@@ -78,3 +78,28 @@ def test_invalid_signature():
         )
 
         tx.sign(private_key)
+
+def test_batch():
+    tx = ProofTransaction()
+
+    tx.setup(
+        bytes.fromhex("0318b58b73bbfd6ec26f599649ecc624863c775e034c2afea0c94a1c0641d8f6f2"),
+        bytes.fromhex("00845b36c160d19764a21fc5fcadd5e6a28c29d5fa6fd307026e0ecb8305e1ee"),
+        "2 3 6,2 2 4,3 3 9",
+        3
+    )
+
+    assert tx.is_batch()
+    assert tx.get_batch_size() == 3
+    assert tx.get_parameter_sets() == ["2 3 6", "2 2 4", "3 3 9"]
+    assert tx.get_proofs() is None
+
+def test_batch_too_large():
+    with pytest.raises(ValueError):
+        tx = ProofTransaction()
+        tx.setup(
+            bytes.fromhex("0318b58b73bbfd6ec26f599649ecc624863c775e034c2afea0c94a1c0641d8f6f2"),
+            bytes.fromhex("00845b36c160d19764a21fc5fcadd5e6a28c29d5fa6fd307026e0ecb8305e1ee"),
+            ",".join(["2 3 6"] * 1001),
+            3
+        )
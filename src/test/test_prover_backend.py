@@ -0,0 +1,181 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import os
+import sys
+import json
+import time
+import threading
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from bind_zokrates import CIRCUIT_PATH
+from proof_tx import ProofTransaction
+from proving import ProvingExecutor
+from prover_backend import MockBackend, ZokratesBackend, create_backend
+import prover_backend
+from utils import load_ecdsa_private_key
+
+CIRCUIT_FOLDER = os.path.join(os.path.dirname(__file__), CIRCUIT_PATH, 'a')
+CIRCUIT_HASH = "00845b36c160d19764a21fc5fcadd5e6a28c29d5fa6fd307026e0ecb8305e1ee"
+
+@pytest.fixture
+def mock_backend():
+    previous_backend = prover_backend.get_backend()
+    prover_backend.set_backend(MockBackend(prove_latency=100, verify_latency=10))
+
+    yield prover_backend.get_backend()
+
+    prover_backend.set_backend(previous_backend)
+
+def create_proof_tx(parameters):
+    private_key = load_ecdsa_private_key(os.path.join(os.path.dirname(__file__), './misc/private_key'))
+
+    tx = ProofTransaction()
+    tx.setup(bytes.fromhex(private_key.get_verifying_key().to_string('compressed').hex()), bytes.fromhex(CIRCUIT_HASH), parameters, 3)
+    tx.sign(private_key)
+
+    return tx
+
+def test_create_backend():
+    assert isinstance(create_backend({}), ZokratesBackend)
+    assert isinstance(create_backend({ 'prover_backend': 'mock', 'mock_prover': { 'prove_latency': 5 } }), MockBackend)
+
+    with pytest.raises(ValueError):
+        create_backend({ 'prover_backend': 'xyz' })
+
+def test_mock_deterministic():
+    backend = MockBackend()
+
+    proof = backend.generate_proof('1', CIRCUIT_FOLDER, '2 2 4')
+
+    assert proof == backend.generate_proof('1', CIRCUIT_FOLDER, '2 2 4')
+    assert proof != backend.generate_proof('2', CIRCUIT_FOLDER, '2 2 4')
+
+    # same layout of public inputs as ZoKrates, block metadata is the second to last one
+    assert int(json.loads(proof)['inputs'][-2], 0) == 1
+
+def test_mock_verify():
+    backend = MockBackend()
+
+    proof = backend.generate_proof('1', CIRCUIT_FOLDER, '2 2 4')
+
+    assert backend.verify_proof('1', CIRCUIT_FOLDER, proof, '2 2 4')
+
+    tampered_proof = json.loads(proof)
+    tampered_proof['inputs'][0] = f"0x{3:064x}"
+
+    assert not backend.verify_proof('1', CIRCUIT_FOLDER, json.dumps(tampered_proof), '2 2 4')
+
+    with pytest.raises(AssertionError):
+        backend.verify_proof('2', CIRCUIT_FOLDER, proof, '2 2 4')
+
+def test_mock_invalid_parameters():
+    backend = MockBackend()
+
+    with pytest.raises(Exception):
+        backend.generate_proof('1', CIRCUIT_FOLDER, '2 2')
+
+    with pytest.raises(Exception):
+        backend.generate_proof('1', CIRCUIT_FOLDER, '1 a b')
+
+    with pytest.raises(TypeError):
+        backend.generate_proof('1', CIRCUIT_FOLDER, 123)
+
+def test_mock_cancel(tmp_path):
+    with open(tmp_path / 'manifest.json', 'w') as file:
+        json.dump({ 'constraint_count': 1 }, file)
+
+    with open(tmp_path / 'abi.json', 'w') as file:
+        json.dump({ 'inputs': [{}, {}] }, file)
+
+    cancel_event = threading.Event()
+    threading.Timer(0.1, cancel_event.set).start()
+
+    start = time.perf_counter()
+
+    with pytest.raises(Exception):
+        MockBackend(10000).generate_proof('1', str(tmp_path), '2', cancel_event)
+
+    assert time.perf_counter() - start < 2
+
+def test_mock_latency_model(tmp_path):
+    with open(tmp_path / 'manifest.json', 'w') as file:
+        json.dump({ 'constraint_count': 1000 }, file)
+
+    assert MockBackend(10, 0.5).get_proving_time(str(tmp_path), '1', '1') == 510
+
+    jittered_backend = MockBackend(100, jitter=0.2)
+    proving_time = jittered_backend.get_proving_time(str(tmp_path), '2 2 4', '1')
+
+    assert 80 <= proving_time <= 120
+    assert proving_time == jittered_backend.get_proving_time(str(tmp_path), '2 2 4', '1')
+
+def test_mock_constraint_count(tmp_path):
+    circuit_folder = tmp_path / 'a'
+    circuit_folder.mkdir()
+
+    with pytest.raises(Exception):
+        MockBackend().get_constraint_count(str(circuit_folder))
+
+    # counts cached in the manifest by an earlier ZoKrates run are used when the configuration has none
+    with open(circuit_folder / 'manifest.json', 'w') as file:
+        json.dump({ 'constraint_count': 1000 }, file)
+
+    assert MockBackend().get_constraint_count(str(circuit_folder)) == 1000
+    assert create_backend({ 'prover_backend': 'mock', 'mock_prover': { 'constraint_counts': { 'a': 3 } } }).get_constraint_count(str(circuit_folder)) == 3
+    assert MockBackend(10, 0.5, constraint_counts={ 'a': 20 }).get_proving_time(str(circuit_folder), '1', '1') == 20
+
+def test_proof_tx_with_mock(mock_backend):
+    tx = create_proof_tx("2 2 4")
+
+    tx.prove('1', CIRCUIT_FOLDER)
+
+    assert tx.get_proof() is not None
+    assert tx.validate('1', CIRCUIT_FOLDER)
+
+def test_block_pipeline_with_mock(mock_backend):
+    txs = [create_proof_tx(f"{index} 2 {index * 2}") for index in range(1, 9)]
+    circuits = { CIRCUIT_HASH: CIRCUIT_FOLDER }
+    executor = ProvingExecutor(8)
+
+    start = time.perf_counter()
+    timings = executor.prove_all(txs, '1', circuits)
+    duration = time.perf_counter() - start
+
+    assert len(timings) == 8
+    assert duration < 0.5
+
+    assert executor.verify_all(txs, '1', circuits)
+
+def test_batch_proof_tx_with_mock(mock_backend):
+    tx = create_proof_tx("2 2 4,2 3 6,3 3 9")
+    circuits = { CIRCUIT_HASH: CIRCUIT_FOLDER }
+    executor = ProvingExecutor(3)
+
+    start = time.perf_counter()
+    executor.prove_all([tx], '1', circuits)
+    duration = time.perf_counter() - start
+
+    # parameter sets are proven on separate workers
+    assert duration < 0.25
+    assert len(tx.get_proofs()) == 3
+    assert tx.validate('1', CIRCUIT_FOLDER)
+    assert executor.verify_all([tx], '1', circuits)
+
+    # a batch survives encoding
+    decoded_tx = ProofTransaction()
+    decoded_tx.decode(tx.encode())
+
+    assert decoded_tx.get_proofs() == tx.get_proofs()
+    assert decoded_tx.validate('1', CIRCUIT_FOLDER)
+
+    # every parameter set needs its proof
+    incomplete_tx = ProofTransaction()
+    incomplete_tx.decode({ **tx.encode(), 'proof': json.dumps(json.loads(tx.get_proof())[0:2]) })
+
+    assert not incomplete_tx.validate('1', CIRCUIT_FOLDER)
@@ -0,0 +1,407 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import os
+import sys
+import time
+import hashlib
+import pytest
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from proving import ProvingExecutor, ProvingTimeModel, VerificationCache, get_worker_count, schedule_proofs, PROVING_TIME_DEFAULT
+
+def sleep(duration, cancel_event):
+    """ Sleep which is interrupted like a killed ZoKrates process once cancel_event is set """
+    if cancel_event is not None and cancel_event.wait(duration):
+        raise Exception("Cancelled")
+
+    if cancel_event is None:
+        time.sleep(duration)
+
+class SleepingProofTransaction:
+    """ Stands in for a proof transaction whose witness computation and proving take a fixed amount of time """
+
+    def __init__(self, index, circuit_hash, duration, fail = False, complexity = 1, witness_duration = 0, tracker = None, batch_size = 1, fail_proof = False):
+        self.__id = bytes([index]) * 32
+        self.__circuit_hash = circuit_hash
+        self.__duration = duration
+        self.__fail = fail
+        self.__complexity = complexity
+        self.__witness_duration = witness_duration
+        self.__tracker = tracker
+        self.__batch_size = batch_size
+        self.__fail_proof = fail_proof
+        self.proven_indices = []
+        self.discarded_count = 0
+        self.cancelled_count = 0
+
+    def get_id(self):
+        return self.__id
+
+    def get_circuit_hash(self):
+        return self.__circuit_hash
+
+    def get_complexity(self):
+        return self.__complexity
+
+    def get_batch_size(self):
+        return self.__batch_size
+
+    def prepare_batch(self, circuit_folder):
+        return None
+
+    def close_batch(self, batch):
+        pass
+
+    def compute_witness(self, block_metadata, circuit_folder, index = 0, batch = None, cancel_event = None):
+        try:
+            sleep(self.__witness_duration, cancel_event)
+        except:
+            self.cancelled_count += 1
+            raise
+
+        if self.__fail:
+            raise Exception("Failed to compute witness")
+
+        if self.__tracker is not None:
+            self.__tracker.add()
+
+        return self.__id
+
+    def prove_witness(self, witness, index = 0, cancel_event = None):
+        assert witness == self.__id
+
+        if self.__tracker is not None:
+            self.__tracker.remove()
+
+        try:
+            sleep(self.__duration, cancel_event)
+        except:
+            self.cancelled_count += 1
+            raise
+
+        if self.__fail_proof:
+            raise Exception("Failed to generate proof")
+
+        self.proven_indices.append(index)
+
+    def discard_witness(self, witness):
+        assert witness == self.__id
+
+        if self.__tracker is not None:
+            self.__tracker.remove()
+
+        self.discarded_count += 1
+
+class WitnessTracker:
+    """ Counts witnesses which were computed but are not being proven yet """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.waiting = 0
+        self.max_waiting = 0
+
+    def add(self):
+        with self.__lock:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+
+    def remove(self):
+        with self.__lock:
+            self.waiting -= 1
+
+CIRCUITS = { bytes([index]).hex() * 32: f"circuit_{index}" for index in range(4) }
+
+def test_worker_count():
+    assert get_worker_count() >= 1
+
+def test_prove_concurrently():
+    txs = [SleepingProofTransaction(index, bytes([index]) * 32, 0.2) for index in range(4)]
+
+    start = time.perf_counter()
+    timings = ProvingExecutor(4).prove_all(txs, '1', CIRCUITS)
+    duration = time.perf_counter() - start
+
+    assert len(timings) == 4
+    assert all(timing >= 200 for timing in timings.values())
+    assert duration < 0.6
+
+def test_skip_unknown_circuit():
+    txs = [SleepingProofTransaction(0, bytes([0]) * 32, 0), SleepingProofTransaction(1, bytes([9]) * 32, 0)]
+
+    timings = ProvingExecutor(2).prove_all(txs, '1', CIRCUITS)
+
+    assert list(timings.keys()) == [txs[0].get_id()]
+
+def test_failure():
+    txs = [SleepingProofTransaction(0, bytes([0]) * 32, 0), SleepingProofTransaction(1, bytes([1]) * 32, 0, fail=True)]
+
+    with pytest.raises(Exception):
+        ProvingExecutor(2).prove_all(txs, '1', CIRCUITS)
+
+def test_discard_witnesses_after_failure():
+    failing_tx = SleepingProofTransaction(0, bytes([0]) * 32, 0.1, fail_proof=True)
+    txs = [SleepingProofTransaction(index, bytes([0]) * 32, 0, witness_duration=0.02) for index in range(1, 9)]
+
+    with pytest.raises(Exception):
+        ProvingExecutor(1, witness_workers=4, witness_queue_size=4).prove_all([failing_tx] + txs, '1', CIRCUITS)
+
+    # the block cannot be produced, so queued witnesses are discarded and the rest is not computed
+    assert all(len(tx.proven_indices) == 0 for tx in txs)
+    assert sum(tx.discarded_count for tx in txs) > 0
+
+def test_failure_cancels_running():
+    failing_tx = SleepingProofTransaction(0, bytes([0]) * 32, 0.1, fail_proof=True)
+    txs = [SleepingProofTransaction(1, bytes([1]) * 32, 10), SleepingProofTransaction(2, bytes([2]) * 32, 0, witness_duration=10)]
+
+    start = time.perf_counter()
+
+    # the original failure is raised rather than the cancellation of the other jobs
+    with pytest.raises(Exception, match="Failed to generate proof"):
+        ProvingExecutor(2, witness_workers=3).prove_all([failing_tx] + txs, '1', CIRCUITS)
+
+    assert time.perf_counter() - start < 2
+    assert all(tx.cancelled_count == 1 for tx in txs)
+
+def test_cancel_all():
+    executor = ProvingExecutor(2)
+    txs = [SleepingProofTransaction(index, bytes([index]) * 32, 10) for index in range(2)]
+
+    threading.Timer(0.2, executor.cancel_all).start()
+
+    start = time.perf_counter()
+
+    with pytest.raises(Exception):
+        executor.prove_all(txs, '1', CIRCUITS)
+
+    assert time.perf_counter() - start < 2
+    assert sum(tx.cancelled_count for tx in txs) == 2
+
+def test_prove_same_circuit_concurrently():
+    txs = [SleepingProofTransaction(index, bytes([0]) * 32, 0.2) for index in range(4)]
+
+    start = time.perf_counter()
+    timings = ProvingExecutor(4).prove_all(txs, '1', CIRCUITS)
+    duration = time.perf_counter() - start
+
+    assert len(timings) == 4
+    assert duration < 0.6
+
+class SleepingVerifiedProofTransaction(SleepingProofTransaction):
+    """ Stands in for a proven transaction whose verification takes a fixed amount of time """
+
+    def __init__(self, index, circuit_hash, duration, valid = True):
+        super().__init__(index, circuit_hash, duration)
+        self.__duration = duration
+        self.__valid = valid
+        self.validations = 0
+
+    def get_proof(self):
+        return f'{{"proof": "{self.get_id().hex()}"}}'
+
+    def get_proof_digest(self):
+        return hashlib.sha256(self.get_proof().encode()).digest()
+
+    def validate(self, block_metadata, circuit_folder, cancel_event = None):
+        self.validations += 1
+
+        try:
+            sleep(self.__duration, cancel_event)
+        except:
+            self.cancelled_count += 1
+            raise
+
+        return self.__valid
+
+def test_verify_concurrently():
+    txs = [SleepingVerifiedProofTransaction(index, bytes([index % 4]) * 32, 0.2) for index in range(4)]
+
+    start = time.perf_counter()
+    assert ProvingExecutor(4).verify_all(txs, '1', CIRCUITS)
+    assert time.perf_counter() - start < 0.6
+
+def test_verify_short_circuit():
+    txs = [SleepingVerifiedProofTransaction(0, bytes([0]) * 32, 0, valid=False)] + [SleepingVerifiedProofTransaction(index, bytes([1]) * 32, 0.5) for index in range(1, 8)]
+
+    start = time.perf_counter()
+    assert not ProvingExecutor(2).verify_all(txs, '1', CIRCUITS)
+    assert time.perf_counter() - start < 0.4
+
+def test_verify_failure_cancels_running():
+    txs = [SleepingVerifiedProofTransaction(0, bytes([0]) * 32, 0.1, valid=False), SleepingVerifiedProofTransaction(1, bytes([1]) * 32, 10)]
+
+    assert not ProvingExecutor(2).verify_all(txs, '1', CIRCUITS)
+
+    # the verification in progress is killed rather than left running in the background
+    time.sleep(0.1)
+    assert txs[1].cancelled_count == 1
+
+def test_verify_unknown_circuit():
+    txs = [SleepingVerifiedProofTransaction(0, bytes([9]) * 32, 0)]
+
+    assert not ProvingExecutor(2).verify_all(txs, '1', CIRCUITS)
+    assert ProvingExecutor(2).verify_all([], '1', CIRCUITS)
+
+def test_verification_cache():
+    executor = ProvingExecutor(2)
+    txs = [SleepingVerifiedProofTransaction(index, bytes([index % 4]) * 32, 0) for index in range(4)]
+    invalid_tx = SleepingVerifiedProofTransaction(5, bytes([0]) * 32, 0, valid=False)
+
+    assert executor.verify_all(txs, '1', CIRCUITS)
+    assert executor.verify_all(txs, '1', CIRCUITS)
+    assert all(tx.validations == 1 for tx in txs)
+
+    # different block metadata is verified again
+    assert executor.verify_all(txs[:1], '2', CIRCUITS)
+    assert txs[0].validations == 2
+
+    assert not executor.verify_all([invalid_tx], '1', CIRCUITS)
+    assert not executor.verify_all([invalid_tx], '1', CIRCUITS)
+    assert invalid_tx.validations == 1
+
+    cache = executor.get_verification_cache()
+
+    assert cache.get_hits() == 5
+    assert cache.get_misses() == 6
+    assert len(cache) == 6
+
+def test_verification_cache_bounded():
+    cache = VerificationCache(2)
+
+    cache.put((b'a', '1', b'x'), True)
+    cache.put((b'b', '1', b'x'), True)
+    cache.get((b'a', '1', b'x'))
+    cache.put((b'c', '1', b'x'), False)
+
+    # least recently used entry was evicted
+    assert len(cache) == 2
+    assert cache.get((b'b', '1', b'x')) is None
+    assert cache.get((b'a', '1', b'x')) is True
+    assert cache.get((b'c', '1', b'x')) is False
+
+def test_proving_time_model():
+    model = ProvingTimeModel()
+
+    assert model.predict(b'a', 100) == PROVING_TIME_DEFAULT
+
+    model.record(b'a', 100, 200)
+
+    assert model.predict(b'a', 100) == 200
+    # proportional to constraint count while only one count was measured
+    assert model.predict(b'b', 300) == 600
+
+    model.record(b'b', 300, 400)
+
+    # linear fit through both circuits
+    assert model.predict(b'c', 500) == pytest.approx(600)
+    assert model.predict(b'd', 0) == 200
+
+    model.record(b'a', 100, 300)
+
+    assert 200 < model.predict(b'a', 100) < 300
+
+def test_prove_all_records_proving_time():
+    executor = ProvingExecutor(2)
+    txs = [SleepingProofTransaction(0, bytes([0]) * 32, 0.05, complexity=10)]
+
+    executor.prove_all(txs, '1', CIRCUITS)
+
+    assert len(executor.get_proving_time_model()) == 1
+    assert executor.get_proving_time_model().predict(bytes([0]) * 32, 10) >= 50
+
+def test_schedule_proofs_within_budget():
+    model = ProvingTimeModel()
+
+    for index in range(4):
+        model.record(bytes([index]) * 32, 100, 100 * (index + 1))
+
+    # reward equals complexity with fee 1, times 100, 200, 300 and 400 ms
+    txs = [SleepingProofTransaction(index, bytes([index]) * 32, 0, complexity=100) for index in range(4)]
+
+    selected, deferred = schedule_proofs(txs, model, 300, 1, 1)
+
+    assert [tx.get_id() for tx in selected] == [txs[0].get_id(), txs[1].get_id()]
+    assert [tx.get_id() for tx in deferred] == [txs[2].get_id(), txs[3].get_id()]
+
+    # more workers prove more in the same time, proofs longer than the budget are always deferred
+    selected, deferred = schedule_proofs(txs, model, 300, 4, 1)
+
+    assert len(selected) == 3
+    assert deferred == [txs[3]]
+
+def test_schedule_proofs_prefers_reward():
+    model = ProvingTimeModel()
+    model.record(bytes([0]) * 32, 1, 100)
+    model.record(bytes([1]) * 32, 1, 250)
+
+    cheap_txs = [SleepingProofTransaction(index, bytes([0]) * 32, 0, complexity=10) for index in range(2)]
+    expensive_tx = SleepingProofTransaction(2, bytes([1]) * 32, 0, complexity=1000)
+
+    selected, deferred = schedule_proofs(cheap_txs + [expensive_tx], model, 250, 1, 1)
+
+    assert selected == [expensive_tx]
+    assert deferred == cheap_txs
+
+def test_schedule_proofs_cold_start():
+    txs = [SleepingProofTransaction(index, bytes([index]) * 32, 0, complexity=index + 1) for index in range(3)]
+
+    selected, deferred = schedule_proofs(txs, ProvingTimeModel(), 10, 4, 1)
+
+    assert selected == [txs[2]]
+    assert len(deferred) == 2
+
+def test_pipelined_witness_and_proof():
+    txs = [SleepingProofTransaction(index, bytes([0]) * 32, 0.1, witness_duration=0.1) for index in range(4)]
+
+    start = time.perf_counter()
+    timings = ProvingExecutor(1, witness_workers=1).prove_all(txs, '1', CIRCUITS)
+    duration = time.perf_counter() - start
+
+    # witness of the next proof is computed while the previous proof is generated, 0.5 s instead of 0.8 s
+    assert duration < 0.7
+    assert all(timing >= 200 for timing in timings.values())
+
+def test_bounded_witness_queue():
+    tracker = WitnessTracker()
+    txs = [SleepingProofTransaction(index, bytes([0]) * 32, 0.05, tracker=tracker) for index in range(8)]
+
+    ProvingExecutor(1, witness_workers=4, witness_queue_size=2).prove_all(txs, '1', CIRCUITS)
+
+    # at most one witness being proven and two waiting hold a slot
+    assert tracker.max_waiting <= 3
+
+def test_prove_batch_across_workers():
+    tx = SleepingProofTransaction(0, bytes([0]) * 32, 0.2, batch_size=4)
+
+    start = time.perf_counter()
+    timings = ProvingExecutor(4).prove_all([tx], '1', CIRCUITS)
+    duration = time.perf_counter() - start
+
+    # parameter sets of a batch are proven concurrently, the timing is summed over all of them
+    assert duration < 0.6
+    assert timings[tx.get_id()] >= 800
+    assert sorted(tx.proven_indices) == [0, 1, 2, 3]
+
+def test_schedule_proofs_batch():
+    model = ProvingTimeModel()
+    model.record(bytes([0]) * 32, 100, 100)
+
+    batch_tx = SleepingProofTransaction(0, bytes([0]) * 32, 0, complexity=100, batch_size=4)
+    single_tx = SleepingProofTransaction(1, bytes([0]) * 32, 0, complexity=100)
+
+    # the batch pays for four proofs and fits onto four workers
+    selected, deferred = schedule_proofs([single_tx, batch_tx], model, 100, 4, 1)
+
+    assert selected == [batch_tx]
+    assert deferred == [single_tx]
+
+    # on two workers it would take 200 ms
+    selected, deferred = schedule_proofs([single_tx, batch_tx], model, 100, 2, 1)
+
+    assert selected == [single_tx]
+    assert deferred == [batch_tx]
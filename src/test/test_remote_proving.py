@@ -0,0 +1,120 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import os
+import sys
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from bind_zokrates import CIRCUIT_PATH
+from prover_backend import MockBackend
+from remote_proving import ProverCoordinator, ProverWorker, RemoteBackend, get_circuit_hash
+import remote_proving
+
+CIRCUIT_FOLDER = os.path.join(os.path.dirname(__file__), CIRCUIT_PATH, 'a')
+COORDINATOR_PORT = 7531
+
+@pytest.fixture
+def coordinator():
+    coordinator = ProverCoordinator()
+    coordinator.start('127.0.0.1', COORDINATOR_PORT)
+
+    yield coordinator
+
+    coordinator.stop()
+
+@pytest.fixture
+def short_lease(monkeypatch):
+    monkeypatch.setattr(remote_proving, 'PROVER_LEASE_DURATION', 50)
+    monkeypatch.setattr(remote_proving, 'PROVER_LEASE_POLL', 50)
+
+def test_lease_and_submit():
+    coordinator = ProverCoordinator()
+    job = coordinator.submit('abc', '2 2 4', '1')
+
+    leased_job = coordinator.lease_job('worker')['job']
+
+    assert leased_job == { 'id': job.get_id(), 'circuit_hash': 'abc', 'parameters': '2 2 4', 'block_metadata': '1' }
+    assert coordinator.heartbeat('worker', job.get_id())['leased']
+    assert not coordinator.heartbeat('other', job.get_id())['leased']
+
+    assert coordinator.submit_proof('worker', job.get_id(), 'proof')['accepted']
+    assert coordinator.wait(job) == 'proof'
+
+def test_reassign_expired_lease(short_lease):
+    coordinator = ProverCoordinator()
+    job = coordinator.submit('abc', '2 2 4', '1')
+
+    assert coordinator.lease_job('dead')['job']['id'] == job.get_id()
+
+    time.sleep(0.1)
+
+    assert coordinator.lease_job('alive')['job']['id'] == job.get_id()
+    assert job.get_attempts() == 2
+
+    # the first worker lost its lease
+    assert not coordinator.heartbeat('dead', job.get_id())['leased']
+    assert not coordinator.fail_job('dead', job.get_id(), 'error')['accepted']
+
+    assert coordinator.submit_proof('alive', job.get_id(), 'proof')['accepted']
+    assert coordinator.wait(job) == 'proof'
+
+def test_fail_after_max_attempts(short_lease):
+    coordinator = ProverCoordinator()
+    job = coordinator.submit('abc', '2 2', '1')
+
+    for attempt in range(remote_proving.PROVER_MAX_ATTEMPTS):
+        assert coordinator.lease_job(f'worker_{attempt}')['job']['id'] == job.get_id()
+        assert coordinator.fail_job(f'worker_{attempt}', job.get_id(), 'Failed to compute witness')['accepted']
+
+    assert coordinator.lease_job('worker')['job'] is None
+
+    with pytest.raises(Exception):
+        coordinator.wait(job)
+
+def test_local_fallback_without_workers():
+    backend = RemoteBackend(ProverCoordinator(), MockBackend())
+
+    proof = backend.generate_proof('1', CIRCUIT_FOLDER, '2 2 4')
+
+    assert backend.verify_proof('1', CIRCUIT_FOLDER, proof, '2 2 4')
+
+def test_spread_across_workers(coordinator):
+    workers = [ProverWorker(f'127.0.0.1:{COORDINATOR_PORT}', MockBackend(prove_latency=300)) for _ in range(3)]
+
+    for worker in workers:
+        worker.start()
+
+    try:
+        # wait for the workers to poll the coordinator
+        time.sleep(0.5)
+
+        assert coordinator.get_active_worker_count() == 3
+
+        backend = RemoteBackend(coordinator, MockBackend())
+        parameters = ['2 2 4', '2 3 6', '3 3 9']
+
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=len(parameters)) as pool:
+            proofs = list(pool.map(lambda p: backend.generate_proof('1', CIRCUIT_FOLDER, p), parameters))
+
+        assert time.perf_counter() - start < 0.8
+        assert all(backend.verify_proof('1', CIRCUIT_FOLDER, proof, p) for proof, p in zip(proofs, parameters))
+
+        # workers count the proof only after the coordinator accepted it
+        time.sleep(0.1)
+
+        assert [worker.get_proven_count() for worker in workers] == [1, 1, 1]
+    finally:
+        for worker in workers:
+            worker.stop()
+
+def test_circuit_hash():
+    assert get_circuit_hash(CIRCUIT_FOLDER) == "00845b36c160d19764a21fc5fcadd5e6a28c29d5fa6fd307026e0ecb8305e1ee"
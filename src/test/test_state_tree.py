@@ -147,3 +147,42 @@ def test_proof_tx_application():
     assert st.get(sender) == 92
     assert st.get(miner) == 8
 
+
+def test_batch_proof_tx_application():
+    sender = bytes.fromhex("0318b58b73bbfd6ec26f599649ecc624863c775e034c2afea0c94a1c0641d8f6f2")
+    miner = bytes.fromhex("0008b58b73bbfd6ec26f599649ecc624863c775e034c2afea0c94a1c0641d8f000")
+
+    circuit_hash = bytes.fromhex("7a6e42a3c43b426aad2e6062d33be7cc0650e8ea724c12574d44a740cfd63319")
+
+    st = StateTree()
+    st.set(sender, 100)
+
+    tx = ProofTransaction()
+    tx.setup(sender, circuit_hash, "1111,2222,3333", 761)
+
+    # each parameter set is priced as a separate proof
+    st.apply_proof_tx(tx, 100, miner)
+
+    assert st.get(sender) == 77
+    assert st.get(miner) == 23
+
+def test_multi_output_coin_tx_application():
+    sender = bytes.fromhex("0318b58b73bbfd6ec26f599649ecc624863c775e034c2afea0c94a1c0641d8f6f2")
+    receiver1 = bytes.fromhex("7778b58b73bbfd6ec26f599649ecc624863c775e034c2afea0c94a1c0641d8f777")
+    receiver2 = bytes.fromhex("8888b58b73bbfd6ec26f599649ecc624863c775e034c2afea0c94a1c0641d8f888")
+    miner = bytes.fromhex("0008b58b73bbfd6ec26f599649ecc624863c775e034c2afea0c94a1c0641d8f000")
+
+    st = StateTree()
+    st.set(sender, 100)
+    st.set(receiver2, 5)
+
+    tx = CoinTransaction()
+    tx.setup_outputs(sender, [(receiver1, 10), (receiver2, 20)])
+
+    # the fee is paid once for the whole transaction
+    st.apply_coin_tx(tx, 1, miner)
+
+    assert st.get(sender) == 69
+    assert st.get(receiver1) == 10
+    assert st.get(receiver2) == 25
+    assert st.get(miner) == 1
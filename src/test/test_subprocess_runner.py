@@ -0,0 +1,74 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import os
+import sys
+import time
+import threading
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from subprocess_runner import run_process, OUTPUT_LIMIT
+
+def python_command(code):
+    return [sys.executable, '-c', code]
+
+def test_success():
+    result = run_process(python_command("print('hello'); import sys; print('world', file=sys.stderr)"))
+
+    assert result.is_success()
+    assert result.get_stdout() == b'hello\n'
+    assert result.get_stderr() == b'world\n'
+    assert result.get_duration() > 0
+
+def test_failure():
+    result = run_process(python_command("import sys; sys.exit(3)"))
+
+    assert not result.is_success()
+    assert result.get_return_code() == 3
+
+def test_large_output_does_not_deadlock():
+    # much more than a pipe can hold, written before the process exits
+    result = run_process(python_command("import sys; sys.stdout.write('x' * 4 * 1024 * 1024); sys.stderr.write('y' * 1024 * 1024)"), timeout=30)
+
+    assert result.is_success()
+    assert len(result.get_stdout()) == OUTPUT_LIMIT
+    assert len(result.get_stderr()) == OUTPUT_LIMIT
+
+def test_timeout():
+    start = time.perf_counter()
+    result = run_process(python_command("import time; time.sleep(10)"), timeout=0.3)
+
+    assert result.is_timed_out()
+    assert not result.is_success()
+    assert time.perf_counter() - start < 2
+
+def test_cancel():
+    cancel_event = threading.Event()
+    threading.Timer(0.3, cancel_event.set).start()
+
+    start = time.perf_counter()
+    result = run_process(python_command("import time; time.sleep(10)"), cancel_event=cancel_event)
+
+    assert result.is_cancelled()
+    assert time.perf_counter() - start < 2
+
+def test_streaming_output():
+    lines = []
+
+    run_process(python_command("print('a'); print('b')"), on_output=lambda stream_name, line: lines.append((stream_name, line)))
+
+    assert lines == [('stdout', 'a'), ('stdout', 'b')]
+
+def test_memory_limit():
+    result = run_process(python_command("x = bytearray(1024 * 1024 * 1024)"), memory_limit=256 * 1024 * 1024)
+
+    assert not result.is_success()
+
+def test_missing_command():
+    with pytest.raises(OSError):
+        run_process(['command-which-does-not-exist'])
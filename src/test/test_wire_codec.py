@@ -0,0 +1,238 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import os
+import sys
+import json
+import zlib
+import hashlib
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import util
+import wire_codec
+from block import Block
+from block_header import BlockHeader
+from block_body import BlockBody
+from state_tree import StateTree
+from coin_tx import CoinTransaction
+from proof_tx import ProofTransaction
+from utils import load_ecdsa_private_key
+
+SENDER = bytes.fromhex("0318b58b73bbfd6ec26f599649ecc624863c775e034c2afea0c94a1c0641d8f6f2")
+RECEIVER = bytes.fromhex("0008b58b73bbfd6ec26f599649ecc624863c775e034c2afea0c94a1c0641d8f000")
+CIRCUIT_HASH = bytes.fromhex("00845b36c160d19764a21fc5fcadd5e6a28c29d5fa6fd307026e0ecb8305e1ee")
+DICTIONARY_V1_HASH = "88cc47460f6bf072c0a7b15d2f484cf43abf9f9d3825715bc8a9c86a9d776fb2"
+
+def create_proof():
+    return json.dumps({
+        'scheme': 'g16',
+        'curve': 'bn128',
+        'proof': {
+            'a': [f"0x{index:064x}" for index in range(2)],
+            'b': [[f"0x{index:064x}" for index in range(2)], [f"0x{index:064x}" for index in range(2)]],
+            'c': [f"0x{index:064x}" for index in range(2)]
+        },
+        'inputs': [f"0x{value:064x}" for value in [2, 3, 6, 1 << 250, 1]]
+    })
+
+def create_transactions(coin_tx_count, proof_tx_count):
+    private_key = load_ecdsa_private_key(os.path.join(os.path.dirname(__file__), 'misc/private_key'))
+
+    coin_txs = []
+
+    for amount in range(1, coin_tx_count + 1):
+        tx = CoinTransaction()
+        tx.setup(SENDER, RECEIVER, amount)
+        tx.sign(private_key)
+        coin_txs.append(tx)
+
+    proof_txs = []
+
+    for _ in range(proof_tx_count):
+        tx = ProofTransaction()
+        tx.setup(SENDER, CIRCUIT_HASH, "2 3 6", 3)
+        tx.sign(private_key)
+
+        proven_tx = ProofTransaction()
+        proven_tx.decode({ **tx.encode(), 'proof': create_proof() })
+        proof_txs.append(proven_tx)
+
+    return coin_txs, proof_txs
+
+def create_block_message(coin_tx_count, proof_tx_count):
+    coin_txs, proof_txs = create_transactions(coin_tx_count, proof_tx_count)
+
+    body = BlockBody()
+    body.setup(coin_txs, proof_txs, StateTree())
+
+    header = BlockHeader()
+    header.setup(1, util.get_current_time(), 1, hashlib.sha256("abc".encode()).digest(), body.hash_coin_txs(), body.hash_proof_txs(), body.hash_state_tree(), RECEIVER)
+
+    block = Block()
+    block.setup(header, body)
+    block.finish_block()
+
+    return { 'command': util.Command.BROADCAST_BLOCK, 'port': 2222, 'block': block.encode() }
+
+def create_tx_batch_message(coin_tx_count):
+    coin_txs, _ = create_transactions(coin_tx_count, 0)
+
+    return { 'command': util.Command.BROADCAST_PENDING_TXS, 'port': 2222, 'coin_txs': [tx.encode() for tx in coin_txs], 'proof_txs': [] }
+
+def test_round_trip():
+    message = create_block_message(5, 2)
+
+    data = wire_codec.encode_message(message)
+
+    assert wire_codec.decode_message(data) == (message, wire_codec.WIRE_VERSION)
+
+    received_block = Block()
+    received_block.decode(wire_codec.decode_message(data)[0]['block'])
+
+    assert received_block.encode() == message['block']
+
+def test_values_round_trip():
+    message = {
+        'command': 'TEST',
+        'values': [None, True, False, 0, 127, 128, -1, -(1 << 70), 1 << 70, 0.25, '', 'ab', 'AB', 'abc', '2 3 6', 'žluťoučký', 'QUJD' * 16, 'QUJD' * 15 + 'QUJ=', (1, 2)],
+        'nested': { 'values': [{ 'ab': 1 }, { 'ab': 2 }] }
+    }
+
+    decoded_message, _ = wire_codec.decode_message(wire_codec.encode_message(message))
+
+    assert decoded_message == json.loads(json.dumps(message))
+
+def test_json_compatibility():
+    message = create_tx_batch_message(3)
+
+    data = wire_codec.encode_message(message, wire_codec.WIRE_FORMAT_JSON)
+
+    assert data == json.dumps(message).encode()
+    assert wire_codec.decode_message(data) == (message, wire_codec.WIRE_FORMAT_JSON)
+
+def test_negotiate():
+    assert wire_codec.negotiate_wire_version([1], [1]) == 1
+    assert wire_codec.negotiate_wire_version([1, 2], [1, 2, 3]) == 2
+    assert wire_codec.negotiate_wire_version([], [1]) == wire_codec.WIRE_FORMAT_JSON
+    assert wire_codec.negotiate_wire_version([1], [2]) == wire_codec.WIRE_FORMAT_JSON
+
+def test_malformed():
+    data = wire_codec.encode_message(create_tx_batch_message(1))
+
+    with pytest.raises(ValueError):
+        wire_codec.decode_message(data[:-1])
+
+    with pytest.raises(ValueError):
+        wire_codec.decode_message(data + b'\x00')
+
+    with pytest.raises(ValueError):
+        wire_codec.decode_message(bytes([wire_codec.BINARY_MARKER, 99]) + data[2:])
+
+    with pytest.raises(ValueError):
+        wire_codec.decode_message(bytes([wire_codec.BINARY_MARKER, wire_codec.WIRE_VERSION, wire_codec.TAG_LIST, 0]))
+
+    with pytest.raises(TypeError):
+        wire_codec.encode_message({ 'command': 'TEST', 'value': b'abc' })
+
+def test_compression():
+    message = create_block_message(20, 2)
+
+    for version in [wire_codec.WIRE_FORMAT_JSON, wire_codec.WIRE_VERSION]:
+        data = wire_codec.encode_message(message, version)
+        compressed_data = wire_codec.compress_message(data, 1, 6)
+
+        assert len(compressed_data) < len(data)
+        assert wire_codec.decompress_message(compressed_data) == (data, 1)
+
+        # uncompressed messages pass through
+        assert wire_codec.decompress_message(data) == (data, wire_codec.NO_COMPRESSION)
+
+    with pytest.raises(ValueError):
+        wire_codec.decompress_message(bytes([wire_codec.COMPRESSED_MARKER, 99]) + compressed_data[2:])
+
+    with pytest.raises(ValueError):
+        wire_codec.decompress_message(compressed_data[:-5])
+
+    with pytest.raises(ValueError):
+        wire_codec.compress_message(data, 99, 6)
+
+def test_compression_dictionary():
+    # small messages benefit most from the dictionary
+    for version in [wire_codec.WIRE_FORMAT_JSON, wire_codec.WIRE_VERSION]:
+        data = wire_codec.encode_message(create_tx_batch_message(2), version)
+
+        assert len(wire_codec.compress_message(data, 1, 6)) - 2 < len(zlib.compress(data, 6)) * 0.8
+
+def test_compression_dictionary_unchanged():
+    # peers only exchange dictionary versions, so a committed dictionary must never change
+    assert hashlib.sha256(wire_codec.get_compression_dictionary(1)).hexdigest() == DICTIONARY_V1_HASH
+
+def test_negotiate_compression():
+    assert wire_codec.negotiate_compression([1], [1]) == 1
+    assert wire_codec.negotiate_compression([1, 2], [1, 2, 3]) == 2
+    assert wire_codec.negotiate_compression([1], []) == wire_codec.NO_COMPRESSION
+    assert wire_codec.negotiate_compression([1], ['3f2a0c7e91b4d856']) == wire_codec.NO_COMPRESSION
+
+def test_pre_encoded():
+    block = create_block_message(5, 1)['block']
+
+    for message in [{ 'block': wire_codec.PreEncoded(block) }, { 'command': 'BLOCK', 'block': wire_codec.PreEncoded(block), 'port': 2222 }]:
+        expected_message = { key: value.get_value() if type(value) == wire_codec.PreEncoded else value for key, value in message.items() }
+
+        for version in [wire_codec.WIRE_FORMAT_JSON] + wire_codec.SUPPORTED_WIRE_VERSIONS:
+            assert wire_codec.decode_message(wire_codec.encode_message(message, version)) == (expected_message, version)
+
+    # keys of the embedded value do not refer to keys of the message
+    message = { 'header': 0, 'block': wire_codec.PreEncoded(block) }
+
+    assert wire_codec.decode_message(wire_codec.encode_message(message))[0] == { 'header': 0, 'block': block }
+
+def test_payload_size():
+    for message in [create_block_message(100, 10), create_tx_batch_message(100)]:
+        assert len(wire_codec.encode_message(message)) * 2 < len(wire_codec.encode_message(message, wire_codec.WIRE_FORMAT_JSON))
+
+def test_record_layouts():
+    coin_txs, _ = create_transactions(3, 0)
+    encoded_txs = [tx.encode() for tx in coin_txs]
+    header = create_block_message(1, 0)['block']['header']
+
+    for value in [encoded_txs[0], encoded_txs, header]:
+        data = wire_codec.encode_message({ 'value': value })
+
+        assert wire_codec.decode_message(data)[0] == { 'value': value }
+        assert data.count(b'address_from') + data.count(b'previous_block_hash') == 0
+
+    # a list of transactions is packed back to back
+    assert len(wire_codec.encode_message({ 'value': encoded_txs })) < len(wire_codec.encode_message({ 'value': encoded_txs }, 2)) - 3 * 12
+
+def test_record_layouts_fallback():
+    tx = create_transactions(1, 0)[0][0].encode()
+    values = [
+        { **tx, 'id': tx['id'].upper() },
+        { **tx, 'address_to': tx['address_to'][:-2] },
+        { **tx, 'amount': 1 << 64 },
+        { **tx, 'amount': -1 },
+        { **tx, 'amount': True },
+        { **tx, 'signature': 'xy' * 64 },
+        { **tx, 'extra': 1 },
+        { key: tx[key] for key in reversed(tx) }
+    ]
+
+    # values which do not fit the layout are encoded generically and restored exactly
+    for value in values:
+        for message in [{ 'value': value }, { 'value': [tx, value] }]:
+            decoded_message, _ = wire_codec.decode_message(wire_codec.encode_message(message))
+
+            assert decoded_message == message
+
+    decoded_message, _ = wire_codec.decode_message(wire_codec.encode_message({ 'value': { **tx, 'amount': True } }))
+
+    assert decoded_message['value']['amount'] is True
+
+    # earlier versions do not know the layouts
+    assert wire_codec.decode_message(wire_codec.encode_message({ 'value': [tx] }, 2)) == ({ 'value': [tx] }, 2)
@@ -8,6 +8,8 @@ import sys
 import os
 import time
 import hashlib
+import functools
+import ecdsa
 
 verbose_logging = False
 enable_colors = True
@@ -65,11 +67,23 @@ class Command:
     PENDING_PROOF_TXS = 'PENDING_PROOF_TXS'
     GET_CIRCUITS = 'GET_CIRCUITS'
     CIRCUITS = 'CIRCUITS'
+    GET_BLOCK_TXS = 'GET_BLOCK_TXS'
+    BLOCK_TXS = 'BLOCK_TXS'
+    GET_PROOFS = 'GET_PROOFS'
+    PROOFS = 'PROOFS'
 
     # broadcast commands
     BROADCAST_BLOCK = 'BROADCAST_BLOCK'
+    BROADCAST_COMPACT_BLOCK = 'BROADCAST_COMPACT_BLOCK'
     BROADCAST_PENDING_COIN_TX = 'BROADCAST_PENDING_COIN_TX'
     BROADCAST_PENDING_PROOF_TX = 'BROADCAST_PENDING_PROOF_TX'
+    BROADCAST_PENDING_TXS = 'BROADCAST_PENDING_TXS'
+
+    # remote proving commands
+    LEASE_PROOF_JOB = 'LEASE_PROOF_JOB'
+    PROOF_JOB_HEARTBEAT = 'PROOF_JOB_HEARTBEAT'
+    SUBMIT_PROOF = 'SUBMIT_PROOF'
+    FAIL_PROOF_JOB = 'FAIL_PROOF_JOB'
 
 def get_current_time():
     return round(time.time() * 1000)
@@ -82,6 +96,11 @@ def validate_hash(hash):
     if type(hash) != bytes: raise TypeError("Invalid hash type, only hash of bytes type is permitted")
     if len(hash) != 32: raise ValueError("Invalid hash size, expected length of 32 bytes")
 
+@functools.lru_cache(maxsize=4096)
+def get_verifying_key(address : bytes) -> ecdsa.VerifyingKey:
+    """ Parse SEC1 public key, cached since batches usually contain many transactions from the same sender """
+    return ecdsa.VerifyingKey.from_string(address, curve=ecdsa.SECP256k1)
+
 def find_files_with_extension(folder, extension):
     result = []
     for file in os.listdir(folder):
@@ -91,10 +110,5 @@ def find_files_with_extension(folder, extension):
     return result
 
 def get_file_hash(filename : str) -> str:
-    hasher = hashlib.new('sha256')
-
     with open(filename, 'rb') as file:
-        for chunk in iter(lambda: file.read(4096), b''):
-            hasher.update(chunk)
-
-    return hasher.hexdigest()
+        return hashlib.file_digest(file, 'sha256').hexdigest()
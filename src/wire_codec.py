@@ -0,0 +1,531 @@
+# ####################################################################################################
+# The analysis of cryptographic techniques for offloading computations and storage in blockchains
+# Master thesis 2023/24
+# Samuel Olekšák
+# ####################################################################################################
+
+import os
+import re
+import json
+import zlib
+import base64
+import struct
+
+WIRE_FORMAT_JSON = 0            # version used for peers which did not advertise the binary codec
+WIRE_VERSION = 3                # adds fixed layouts of transactions and block headers, see RECORD_LAYOUTS
+SUPPORTED_WIRE_VERSIONS = [1, 2, WIRE_VERSION]
+BINARY_MARKER = 0x00            # first byte of binary messages, JSON messages always start with '{'
+
+BASE64_MIN_LENGTH = 64          # shorter strings are not worth checking
+
+COMPRESSED_MARKER = 0x01        # first byte of compressed messages of any wire version, followed by the dictionary version
+NO_COMPRESSION = 0              # dictionary version used for peers which did not advertise a common dictionary
+COMPRESSION_DICTIONARY_VERSIONS = [1]   # committed dictionaries, a changed dictionary gets a new version
+COMPRESSION_DICTIONARY_FOLDER = os.path.join(os.path.dirname(__file__), "compression")
+COMPRESSION_DICTIONARY_SIZE = 32768     # zlib only uses the last 32 kB of a preset dictionary
+MAX_DECOMPRESSED_SIZE = 256 * 1024 * 1024   # bytes, guards against decompression bombs
+
+TAG_NONE = 0
+TAG_FALSE = 1
+TAG_TRUE = 2
+TAG_INT = 3                     # varint
+TAG_NEGATIVE_INT = 4            # varint of the absolute value
+TAG_FLOAT = 5                   # IEEE 754 double
+TAG_STR = 6                     # varint length, UTF-8
+TAG_HEX = 7                     # varint length, raw bytes of a lowercase hex string, e.g. hashes and addresses
+TAG_BASE64 = 8                  # varint length, raw bytes of a base64 string, e.g. compact proofs
+TAG_LIST = 9                    # varint count, items
+TAG_DICT = 10                   # varint count, (key, value) pairs
+TAG_EMBEDDED = 11               # varint length, value encoded with its own key table, since version 2
+TAG_RECORD = 12                 # layout index, dictionary packed in a fixed layout, since version 3
+TAG_RECORD_LIST = 13            # layout index, varint count, dictionaries packed in a fixed layout, since version 3
+
+FIELD_U64 = 0                   # unsigned 64 bit integer in fields of fixed layouts, other fields are hex strings of the given byte length
+
+# fixed layouts of the most common dictionaries, encode() results of coin transactions and block headers
+RECORD_LAYOUTS = [
+    [('id', 32), ('address_from', 33), ('address_to', 33), ('amount', FIELD_U64), ('signature', 64)],
+    [('serial_id', FIELD_U64), ('timestamp', FIELD_U64), ('difficulty', FIELD_U64), ('previous_block_hash', 32), ('current_block_hash', 32),
+     ('coin_txs_hash', 32), ('proof_txs_hash', 32), ('state_root_hash', 32), ('miner', 33)]
+]
+
+HEX_PATTERN = re.compile(r'(?:[0-9a-f]{2})+')
+
+class RecordLayout:
+    """
+    Fixed layout of a dictionary with the given keys in order. Integers are packed first, followed by
+    the hex strings converted to bytes at once, so a dictionary takes a single struct call either way.
+    """
+    __index: int
+    __keys: tuple
+    __int_keys: tuple
+    __hex_keys: tuple
+    __hex_lengths: list[int]        # characters of each hex string
+    __positions: list[tuple]        # for each key, (index among integers, None) or (start, end) of its hex string
+    __struct: struct.Struct
+
+    def __init__(self, index : int, fields : list[tuple]):
+        self.__index = index
+        self.__keys = tuple(key for key, _ in fields)
+        self.__int_keys = tuple(key for key, size in fields if size == FIELD_U64)
+        self.__hex_keys = tuple(key for key, size in fields if size != FIELD_U64)
+        self.__hex_lengths = [2 * size for _, size in fields if size != FIELD_U64]
+        self.__positions = []
+
+        hex_offset = 0
+
+        for key, size in fields:
+            if size == FIELD_U64:
+                self.__positions.append((self.__int_keys.index(key), None))
+            else:
+                self.__positions.append((hex_offset, hex_offset + 2 * size))
+                hex_offset += 2 * size
+
+        self.__struct = struct.Struct(f'>{len(self.__int_keys)}Q{hex_offset // 2}s')
+
+    def get_index(self) -> int:
+        return self.__index
+
+    def get_keys(self) -> tuple:
+        return self.__keys
+
+    def get_size(self) -> int:
+        return self.__struct.size
+
+    def pack(self, value : dict) -> bytes:
+        """ Packed dictionary, None if its values do not fit the layout """
+        ints = [value[key] for key in self.__int_keys]
+        hex_strings = [value[key] for key in self.__hex_keys]
+
+        if any(type(item) != int for item in ints) or any(type(item) != str for item in hex_strings):
+            return None
+
+        if [len(item) for item in hex_strings] != self.__hex_lengths:
+            return None
+
+        joined_hex = ''.join(hex_strings)
+
+        # only lowercase hex strings are restored exactly
+        if not (joined_hex.islower() or joined_hex.isdigit()):
+            return None
+
+        try:
+            return self.__struct.pack(*ints, bytes.fromhex(joined_hex))
+        except (ValueError, struct.error):
+            return None
+
+    def unpack(self, data : bytes, offset : int, count : int) -> list[dict]:
+        keys = self.__keys
+        positions = self.__positions
+        end = offset + self.__struct.size * count
+
+        if end > len(data):
+            raise IndexError("Records exceed the message")
+
+        records = []
+
+        for fields in self.__struct.iter_unpack(data[offset:end]):
+            hex_data = fields[-1].hex()
+            records.append(dict(zip(keys, [fields[start] if stop is None else hex_data[start:stop] for start, stop in positions])))
+
+        return records
+
+record_layouts = [RecordLayout(index, fields) for index, fields in enumerate(RECORD_LAYOUTS)]
+record_layouts_by_keys = { layout.get_keys(): layout for layout in record_layouts }
+
+class PreEncoded:
+    """
+    Message value serialized once per wire version and spliced into every message it is sent in, e.g. an
+    accepted block served to many peers. Supported as a top-level value of messages, and the wrapped value
+    must not be modified once it has been serialized.
+    """
+    __value: object
+    __encodings: dict[int, bytes]   # wire version -> serialized value
+
+    def __init__(self, value):
+        self.__value = value
+        self.__encodings = {}
+
+    def get_value(self):
+        return self.__value
+
+    def get_encoding(self, version : int) -> bytes:
+        encoding = self.__encodings.get(version)
+
+        if encoding is None:
+            if version == WIRE_FORMAT_JSON:
+                encoding = json.dumps(self.__value).encode()
+            else:
+                data = bytearray()
+                encode_value(self.__value, data, {}, version)
+                encoding = bytes(data)
+
+            self.__encodings[version] = encoding
+
+        return encoding
+
+def negotiate_wire_version(local_versions : list[int], remote_versions : list[int]) -> int:
+    """ Highest version supported by both sides, WIRE_FORMAT_JSON if there is none """
+    common_versions = set(local_versions) & set(remote_versions)
+
+    return max(common_versions) if len(common_versions) > 0 else WIRE_FORMAT_JSON
+
+def encode_message(message : dict, version : int = WIRE_VERSION) -> bytes:
+    """ Serialize a message built from encode() results of Encodeable types in the given wire version """
+    if version == WIRE_FORMAT_JSON:
+        return encode_json_message(message)
+
+    if version not in SUPPORTED_WIRE_VERSIONS:
+        raise ValueError(f"Unsupported wire version {version}")
+
+    data = bytearray([BINARY_MARKER, version])
+
+    if version == 1:
+        encode_value({ key: value.get_value() if type(value) == PreEncoded else value for key, value in message.items() }, data, {}, version)
+        return bytes(data)
+
+    keys = {}
+
+    data.append(TAG_DICT)
+    encode_varint(len(message), data)
+
+    for key, value in message.items():
+        encode_key(key, data, keys)
+
+        if type(value) == PreEncoded:
+            encode_bytes(TAG_EMBEDDED, value.get_encoding(version), data)
+        else:
+            encode_value(value, data, keys, version)
+
+    return bytes(data)
+
+def encode_json_message(message : dict) -> bytes:
+    pre_encoded_items = [(key, value) for key, value in message.items() if type(value) == PreEncoded]
+
+    if len(pre_encoded_items) == 0:
+        return json.dumps(message).encode()
+
+    data = json.dumps({ key: value for key, value in message.items() if type(value) != PreEncoded }).encode()
+    spliced_items = b', '.join(json.dumps(key).encode() + b': ' + value.get_encoding(WIRE_FORMAT_JSON) for key, value in pre_encoded_items)
+
+    return data[:-1] + (b', ' if len(data) > 2 else b'') + spliced_items + b'}'
+
+def decode_message(data : bytes) -> tuple[dict, int]:
+    """ Parse a message in any supported wire version, returns the message and its version, raises ValueError if malformed """
+    if len(data) == 0 or data[0] != BINARY_MARKER:
+        try:
+            return json.loads(data.decode()), WIRE_FORMAT_JSON
+        except UnicodeDecodeError as e:
+            raise ValueError(f"Message is not valid JSON - {e}")
+
+    version = data[1] if len(data) > 1 else None
+
+    if version not in SUPPORTED_WIRE_VERSIONS:
+        raise ValueError(f"Unsupported wire version {version}")
+
+    try:
+        message, offset = decode_value(data, 2, [])
+    except (IndexError, struct.error, UnicodeDecodeError):
+        raise ValueError("Message is truncated or malformed")
+
+    if offset != len(data):
+        raise ValueError("Message contains trailing data")
+
+    if type(message) != dict:
+        raise ValueError("Message is not a dictionary")
+
+    return message, version
+
+def build_compression_dictionary(samples : list[bytes]) -> bytes:
+    """
+    Preset zlib dictionary from typical encoded messages. Matches closer to the end of the dictionary are
+    cheaper, so samples should go from the least to the most common content.
+    """
+    return b''.join(samples)[-COMPRESSION_DICTIONARY_SIZE:]
+
+compression_dictionaries = {}   # version -> dictionary, loaded on first use
+
+def get_compression_dictionary(version : int) -> bytes:
+    """ Committed dictionary of the given version, raises ValueError if it is not supported """
+    if version not in COMPRESSION_DICTIONARY_VERSIONS:
+        raise ValueError(f"Unsupported compression dictionary version {version}")
+
+    if version not in compression_dictionaries:
+        with open(os.path.join(COMPRESSION_DICTIONARY_FOLDER, f"dictionary_v{version}.bin"), 'rb') as file:
+            compression_dictionaries[version] = file.read()
+
+    return compression_dictionaries[version]
+
+def negotiate_compression(local_versions : list[int], remote_versions : list[int]) -> int:
+    """ Highest dictionary version known to both sides, NO_COMPRESSION if there is none """
+    common_versions = set(local_versions) & set(version for version in remote_versions if type(version) == int)
+
+    return max(common_versions) if len(common_versions) > 0 else NO_COMPRESSION
+
+def compress_message(data : bytes, version : int, level : int) -> bytes:
+    """ Compress an encoded message, the receiver needs the dictionary of the same version to decompress it """
+    compressor = zlib.compressobj(level, zdict=get_compression_dictionary(version))
+
+    return bytes([COMPRESSED_MARKER, version]) + compressor.compress(data) + compressor.flush()
+
+def decompress_message(data : bytes) -> tuple[bytes, int]:
+    """
+    Returns the encoded message and the version of the dictionary it was compressed with, NO_COMPRESSION
+    if it was not compressed. Raises ValueError if it cannot be decompressed.
+    """
+    if len(data) == 0 or data[0] != COMPRESSED_MARKER:
+        return data, NO_COMPRESSION
+
+    if len(data) < 2:
+        raise ValueError("Compressed message is truncated")
+
+    version = data[1]
+    decompressor = zlib.decompressobj(zdict=get_compression_dictionary(version))
+
+    try:
+        decompressed_data = decompressor.decompress(data[2:], MAX_DECOMPRESSED_SIZE)
+    except zlib.error as e:
+        raise ValueError(f"Message cannot be decompressed - {e}")
+
+    if len(decompressor.unconsumed_tail) > 0:
+        raise ValueError(f"Decompressed message exceeds {MAX_DECOMPRESSED_SIZE} bytes")
+
+    if not decompressor.eof:
+        raise ValueError("Compressed message is truncated")
+
+    return decompressed_data, version
+
+def encode_varint(value : int, data : bytearray) -> None:
+    while value >= 0x80:
+        data.append((value & 0x7f) | 0x80)
+        value >>= 7
+
+    data.append(value)
+
+def decode_varint(data : bytes, offset : int) -> tuple[int, int]:
+    value = 0
+    shift = 0
+
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+
+        if byte < 0x80:
+            return value, offset
+
+        shift += 7
+
+def encode_bytes(tag : int, value : bytes, data : bytearray) -> None:
+    data.append(tag)
+    encode_varint(len(value), data)
+    data += value
+
+def encode_str(value : str, data : bytearray) -> None:
+    # hex and base64 strings are restored exactly, so the receiver gets the same strings as with JSON
+    if HEX_PATTERN.fullmatch(value):
+        encode_bytes(TAG_HEX, bytes.fromhex(value), data)
+        return
+
+    if len(value) >= BASE64_MIN_LENGTH and len(value) % 4 == 0:
+        try:
+            raw = base64.b64decode(value, validate=True)
+
+            if base64.b64encode(raw).decode() == value:
+                encode_bytes(TAG_BASE64, raw, data)
+                return
+        except ValueError:
+            pass
+
+    encode_bytes(TAG_STR, value.encode(), data)
+
+def encode_key(key : str, data : bytearray, keys : dict) -> None:
+    """ Keys of dictionaries are sent once per message, repeated keys refer to the first occurrence """
+    if type(key) != str:
+        raise TypeError("Only string keys are permitted")
+
+    if key in keys:
+        encode_varint(keys[key] << 1 | 1, data)
+    else:
+        encoded_key = key.encode()
+        keys[key] = len(keys)
+        encode_varint(len(encoded_key) << 1, data)
+        data += encoded_key
+
+def encode_value(value, data : bytearray, keys : dict, version : int = WIRE_VERSION) -> None:
+    value_type = type(value)
+
+    # most values of encoded transactions are strings
+    if value_type == str:
+        encode_str(value, data)
+    elif value is None:
+        data.append(TAG_NONE)
+    elif value is True:
+        data.append(TAG_TRUE)
+    elif value is False:
+        data.append(TAG_FALSE)
+    elif value_type == int:
+        data.append(TAG_INT if value >= 0 else TAG_NEGATIVE_INT)
+        encode_varint(abs(value), data)
+    elif value_type == float:
+        data.append(TAG_FLOAT)
+        data += struct.pack('>d', value)
+    elif value_type in [list, tuple]:
+        if version >= 3 and len(value) > 0 and encode_record_list(value, data):
+            return
+
+        data.append(TAG_LIST)
+        encode_varint(len(value), data)
+
+        for item in value:
+            encode_value(item, data, keys, version)
+    elif value_type == dict:
+        if version >= 3 and encode_record(value, data):
+            return
+
+        data.append(TAG_DICT)
+        encode_varint(len(value), data)
+
+        for key, item in value.items():
+            encode_key(key, data, keys)
+            encode_value(item, data, keys, version)
+    else:
+        raise TypeError(f"Type {type(value).__name__} cannot be sent over the wire")
+
+def encode_record(value : dict, data : bytearray) -> bool:
+    """ Encode a dictionary in its fixed layout, returns False if it has none """
+    layout = record_layouts_by_keys.get(tuple(value))
+
+    if layout is None:
+        return False
+
+    packed = layout.pack(value)
+
+    if packed is None:
+        return False
+
+    data.append(TAG_RECORD)
+    data.append(layout.get_index())
+    data += packed
+
+    return True
+
+def encode_record_list(value : list, data : bytearray) -> bool:
+    """ Encode a list of dictionaries sharing a fixed layout, returns False if any of them does not fit it """
+    first_item = value[0]
+
+    if type(first_item) != dict:
+        return False
+
+    layout = record_layouts_by_keys.get(tuple(first_item))
+
+    if layout is None:
+        return False
+
+    records = []
+    keys = layout.get_keys()
+
+    for item in value:
+        if type(item) != dict or tuple(item) != keys:
+            return False
+
+        packed = layout.pack(item)
+
+        if packed is None:
+            return False
+
+        records.append(packed)
+
+    data.append(TAG_RECORD_LIST)
+    data.append(layout.get_index())
+    encode_varint(len(records), data)
+    data += b''.join(records)
+
+    return True
+
+def decode_value(data : bytes, offset : int, keys : list):
+    tag = data[offset]
+    offset += 1
+
+    if tag == TAG_NONE:
+        return None, offset
+
+    if tag == TAG_TRUE:
+        return True, offset
+
+    if tag == TAG_FALSE:
+        return False, offset
+
+    if tag == TAG_INT or tag == TAG_NEGATIVE_INT:
+        value, offset = decode_varint(data, offset)
+        return (value if tag == TAG_INT else -value), offset
+
+    if tag == TAG_FLOAT:
+        return struct.unpack_from('>d', data, offset)[0], offset + 8
+
+    if tag in [TAG_STR, TAG_HEX, TAG_BASE64]:
+        length, offset = decode_varint(data, offset)
+
+        if offset + length > len(data):
+            raise IndexError("String exceeds the message")
+
+        raw = data[offset:offset + length]
+
+        if tag == TAG_STR:
+            return raw.decode(), offset + length
+
+        if tag == TAG_HEX:
+            return raw.hex(), offset + length
+
+        return base64.b64encode(raw).decode(), offset + length
+
+    if tag == TAG_EMBEDDED:
+        length, offset = decode_varint(data, offset)
+        value, end = decode_value(data, offset, [])
+
+        if end != offset + length:
+            raise ValueError("Embedded value does not match its length")
+
+        return value, end
+
+    if tag == TAG_RECORD or tag == TAG_RECORD_LIST:
+        layout = record_layouts[data[offset]]
+        offset += 1
+
+        if tag == TAG_RECORD:
+            return layout.unpack(data, offset, 1)[0], offset + layout.get_size()
+
+        count, offset = decode_varint(data, offset)
+
+        return layout.unpack(data, offset, count), offset + layout.get_size() * count
+
+    if tag == TAG_LIST:
+        count, offset = decode_varint(data, offset)
+        items = []
+
+        for _ in range(count):
+            item, offset = decode_value(data, offset, keys)
+            items.append(item)
+
+        return items, offset
+
+    if tag == TAG_DICT:
+        count, offset = decode_varint(data, offset)
+        obj = {}
+
+        for _ in range(count):
+            key_header, offset = decode_varint(data, offset)
+
+            if key_header & 1:
+                key = keys[key_header >> 1]
+            else:
+                length = key_header >> 1
+                key = data[offset:offset + length].decode()
+                offset += length
+                keys.append(key)
+
+            obj[key], offset = decode_value(data, offset, keys)
+
+        return obj, offset
+
+    raise ValueError(f"Unknown tag {tag}")